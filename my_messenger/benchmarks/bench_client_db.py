@@ -0,0 +1,64 @@
+"""
+Бенчмарк истории сообщений клиента.
+
+Заполняет базу ClientDatabase историей переписки с несколькими
+собеседниками и замеряет get_history одного из них при разном объёме
+истории. Запуск из каталога my_messenger:
+
+    python -m benchmarks.bench_client_db 10000 100000
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.append('../')
+from my_messenger.client.database import ClientDatabase
+
+DEFAULT_SIZES = (10000, 100000)
+
+# Собеседников в истории: get_history выбирает одного из них
+CONTACTS = 10
+
+
+def seed(database, start, stop):
+    """Функция добавления сообщений с номерами start..stop - 1."""
+    now = datetime.datetime.now()
+    with database.database_engine.begin() as connection:
+        connection.execute(
+            database.metadata.tables['message_history'].insert(), [
+                {'contact': f'contact{index % CONTACTS}',
+                 'direction': 'in' if index % 2 else 'out',
+                 'message': f'Сообщение {index}', 'date': now}
+                for index in range(start, stop)])
+
+
+def run(sizes=DEFAULT_SIZES):
+    """
+    Функция запуска замеров.
+    :return: словарь {'get_history@сообщений': микросекунд на вызов}.
+    """
+    name = f'bench{os.getpid()}'
+    database = ClientDatabase(name)
+    path = database.database_engine.url.database
+    results = {}
+    try:
+        seeded = 0
+        for size in sorted(sizes):
+            seed(database, seeded, size)
+            seeded = size
+            best = min(timeit.repeat(
+                lambda: database.get_history('contact1'), number=1,
+                repeat=3))
+            results[f'get_history@{size}'] = best * 1e6
+    finally:
+        database.session.close()
+        database.database_engine.dispose()
+        os.remove(path)
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    for label, usec in run(sizes).items():
+        print(f'{label:>25}: {usec:12.1f} мкс')
@@ -0,0 +1,49 @@
+"""
+Бенчмарк шифрования сообщений клиента.
+
+Повторяет операции ClientMainWindow: загрузка открытого ключа
+собеседника, шифрование текста PKCS1_OAEP с упаковкой в base64 и
+расшифровка входящего сообщения ключом 2048 бит. Запуск из каталога
+my_messenger:
+
+    python -m benchmarks.bench_crypto
+"""
+import base64
+import sys
+import timeit
+
+from Cryptodome.Cipher import PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+
+sys.path.append('../')
+
+TEXT = 'Привет! Это сообщение для замера шифрования.'
+
+
+def run(number=200, bits=2048):
+    """
+    Функция запуска замеров.
+    :return: словарь {операция: микросекунд на вызов}.
+    """
+    keys = RSA.generate(bits)
+    public_key = keys.publickey().export_key()
+    encryptor = PKCS1_OAEP.new(RSA.import_key(public_key))
+    decrypter = PKCS1_OAEP.new(keys)
+    encrypted = base64.b64encode(
+        encryptor.encrypt(TEXT.encode('utf8'))).decode('ascii')
+
+    operations = {
+        'import_key': lambda: PKCS1_OAEP.new(RSA.import_key(public_key)),
+        'encrypt': lambda: base64.b64encode(
+            encryptor.encrypt(TEXT.encode('utf8'))).decode('ascii'),
+        'decrypt': lambda: decrypter.decrypt(
+            base64.b64decode(encrypted)).decode('utf8'),
+    }
+    return {label: min(timeit.repeat(func, number=number, repeat=3))
+            / number * 1e6
+            for label, func in operations.items()}
+
+
+if __name__ == '__main__':
+    for label, usec in run().items():
+        print(f'{label:>12}: {usec:10.1f} мкс')
@@ -0,0 +1,128 @@
+"""
+Микробенчмарк разбора действий протокола.
+
+Сравнивает стоимость выбора обработчика и проверки полей сообщения:
+прежняя цепочка if/elif из process_client_message (воспроизведена ниже
+без обработчиков) и реестр ActionRegistry. Запуск из каталога
+my_messenger:
+
+    python -m benchmarks.bench_dispatch
+"""
+import sys
+import timeit
+
+sys.path.append('../')
+from my_messenger.common.utils import get_configs
+from my_messenger.server.core import MessageProcessor
+
+CONFIGS = get_configs()
+
+USERNAME = 'alice'
+
+MESSAGES = [
+    {CONFIGS.ACTION: CONFIGS.MESSAGE,
+     CONFIGS.TIME: 1.0,
+     CONFIGS.FROM_USER: USERNAME,
+     CONFIGS.TO_USER: 'bob',
+     CONFIGS.MESSAGE_TEXT: 'text'},
+    {CONFIGS.ACTION: CONFIGS.GET_CONTACTS,
+     CONFIGS.TIME: 1.0,
+     CONFIGS.USER: USERNAME},
+    {CONFIGS.ACTION: CONFIGS.USERS_REQUEST,
+     CONFIGS.TIME: 1.0,
+     CONFIGS.ACCOUNT_NAME: USERNAME},
+    {CONFIGS.ACTION: CONFIGS.PUBLIC_KEY_REQUEST,
+     CONFIGS.TIME: 1.0,
+     CONFIGS.ACCOUNT_NAME: 'bob'},
+]
+
+
+def legacy_dispatch(message, client, names):
+    """Цепочка условий process_client_message до перехода на реестр."""
+    if CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == CONFIGS.PRESENCE and \
+            CONFIGS.TIME in message and \
+            CONFIGS.USER in message:
+        return 'presence'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == CONFIGS.MESSAGE and \
+            CONFIGS.TO_USER in message and \
+            CONFIGS.TIME in message and \
+            CONFIGS.FROM_USER in message and \
+            CONFIGS.MESSAGE_TEXT in message and \
+            names[message[CONFIGS.FROM_USER]] == client:
+        return 'message'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == CONFIGS.EXIT and \
+            CONFIGS.ACCOUNT_NAME in message and \
+            names[message[CONFIGS.ACCOUNT_NAME]] == client:
+        return 'exit'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == CONFIGS.GET_CONTACTS \
+            and CONFIGS.USER in message and \
+            names[message[CONFIGS.USER]] == client:
+        return 'get_contacts'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == CONFIGS.ADD_CONTACT \
+            and CONFIGS.ACCOUNT_NAME in message and \
+            CONFIGS.USER in message and \
+            names[message[CONFIGS.USER]] == client:
+        return 'add'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == \
+            CONFIGS.REMOVE_CONTACT and \
+            CONFIGS.ACCOUNT_NAME in message and \
+            CONFIGS.USER in message and \
+            names[message[CONFIGS.USER]] == client:
+        return 'remove'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == CONFIGS.USERS_REQUEST\
+            and CONFIGS.ACCOUNT_NAME in message and \
+            names[message[CONFIGS.ACCOUNT_NAME]] == client:
+        return 'get_users'
+    elif CONFIGS.ACTION in message and \
+            message[CONFIGS.ACTION] == \
+            CONFIGS.PUBLIC_KEY_REQUEST and \
+            CONFIGS.ACCOUNT_NAME in message:
+        return 'pubkey'
+    return None
+
+
+def registry_dispatch(message, username, actions=MessageProcessor.actions):
+    """Выбор действия через реестр: одно обращение к словарю и схема."""
+    action = actions.get(message.get(CONFIGS.ACTION))
+    if action is None or not action.accepts(message, username):
+        return None
+    return action.name
+
+
+def run(number=100000):
+    """
+    Функция запуска замеров.
+    :return: словарь {вариант: микросекунд на сообщение}.
+    """
+    client = object()
+    names = {USERNAME: client}
+    results = {}
+    for label, func, args in (
+            ('if/elif chain', legacy_dispatch, (client, names)),
+            ('registry', registry_dispatch, (USERNAME,))):
+        def loop():
+            for message in MESSAGES:
+                func(message, *args)
+        best = min(timeit.repeat(loop, number=number // len(MESSAGES),
+                                 repeat=5))
+        results[label] = best / number * 1e6
+    # Реестр по отдельным действиям
+    for message in MESSAGES:
+        best = min(timeit.repeat(
+            lambda: registry_dispatch(message, USERNAME),
+            number=number // len(MESSAGES), repeat=5))
+        results[f'registry {message[CONFIGS.ACTION]}'] = \
+            best / (number // len(MESSAGES)) * 1e6
+    return results
+
+
+if __name__ == '__main__':
+    for label, usec in run().items():
+        print(f'{label:>25}: {usec:.3f} мкс/сообщение')
@@ -0,0 +1,76 @@
+"""
+Микробенчмарк кодирования и разбора сообщений протокола.
+
+Замеряет encode_message, разбор кадра FrameDecoder и полный путь
+send_message -> get_message через пару сокетов для короткого сообщения
+и сообщения с шифрованным текстом (base64 шифротекста RSA 2048).
+Запуск из каталога my_messenger:
+
+    python -m benchmarks.bench_protocol
+"""
+import socket
+import sys
+import timeit
+
+sys.path.append('../')
+from my_messenger.common.framing import FrameDecoder, encode_message
+from my_messenger.common.utils import get_configs, send_message, get_message
+
+CONFIGS = get_configs()
+
+MESSAGES = {
+    'short': {
+        CONFIGS.ACTION: CONFIGS.MESSAGE,
+        CONFIGS.TIME: 1.0,
+        CONFIGS.FROM_USER: 'alice',
+        CONFIGS.TO_USER: 'bob',
+        CONFIGS.MESSAGE_TEXT: 'Привет!'
+    },
+    'encrypted': {
+        CONFIGS.ACTION: CONFIGS.MESSAGE,
+        CONFIGS.TIME: 1.0,
+        CONFIGS.FROM_USER: 'alice',
+        CONFIGS.TO_USER: 'bob',
+        # Длина base64 шифротекста PKCS1_OAEP ключом 2048 бит
+        CONFIGS.MESSAGE_TEXT: 'A' * 344
+    },
+}
+
+
+def run(number=20000):
+    """
+    Функция запуска замеров.
+    :return: словарь {вариант: микросекунд на сообщение}.
+    """
+    encoding = CONFIGS.ENCODING
+    results = {}
+    left, right = socket.socketpair()
+    try:
+        for name, message in MESSAGES.items():
+            frame = encode_message(message, encoding)
+            decoder = FrameDecoder(CONFIGS.MAX_PACKAGE_LENGTH,
+                                   CONFIGS.MAX_FRAME_LENGTH)
+
+            def decode():
+                decoder.feed(frame)
+                for _ in decoder.messages(encoding):
+                    pass
+
+            def roundtrip():
+                send_message(left, message, CONFIGS)
+                get_message(right, CONFIGS)
+
+            for label, func in (('encode', lambda: encode_message(
+                    message, encoding)), ('decode', decode),
+                    ('send+get', roundtrip)):
+                best = min(timeit.repeat(func, number=number, repeat=5))
+                results[f'{label} {name}'] = best / number * 1e6
+    finally:
+        left.close()
+        right.close()
+    return results
+
+
+if __name__ == '__main__':
+    for label, usec in run().items():
+        print(f'{label:>20}: {usec:.3f} мкс/сообщение')
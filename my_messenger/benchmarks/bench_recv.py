@@ -0,0 +1,106 @@
+"""
+Бенчмарк пути приёма сообщений сервером.
+
+Сравнивает память, которую занимает приём, для трёх вариантов:
+прежний get_message (recv(MAX_PACKAGE_LENGTH) -> bytes -> str -> JSON,
+воспроизведён ниже), FrameDecoder с собственным буфером у каждого
+соединения и FrameDecoder с буферами из общего пула BufferPool.
+Замеры делает tracemalloc:
+
+* удержано на соединение - сколько памяти остаётся занятой у
+  простаивающего соединения, принявшего одно сообщение;
+* пик на сообщение - сколько памяти выделяется сверх уже занятой при
+  приёме и разборе одного сообщения.
+
+Запуск из каталога my_messenger:
+
+    python -m benchmarks.bench_recv
+"""
+import json
+import socket
+import sys
+import tracemalloc
+
+sys.path.append('../')
+from my_messenger.common.framing import BufferPool, FrameDecoder, \
+    encode_message
+from my_messenger.common.utils import get_configs
+
+CONFIGS = get_configs()
+
+MESSAGE = {
+    CONFIGS.ACTION: CONFIGS.MESSAGE,
+    CONFIGS.TIME: 1.0,
+    CONFIGS.FROM_USER: 'alice',
+    CONFIGS.TO_USER: 'bob',
+    CONFIGS.MESSAGE_TEXT: 'x' * 200
+}
+
+
+def legacy_receive(sock, state):
+    """Приём как в прежнем get_message: новый bytes на каждый recv."""
+    data = sock.recv(CONFIGS.MAX_PACKAGE_LENGTH)
+    return json.loads(data.decode(CONFIGS.ENCODING))
+
+
+def decoder_receive(sock, decoder):
+    """Приём через recv_into в буфер декодера и разбор memoryview."""
+    decoder.recv_from(sock)
+    # Как и сервер, разбираем всё принятое до конца
+    return list(decoder.messages(CONFIGS.ENCODING))
+
+
+def run(connections=1000, number=20000):
+    """
+    Функция запуска замеров.
+    :return: словарь {вариант: (байт удержано на соединение,
+    байт пика на сообщение)}.
+    """
+    pairs = [socket.socketpair() for _ in range(connections)]
+    frame = encode_message(MESSAGE, CONFIGS.ENCODING)
+    payload = json.dumps(MESSAGE).encode(CONFIGS.ENCODING)
+    pool = BufferPool(CONFIGS.MAX_PACKAGE_LENGTH, connections)
+    variants = (
+        ('recv + decode', legacy_receive, payload,
+         lambda: None),
+        ('FrameDecoder', decoder_receive, frame,
+         lambda: FrameDecoder(CONFIGS.MAX_PACKAGE_LENGTH,
+                              CONFIGS.MAX_FRAME_LENGTH)),
+        ('FrameDecoder + пул', decoder_receive, frame,
+         lambda: FrameDecoder(CONFIGS.MAX_PACKAGE_LENGTH,
+                              CONFIGS.MAX_FRAME_LENGTH, pool)))
+    results = {}
+    try:
+        for label, receive, data, new_state in variants:
+            tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+            states = []
+            for left, right in pairs:
+                state = new_state()
+                left.sendall(data)
+                receive(right, state)
+                states.append(state)
+            retained = (tracemalloc.get_traced_memory()[0] - base) \
+                / connections
+
+            peak_total = 0
+            for index in range(number):
+                left, right = pairs[index % connections]
+                left.sendall(data)
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                receive(right, states[index % connections])
+                peak_total += tracemalloc.get_traced_memory()[1] - current
+            tracemalloc.stop()
+            results[label] = (retained, peak_total / number)
+    finally:
+        for left, right in pairs:
+            left.close()
+            right.close()
+    return results
+
+
+if __name__ == '__main__':
+    for label, (retained, peak) in run().items():
+        print(f'{label:>20}: {retained:9.0f} байт на соединение, '
+              f'{peak:9.0f} байт пика на сообщение')
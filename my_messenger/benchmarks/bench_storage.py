@@ -0,0 +1,176 @@
+"""
+Бенчмарк методов ServerStorage на базах разного размера.
+
+База наполняется пользователями пачками (executemany, минуя ORM) до
+каждого из размеров sizes, после чего замеряются методы чтения
+(микросекунд на вызов) и методы записи через поток записи (микросекунд
+на операцию: серия операций ставится в очередь и дожидается записи).
+ServerStorage создаётся в процессе один раз, поэтому размеры идут по
+возрастанию в одной базе. Запуск из каталога my_messenger:
+
+    python -m benchmarks.bench_storage 10000 100000 1000000
+"""
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.append('../')
+from my_messenger.server.database import ServerStorage
+
+DEFAULT_SIZES = (10000, 100000)
+
+# Контактов у каждого пользователя и размер пачки вставки
+CONTACTS = 3
+CHUNK = 10000
+
+
+def seed(database, start, stop):
+    """Функция добавления пользователей с номерами start..stop - 1."""
+    tables = database.metadata.tables
+    now = datetime.datetime.now()
+    with database.database_engine.begin() as connection:
+        for chunk in range(start, stop, CHUNK):
+            ids = range(chunk + 1, min(chunk + CHUNK, stop) + 1)
+            connection.execute(tables['Users'].insert(), [
+                {'id': user_id, 'name': f'user{user_id}', 'last_login': now,
+                 'passwd_hash': 'ab' * 64, 'pubkey': f'KEY{user_id}'}
+                for user_id in ids])
+            connection.execute(tables['History'].insert(), [
+                {'user': user_id, 'sent': 0, 'accepted': 0}
+                for user_id in ids])
+            connection.execute(tables['Contacts'].insert(), [
+                {'user': user_id, 'contact': user_id - shift}
+                for user_id in ids for shift in range(1, CONTACTS + 1)
+                if user_id > shift])
+
+
+def measure(func, number, repeat=3):
+    """Функция замера: микросекунд на вызов, лучший из repeat."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) \
+        / number * 1e6
+
+
+def measure_writes(database, submit, number):
+    """
+    Функция замера записи: number операций submit(index) в очередь и
+    ожидание их записи. :return: микросекунд на операцию.
+    """
+    def batch():
+        for index in range(number):
+            submit(index)
+        database.flush()
+    return measure(batch, 1) / number
+
+
+def bench_size(database, size, counter):
+    """Функция замеров всех методов на базе из size пользователей."""
+    probe = f'user{size}'
+    other = f'user{size - 1}'
+    database.users.clear()
+    # История входов, недоставленные сообщения и группа пробного
+    # пользователя
+    database.user_login(probe, '127.0.0.1', 7777, 'KEY')
+    database.user_logout(probe)
+    for index in range(20):
+        database.store_offline(probe, '{"mess_text": "x"}')
+    group = f'group{size}'
+    database.create_group(group, probe, 'GROUPKEY')
+    database.flush()
+    database.users.clear()
+
+    def uncached(func, name):
+        database.users.clear()
+        return func(name)
+
+    results = {
+        'get_hash': measure(lambda: database.get_hash(probe), 200),
+        'get_pubkey': measure(lambda: database.get_pubkey(other), 200),
+        'check_user': measure(lambda: database.check_user(probe), 200),
+        'get_hash (uncached)': measure(
+            lambda: uncached(database.get_hash, probe), 200),
+        'check_user (unknown)': measure(
+            lambda: database.check_user('nobody'), 200),
+        'get_contacts': measure(lambda: database.get_contacts(probe), 20),
+        'login_history': measure(
+            lambda: database.login_history(probe), 20),
+        'get_offline': measure(lambda: database.get_offline(probe), 100),
+        'get_group_key': measure(
+            lambda: database.get_group_key(group, probe), 200),
+        'groups_list': measure(database.groups_list, 100),
+        'group_members': measure(database.group_members, 100),
+        'active_users_list': measure(database.active_users_list, 100),
+        'users_list': measure(database.users_list, 1, 1),
+        'message_history': measure(database.message_history, 1, 1),
+    }
+
+    def login_logout(index):
+        name = f'user{index + 1}'
+        database.user_login(name, '127.0.0.1', 7777, f'KEY{index + 1}')
+        database.user_logout(name)
+
+    def contact_pair(index):
+        database.add_contact(probe, f'user{index + 1}')
+        database.remove_contact(probe, f'user{index + 1}')
+
+    def membership(index):
+        database.add_group_member(group, f'user{index + 1}')
+        database.remove_group_member(group, f'user{index + 1}')
+
+    def new_user(index):
+        name = f'new{next(counter)}'
+        database.add_user(name, 'ab' * 64)
+        database.remove_user(name)
+
+    results.update({
+        'user_login+logout': measure_writes(database, login_logout, 200),
+        'process_message': measure_writes(
+            database, lambda index: database.process_message(probe, other),
+            500),
+        'add+remove_contact': measure_writes(database, contact_pair, 200),
+        'store_offline': measure_writes(
+            database, lambda index: database.store_offline(
+                other, '{"mess_text": "x"}'), 200),
+        'delete_offline': measure_writes(
+            database, lambda index: database.delete_offline(other, 10 ** 9),
+            100),
+        'add+remove_group_member': measure_writes(database, membership, 200),
+        'set_group_key': measure_writes(
+            database, lambda index: database.set_group_key(
+                group, probe, f'KEY{index}'), 200),
+        'create_group': measure_writes(
+            database, lambda index: database.create_group(
+                f'g{size}_{next(counter)}', probe), 100),
+        'add+remove_user': measure_writes(database, new_user, 10),
+    })
+    return results
+
+
+def run(sizes=DEFAULT_SIZES):
+    """
+    Функция запуска замеров.
+    :return: словарь {'метод@размер': микросекунд на вызов}.
+    """
+    directory = tempfile.mkdtemp(prefix='bench-storage-')
+    database = ServerStorage(os.path.join(directory, 'bench.db3'))
+    counter = iter(range(10 ** 9))
+    results = {}
+    try:
+        seeded = 0
+        for size in sorted(sizes):
+            seed(database, seeded, size + 1)
+            seeded = size + 1
+            for name, usec in bench_size(database, size, counter).items():
+                results[f'{name}@{size}'] = usec
+    finally:
+        database.close()
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    for label, usec in run(sizes).items():
+        print(f'{label:>35}: {usec:12.1f} мкс')
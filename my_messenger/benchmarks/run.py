@@ -0,0 +1,180 @@
+"""
+Запуск набора бенчмарков с сохранением результатов в JSON и сравнением
+с базовой линией.
+
+Каждый бенчмарк - модуль с функцией run(), возвращающей словарь
+{вариант: значение}; все значения - "меньше значит лучше" (микросекунды
+или байты). Результаты сохраняются как {'имя.вариант': значение}, и если
+задан файл базовой линии, каждое значение сравнивается с ним: рост больше
+чем на threshold считается регрессией, и запуск завершается с кодом 1.
+Запуск из каталога my_messenger:
+
+    python -m benchmarks.run -o results.json
+    python -m benchmarks.run --suites protocol,crypto --save_baseline
+    python -m benchmarks.run --sizes 10000,100000,1000000
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.append('../')
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Имя набора -> (модуль, единицы значений, принимает ли размеры баз)
+SUITES = {
+    'protocol': ('benchmarks.bench_protocol', ('us',), False),
+    'dispatch': ('benchmarks.bench_dispatch', ('us',), False),
+    'recv': ('benchmarks.bench_recv', ('retained_bytes', 'peak_bytes'),
+             False),
+    'crypto': ('benchmarks.bench_crypto', ('us',), False),
+    'client_db': ('benchmarks.bench_client_db', ('us',), True),
+    'storage': ('benchmarks.bench_storage', ('us',), True),
+}
+
+
+def calibrate():
+    """
+    Функция замера скорости машины: микросекунд на эталонную работу
+    (кодирование и разбор JSON, операции со словарями). Времена делятся
+    на неё при сравнении, поэтому общее замедление машины (другой
+    компьютер, соседняя нагрузка) не выглядит как регрессия.
+    """
+    message = {'action': 'message', 'time': 1.0, 'from': 'alice',
+               'to': 'bob', 'mess_text': 'x' * 100}
+
+    def work():
+        json.loads(json.dumps(message))
+        {key: value for key, value in message.items() if key != 'time'}
+
+    return min(timeit.repeat(work, number=20000, repeat=5)) / 20000 * 1e6
+
+
+def run_suites(names, sizes=None):
+    """
+    Функция запуска наборов.
+    :return: словарь {'набор.вариант[.единица]': {'value', 'unit'}}.
+    """
+    results = {}
+    for name in names:
+        module_name, units, sized = SUITES[name]
+        print(f'Набор {name}...', file=sys.stderr)
+        module = importlib.import_module(module_name)
+        values = module.run(sizes) if sized and sizes else module.run()
+        for label, value in values.items():
+            if not isinstance(value, tuple):
+                value = (value,)
+            for unit, item in zip(units, value):
+                key = f'{name}.{label}'
+                if len(units) > 1:
+                    key = f'{key}.{unit}'
+                results[key] = {'value': round(item, 3), 'unit': unit}
+    return results
+
+
+def compare(results, baseline, threshold, speed=1.0):
+    """
+    Функция сравнения с базовой линией.
+    :param speed: во сколько раз эталонная работа сейчас медленнее,
+    чем при записи базовой линии. Времена делятся на него, только если
+    машина медленнее: "ускорение" эталона на шумной машине чаще всего
+    случайно и давало бы ложные регрессии. Байты не делятся.
+    :return: список кортежей (имя, было, стало, отношение) для
+    значений, выросших больше чем на threshold.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base or not base['value']:
+            continue
+        ratio = result['value'] / base['value']
+        if result['unit'] == 'us':
+            ratio /= max(speed, 1.0)
+        if ratio > 1 + threshold:
+            regressions.append((key, base['value'], result['value'], ratio))
+    return regressions
+
+
+def arg_parser(argv=None):
+    """Парсер аргументов командной строки."""
+    parser = argparse.ArgumentParser(description='messenger benchmarks')
+    parser.add_argument('--suites', type=str, default=','.join(SUITES),
+                        help='comma separated: ' + ', '.join(SUITES))
+    parser.add_argument('--sizes', type=str, default=None,
+                        help='database sizes, e.g. 10000,100000,1000000')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='write results to this JSON file')
+    parser.add_argument('-b', '--baseline', type=str, default=BASELINE,
+                        help='baseline JSON file to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=0.25,
+                        help='allowed slowdown, 0.25 = 25%%')
+    parser.add_argument('--save_baseline', action='store_true',
+                        help='store results as the new baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Основная функция: запуск, сохранение, сравнение."""
+    args = arg_parser(argv)
+    names = [name.strip() for name in args.suites.split(',') if name]
+    unknown = set(names) - set(SUITES)
+    if unknown:
+        sys.exit(f'Неизвестные наборы: {", ".join(sorted(unknown))}')
+    sizes = [int(size) for size in args.sizes.split(',')] \
+        if args.sizes else None
+
+    calibration = calibrate()
+    results = run_suites(names, sizes)
+    # Эталон замеряем до и после: берём лучшее из двух
+    calibration = min(calibration, calibrate())
+    document = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'calibration_us': round(calibration, 3),
+        'results': results
+    }
+    for key, result in results.items():
+        print(f'{key:>55}: {result["value"]:14.3f} {result["unit"]}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(document, output, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        # Новые значения дополняют базовую линию, остальные сохраняются
+        baseline = {'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update({key: value for key, value in document.items()
+                         if key != 'results'})
+        baseline['results'].update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, ensure_ascii=False)
+        print(f'Базовая линия сохранена: {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('Базовой линии нет, сравнение пропущено.')
+        return 0
+    with open(args.baseline, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    speed = calibration / baseline.get('calibration_us', calibration)
+    print(f'Скорость машины относительно базовой линии: x{1 / speed:.2f}')
+    regressions = compare(
+        results, baseline['results'], args.threshold, speed)
+    for key, before, after, ratio in regressions:
+        print(f'РЕГРЕССИЯ {key}: {before} -> {after} (x{ratio:.2f})')
+    if regressions:
+        return 1
+    print(f'Регрессий нет (порог {args.threshold:.0%}).')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
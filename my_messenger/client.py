@@ -31,14 +31,14 @@ def arg_parser():
         'addr',
         type=str,
         nargs='?',
-        default=CONFIGS.get('DEFAULT_IP_ADDRESS'),
+        default=CONFIGS.DEFAULT_IP_ADDRESS,
         help='server ip address'
     )
     parser.add_argument(
         'port',
         type=int,
         nargs='?',
-        default=CONFIGS.get('DEFAULT_PORT'),
+        default=CONFIGS.DEFAULT_PORT,
         help='port'
     )
     parser.add_argument(
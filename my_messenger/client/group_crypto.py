@@ -0,0 +1,60 @@
+"""
+Шифрование сообщений групповых чатов.
+
+Сообщения группы шифруются общим симметричным ключом (AES-GCM), поэтому
+сервер рассылает всем участникам один и тот же шифротекст. Сам ключ
+группы передаётся каждому участнику зашифрованным его открытым ключом
+RSA (PKCS1_OAEP, как и личные сообщения), сервер хранит только такие
+зашифрованные копии.
+"""
+import base64
+
+from Cryptodome.Cipher import AES, PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+from Cryptodome.Random import get_random_bytes
+
+GROUP_KEY_SIZE = 32
+NONCE_SIZE = 16
+TAG_SIZE = 16
+
+
+def new_group_key():
+    """Функция создания нового ключа группы."""
+    return get_random_bytes(GROUP_KEY_SIZE)
+
+
+def wrap_key(group_key, public_key):
+    """
+    Функция шифрования ключа группы открытым ключом участника.
+    :param public_key: открытый ключ в формате PEM (как его отдаёт сервер).
+    :return: строка base64.
+    """
+    encryptor = PKCS1_OAEP.new(RSA.import_key(public_key))
+    return base64.b64encode(encryptor.encrypt(group_key)).decode('ascii')
+
+
+def unwrap_key(wrapped, private_key):
+    """Функция расшифровки ключа группы своим закрытым ключом."""
+    decrypter = PKCS1_OAEP.new(private_key)
+    return decrypter.decrypt(base64.b64decode(wrapped))
+
+
+def encrypt_message(group_key, text):
+    """Функция шифрования текста сообщения группы, возвращает base64."""
+    cipher = AES.new(group_key, AES.MODE_GCM, nonce=get_random_bytes(
+        NONCE_SIZE))
+    encrypted, tag = cipher.encrypt_and_digest(text.encode('utf8'))
+    return base64.b64encode(cipher.nonce + tag + encrypted).decode('ascii')
+
+
+def decrypt_message(group_key, data):
+    """
+    Функция расшифровки текста сообщения группы.
+    При неверном ключе или повреждённых данных - ValueError.
+    """
+    raw = base64.b64decode(data)
+    nonce = raw[:NONCE_SIZE]
+    tag = raw[NONCE_SIZE:NONCE_SIZE + TAG_SIZE]
+    cipher = AES.new(group_key, AES.MODE_GCM, nonce=nonce)
+    return cipher.decrypt_and_verify(
+        raw[NONCE_SIZE + TAG_SIZE:], tag).decode('utf8')
@@ -307,7 +307,7 @@ class ClientMainWindow(QMainWindow):
         """
         # Получаем строку байтов
         encrypted_message = base64.b64decode(
-            message[CONFIGS.get('MESSAGE_TEXT')])
+            message[CONFIGS.MESSAGE_TEXT])
         # Декодируем строку, при ошибке выдаём сообщение и завершаем функцию
         try:
             decrypted_message = self.decrypter.decrypt(encrypted_message)
@@ -322,7 +322,7 @@ class ClientMainWindow(QMainWindow):
             'in',
             decrypted_message.decode('utf8'))
 
-        sender = message[CONFIGS.get('FROM_USER')]
+        sender = message[CONFIGS.FROM_USER]
 
         if sender == self.current_chat:
             self.history_list_update()
@@ -1,4 +1,5 @@
 import binascii
+import collections
 import hashlib
 import hmac
 import json
@@ -9,7 +10,8 @@ from PyQt5.QtCore import pyqtSignal, QObject
 
 from my_messenger.common.answers import RESPONSE_511
 from my_messenger.common.decorators import Log
-from my_messenger.common.errors import ServerError
+from my_messenger.common.errors import ServerError, \
+    IncorrectDataReceivedError
 from my_messenger.common.utils import get_configs, send_message, get_message
 from my_messenger.log.client_log_config import client_logger
 
@@ -27,6 +29,7 @@ class ClientTransport(threading.Thread, QObject):
     # Сигналы новое сообщение и потеря соединения
     new_message = pyqtSignal(dict)
     message_205 = pyqtSignal()
+    group_event = pyqtSignal(dict)
     connection_lost = pyqtSignal()
 
     def __init__(self, port, ip_address, database, username, passwd, keys):
@@ -49,6 +52,15 @@ class ClientTransport(threading.Thread, QObject):
         # Набор ключей для шифрования
         self.keys = keys
 
+        # Сообщения сервера, пришедшие во время ожидания ответа на запрос
+        # (например, накопленные за время отсутствия), обрабатываются
+        # основным циклом потока.
+        self.incoming = collections.deque()
+
+        # Версия справочника пользователей на сервере, с которой получен
+        # список пользователей (None - неизвестна).
+        self.directory_version = None
+
         # Устанавливаем соединение:
         self.connection_init(port, ip_address)
 
@@ -62,7 +74,7 @@ class ClientTransport(threading.Thread, QObject):
                 raise ServerError('Потеряно соединение с сервером!')
             client_logger.error(
                 'Timeout соединения при обновлении списков пользователей.')
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, IncorrectDataReceivedError):
             client_logger.critical(f'Потеряно соединение с сервером.')
             raise ServerError('Потеряно соединение с сервером!')
             # Флаг продолжения работы транспорта.
@@ -114,39 +126,40 @@ class ClientTransport(threading.Thread, QObject):
         # Авторизируемся на сервере
         with socket_lock:
             presense = {
-                CONFIGS.get('ACTION'): CONFIGS.get('PRESENCE'),
-                CONFIGS.get('TIME'): time.time(),
-                CONFIGS.get('USER'): {
-                    CONFIGS.get('ACCOUNT_NAME'): self.username,
-                    CONFIGS.get('PUBLIC_KEY'): pubkey
+                CONFIGS.ACTION: CONFIGS.PRESENCE,
+                CONFIGS.TIME: time.time(),
+                CONFIGS.USER: {
+                    CONFIGS.ACCOUNT_NAME: self.username,
+                    CONFIGS.PUBLIC_KEY: pubkey
                 }
             }
             client_logger.debug(f"Presence message = {presense}")
             # Отправляем серверу приветственное сообщение.
             try:
                 send_message(self.transport, presense, CONFIGS)
-                ans = get_message(self.transport, CONFIGS)
+                ans = self.get_response()
                 client_logger.debug(f'Server response = {ans}.')
                 # Если сервер вернул ошибку, бросаем исключение.
-                if CONFIGS.get('RESPONSE') in ans:
-                    if ans[CONFIGS.get('RESPONSE')] == 400:
-                        raise ServerError(ans[CONFIGS.get('ERROR')])
-                    elif ans[CONFIGS.get('RESPONSE')] == 511:
+                if CONFIGS.RESPONSE in ans:
+                    if ans[CONFIGS.RESPONSE] == 400:
+                        raise ServerError(ans[CONFIGS.ERROR])
+                    elif ans[CONFIGS.RESPONSE] == 511:
                         # Если всё нормально, то продолжаем процедуру
                         # авторизации.
-                        ans_data = ans[CONFIGS.get('DATA')]
+                        ans_data = ans[CONFIGS.DATA]
                         hash = hmac.new(
                             passwd_hash_string,
                             ans_data.encode('utf-8'),
                             'MD5')
                         digest = hash.digest()
                         my_ans = RESPONSE_511
-                        my_ans[CONFIGS.get('DATA')] = binascii.b2a_base64(
+                        my_ans[CONFIGS.DATA] = binascii.b2a_base64(
                             digest).decode('ascii')
                         send_message(self.transport, my_ans, CONFIGS)
                         self.process_server_ans(
-                            get_message(self.transport, CONFIGS))
-            except (OSError, json.JSONDecodeError) as err:
+                            self.get_response())
+            except (OSError, json.JSONDecodeError,
+                    IncorrectDataReceivedError) as err:
                 client_logger.debug(f'Connection error.', exc_info=err)
                 raise ServerError('Сбой соединения в процессе авторизации.')
 
@@ -156,51 +169,88 @@ class ClientTransport(threading.Thread, QObject):
         client_logger.debug(f'Разбор сообщения от сервера: {message}')
 
         # Если это подтверждение чего-либо
-        if CONFIGS.get('RESPONSE') in message:
-            if message[CONFIGS.get('RESPONSE')] == 200:
+        if CONFIGS.RESPONSE in message:
+            if message[CONFIGS.RESPONSE] == 200:
                 return
-            elif message[CONFIGS.get('RESPONSE')] == 400:
-                raise ServerError(f'{message[CONFIGS.get("ERROR")]}')
-            elif message[CONFIGS.get('RESPONSE')] == 205:
+            elif message[CONFIGS.RESPONSE] in (400, 429):
+                raise ServerError(f'{message[CONFIGS.ERROR]}')
+            elif message[CONFIGS.RESPONSE] == 205:
+                # Списки уже получены с этой версией справочника
+                version = message.get(CONFIGS.DIRECTORY_VERSION)
+                if version is not None and version == self.directory_version:
+                    return
                 self.user_list_update()
                 self.contacts_list_update()
                 self.message_205.emit()
             else:
                 client_logger.debug(
                     f'Принят неизвестный код подтверждения '
-                    f'{CONFIGS.get("RESPONSE")}')
+                    f'{CONFIGS.RESPONSE}')
 
         # Если это сообщение от пользователя добавляем в базу, даём сигнал о
         # новом сообщении
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('MESSAGE') and \
-                CONFIGS.get('FROM_USER') in message and CONFIGS.get('TO_USER')\
-                in message and CONFIGS.get('MESSAGE_TEXT') in message and \
-                message[CONFIGS.get('TO_USER')] == self.username:
+        elif CONFIGS.ACTION in message and \
+                message[CONFIGS.ACTION] == CONFIGS.MESSAGE and \
+                CONFIGS.FROM_USER in message and CONFIGS.TO_USER\
+                in message and CONFIGS.MESSAGE_TEXT in message and \
+                message[CONFIGS.TO_USER] == self.username:
             client_logger.debug(
                 f'Получено сообщение от пользователя '
-                f'{message[CONFIGS.get("FROM_USER")]}:'
-                f'{message[CONFIGS.get("MESSAGE_TEXT")]}')
+                f'{message[CONFIGS.FROM_USER]}:'
+                f'{message[CONFIGS.MESSAGE_TEXT]}')
             self.new_message.emit(message)
 
+        # Сообщения и уведомления групповых чатов
+        elif message.get(CONFIGS.ACTION) in (
+                CONFIGS.GROUP_MESSAGE, CONFIGS.CREATE_GROUP,
+                CONFIGS.JOIN_GROUP, CONFIGS.LEAVE_GROUP,
+                CONFIGS.GROUP_KEY) and \
+                CONFIGS.GROUP in message:
+            client_logger.debug(
+                f'Получено сообщение группы '
+                f'{message[CONFIGS.GROUP]}')
+            self.group_event.emit(message)
+
+        # Проверка связи от сервера
+        elif message.get(CONFIGS.ACTION) == CONFIGS.PING:
+            with socket_lock:
+                send_message(self.transport, {
+                    CONFIGS.ACTION: CONFIGS.PONG,
+                    CONFIGS.TIME: time.time()
+                }, CONFIGS)
+
+    def get_response(self):
+        """
+        Метод ожидания ответа сервера на запрос. Вызывается под
+        socket_lock. Сообщения пользователей и уведомления 205, пришедшие
+        раньше ответа, откладываются в incoming.
+        """
+        while True:
+            ans = get_message(self.transport, CONFIGS)
+            if CONFIGS.ACTION in ans or \
+                    ans.get(CONFIGS.RESPONSE) == 205:
+                self.incoming.append(ans)
+            else:
+                return ans
+
     def contacts_list_update(self):
         """Метод обновляющий с сервера список контактов."""
         self.database.contacts_clear()
         client_logger.debug(
             f'Запрос контакт листа для пользователся {self.name}')
         req = {
-            CONFIGS.get('ACTION'): CONFIGS.get('GET_CONTACTS'),
-            CONFIGS.get('TIME'): time.time(),
-            CONFIGS.get('USER'): self.username
+            CONFIGS.ACTION: CONFIGS.GET_CONTACTS,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.USER: self.username
         }
         client_logger.debug(f'Сформирован запрос {req}')
         with socket_lock:
             send_message(self.transport, req, CONFIGS)
-            ans = get_message(self.transport, CONFIGS)
+            ans = self.get_response()
         client_logger.debug(f'Получен ответ {ans}')
         if CONFIGS.get(
-                'RESPONSE') in ans and ans[CONFIGS.get('RESPONSE')] == 202:
-            for contact in ans[CONFIGS.get('LIST_INFO')]:
+                'RESPONSE') in ans and ans[CONFIGS.RESPONSE] == 202:
+            for contact in ans[CONFIGS.LIST_INFO]:
                 self.database.add_contact(contact)
         else:
             client_logger.error('Не удалось обновить список контактов.')
@@ -210,16 +260,18 @@ class ClientTransport(threading.Thread, QObject):
         client_logger.debug(
             f'Запрос списка известных пользователей {self.username}')
         req = {
-            CONFIGS.get('ACTION'): CONFIGS.get('USERS_REQUEST'),
-            CONFIGS.get('TIME'): time.time(),
-            CONFIGS.get('ACCOUNT_NAME'): self.username
+            CONFIGS.ACTION: CONFIGS.USERS_REQUEST,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.ACCOUNT_NAME: self.username
         }
         with socket_lock:
             send_message(self.transport, req, CONFIGS)
-            ans = get_message(self.transport, CONFIGS)
+            ans = self.get_response()
         if CONFIGS.get(
-                'RESPONSE') in ans and ans[CONFIGS.get('RESPONSE')] == 202:
-            self.database.add_users(ans[CONFIGS.get('LIST_INFO')])
+                'RESPONSE') in ans and ans[CONFIGS.RESPONSE] == 202:
+            self.database.add_users(ans[CONFIGS.LIST_INFO])
+            self.directory_version = ans.get(
+                CONFIGS.DIRECTORY_VERSION)
         else:
             client_logger.error(
                 'Не удалось обновить список известных пользователей.')
@@ -228,16 +280,16 @@ class ClientTransport(threading.Thread, QObject):
         """Метод запрашивающий с сервера публичный ключ пользователя."""
         client_logger.debug(f'Запрос публичного ключа для {user}')
         req = {
-            CONFIGS.get('ACTION'): CONFIGS.get('PUBLIC_KEY_REQUEST'),
-            CONFIGS.get('TIME'): time.time(),
-            CONFIGS.get('ACCOUNT_NAME'): user
+            CONFIGS.ACTION: CONFIGS.PUBLIC_KEY_REQUEST,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.ACCOUNT_NAME: user
         }
         with socket_lock:
             send_message(self.transport, req, CONFIGS)
-            ans = get_message(self.transport, CONFIGS)
+            ans = self.get_response()
         if CONFIGS.get(
-                'RESPONSE') in ans and ans[CONFIGS.get('RESPONSE')] == 511:
-            return ans[CONFIGS.get('DATA')]
+                'RESPONSE') in ans and ans[CONFIGS.RESPONSE] == 511:
+            return ans[CONFIGS.DATA]
         else:
             client_logger.error(f'Не удалось получить ключ собеседника{user}.')
 
@@ -245,34 +297,105 @@ class ClientTransport(threading.Thread, QObject):
         """Метод отправляющий на сервер сведения о добавлении контакта."""
         client_logger.debug(f'Создание контакта {contact}')
         req = {
-            CONFIGS.get('ACTION'): CONFIGS.get('ADD_CONTACT'),
-            CONFIGS.get('TIME'): time.time(),
-            CONFIGS.get('USER'): self.username,
-            CONFIGS.get('ACCOUNT_NAME'): contact
+            CONFIGS.ACTION: CONFIGS.ADD_CONTACT,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.USER: self.username,
+            CONFIGS.ACCOUNT_NAME: contact
         }
         with socket_lock:
             send_message(self.transport, req, CONFIGS)
-            self.process_server_ans(get_message(self.transport, CONFIGS))
+            self.process_server_ans(self.get_response())
 
     def remove_contact(self, contact):
         """Метод отправляющий на сервер сведения о удалении контакта."""
         client_logger.debug(f'Удаление контакта {contact}')
         req = {
-            CONFIGS.get('ACTION'): CONFIGS.get('REMOVE_CONTACT'),
-            CONFIGS.get('TIME'): time.time(),
-            CONFIGS.get('USER'): self.username,
-            CONFIGS.get('ACCOUNT_NAME'): contact
+            CONFIGS.ACTION: CONFIGS.REMOVE_CONTACT,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.USER: self.username,
+            CONFIGS.ACCOUNT_NAME: contact
         }
         with socket_lock:
             send_message(self.transport, req, CONFIGS)
-            self.process_server_ans(get_message(self.transport, CONFIGS))
+            self.process_server_ans(self.get_response())
+
+    def group_request(self, action, group, **fields):
+        """
+        Метод отправки запроса действия с группой.
+        :param action: ключ конфигурации действия ('JOIN_GROUP').
+        :param fields: дополнительные поля: ключ конфигурации -> значение.
+        :return: ответ сервера.
+        """
+        req = {
+            CONFIGS.ACTION: CONFIGS.get(action),
+            CONFIGS.TIME: time.time(),
+            CONFIGS.USER: self.username,
+            CONFIGS.GROUP: group
+        }
+        for key, value in fields.items():
+            req[CONFIGS.get(key)] = value
+        with socket_lock:
+            send_message(self.transport, req, CONFIGS)
+            return self.get_response()
+
+    def create_group(self, group, key=None):
+        """
+        Метод создания группы.
+        :param key: ключ группы, зашифрованный своим открытым ключом.
+        """
+        client_logger.debug(f'Создание группы {group}')
+        self.process_server_ans(
+            self.group_request('CREATE_GROUP', group, DATA=key))
+
+    def join_group(self, group):
+        """
+        Метод вступления в группу.
+        :return: кортеж (список участников, зашифрованный для нас ключ
+        группы или None, если его ещё никто не передал).
+        """
+        client_logger.debug(f'Вступление в группу {group}')
+        ans = self.group_request('JOIN_GROUP', group)
+        if ans.get(CONFIGS.RESPONSE) != 202:
+            self.process_server_ans(ans)
+            raise ServerError('Не удалось вступить в группу.')
+        return ans[CONFIGS.LIST_INFO], ans.get(CONFIGS.DATA)
+
+    def leave_group(self, group):
+        """Метод выхода из группы."""
+        client_logger.debug(f'Выход из группы {group}')
+        self.process_server_ans(self.group_request('LEAVE_GROUP', group))
+
+    def share_group_key(self, group, member, key):
+        """
+        Метод передачи ключа группы участнику.
+        :param key: ключ группы, зашифрованный открытым ключом участника.
+        """
+        self.process_server_ans(self.group_request(
+            'GROUP_KEY', group, ACCOUNT_NAME=member, DATA=key))
+
+    def send_group_message(self, group, message):
+        """
+        Метод отправки сообщения группе. Текст должен быть уже
+        зашифрован ключом группы.
+        """
+        message_dict = {
+            CONFIGS['ACTION']: CONFIGS['GROUP_MESSAGE'],
+            CONFIGS['FROM_USER']: self.username,
+            CONFIGS['GROUP']: group,
+            CONFIGS['TIME']: time.time(),
+            CONFIGS['MESSAGE_TEXT']: message
+        }
+        with socket_lock:
+            send_message(self.transport, message_dict, CONFIGS)
+            self.process_server_ans(self.get_response())
+        client_logger.info(f'Отправлено сообщение группе {group}')
 
     def transport_shutdown(self):
         """Метод уведомляющий сервер о завершении работы клиента."""
         self.running = False
         message = {
-            CONFIGS.get('ACTION'): CONFIGS.get('EXIT'),
-            CONFIGS.get('TIME'): time.time(),
+            CONFIGS.ACTION: CONFIGS.EXIT,
+            CONFIGS.TIME: time.time(),
             CONFIGS['ACCOUNT_NAME']: self.username
         }
         with socket_lock:
@@ -297,7 +420,7 @@ class ClientTransport(threading.Thread, QObject):
         # Необходимо дождаться освобождения сокета для отправки сообщения
         with socket_lock:
             send_message(self.transport, message_dict, CONFIGS)
-            self.process_server_ans(get_message(self.transport, CONFIGS))
+            self.process_server_ans(self.get_response())
             client_logger.info(f'Отправлено сообщение для пользователя {to}')
 
     def run(self):
@@ -308,6 +431,8 @@ class ClientTransport(threading.Thread, QObject):
             # если не сделать тут задержку, то отправка может достаточно долго
             # ждать освобождения сокета.
             time.sleep(1)
+            while self.incoming:
+                self.process_server_ans(self.incoming.popleft())
             message = None
             with socket_lock:
                 try:
@@ -321,15 +446,17 @@ class ClientTransport(threading.Thread, QObject):
                         self.connection_lost.emit()
                 # Проблемы с соединением
                 except (ConnectionError, ConnectionAbortedError,
-                        ConnectionResetError, json.JSONDecodeError, TypeError):
+                        ConnectionResetError, json.JSONDecodeError,
+                        IncorrectDataReceivedError, TypeError):
                     client_logger.debug(f'Потеряно соединение с сервером.')
                     self.running = False
                     self.connection_lost.emit()
                 finally:
                     self.transport.settimeout(5)
 
-                # Если сообщение получено, то вызываем функцию обработчик:
-                if message:
-                    client_logger.debug(
-                        f'Принято сообщение с сервера: {message}')
-                    self.process_server_ans(message)
+            # Если сообщение получено, то вызываем функцию обработчик.
+            # Обработчик сам захватывает сокет, если нужно ответить.
+            if message:
+                client_logger.debug(
+                    f'Принято сообщение с сервера: {message}')
+                self.process_server_ans(message)
@@ -4,23 +4,29 @@ CONFIGS = get_configs()
 
 # Словари - ответы:
 # 200
-RESPONSE_200 = {CONFIGS.get('RESPONSE'): 200}
+RESPONSE_200 = {CONFIGS.RESPONSE: 200}
 # 202
-RESPONSE_202 = {CONFIGS.get('RESPONSE'): 202,
-                CONFIGS.get('LIST_INFO'): None
+RESPONSE_202 = {CONFIGS.RESPONSE: 202,
+                CONFIGS.LIST_INFO: None
                 }
 # 400
 RESPONSE_400 = {
-    CONFIGS.get('RESPONSE'): 400,
-    CONFIGS.get('ERROR'): None
+    CONFIGS.RESPONSE: 400,
+    CONFIGS.ERROR: None
 }
 # 205
 RESPONSE_205 = {
-    CONFIGS.get('RESPONSE'): 205
+    CONFIGS.RESPONSE: 205
+}
+
+# 429
+RESPONSE_429 = {
+    CONFIGS.RESPONSE: 429,
+    CONFIGS.ERROR: 'Слишком много запросов, повторите позже.'
 }
 
 # 511
 RESPONSE_511 = {
-    CONFIGS.get('RESPONSE'): 511,
-    CONFIGS.get('DATA'): None
+    CONFIGS.RESPONSE: 511,
+    CONFIGS.DATA: None
 }
@@ -1,6 +1,5 @@
-import socket
+import itertools
 import sys
-import traceback
 from functools import wraps
 import logging
 
@@ -16,41 +15,78 @@ else:
 CONFIGS = get_configs()
 
 
-def log(func_to_log):
+def sampled(sample):
+    """
+    Функция, возвращающая проверку "записать этот вызов": True для
+    каждого sample-го вызова (для sample <= 1 - всегда).
+    """
+    if sample <= 1:
+        return lambda: True
+    counter = itertools.count()
+    return lambda: not next(counter) % sample
+
+
+def log(func_to_log=None, *, level=logging.DEBUG, sample=1):
     """
     Декоратор, выполняющий логирование вызовов функций.
-    Сохраняет события типа debug, содержащие
+    Сохраняет события (по умолчанию debug), содержащие
     информацию о имени вызываемой функиции, параметры с которыми
     вызывается функция, и модуль, вызывающий функцию.
+    Применяется как @log или @log(level=..., sample=N) - записывать
+    только каждый N-й вызов.
+    Пока уровень level выключен, вызов стоит одной проверки
+    isEnabledFor: строка сообщения (с repr всех аргументов) собирается
+    логгером только при записи. При LOG_DECORATORS = false (например,
+    MESSENGER_LOG_DECORATORS=false) функция не оборачивается вовсе.
     """
-    def log_saver(*args, **kwargs):
-        LOGGER.debug(
-            f'Была вызвана функция {func_to_log.__name__} '
-            f'c параметрами {args} , {kwargs}. '
-            f'Вызов из модуля {func_to_log.__module__}')
-        ret = func_to_log(*args, **kwargs)
-        return ret
+    def decorator(func):
+        if not CONFIGS.LOG_DECORATORS:
+            return func
+        should_log = sampled(sample)
+
+        @wraps(func)
+        def log_saver(*args, **kwargs):
+            if LOGGER.isEnabledFor(level) and should_log():
+                LOGGER.log(
+                    level, 'Была вызвана функция %s c параметрами %r , %r. '
+                    'Вызов из модуля %s',
+                    func.__name__, args, kwargs, func.__module__)
+            return func(*args, **kwargs)
 
-    return log_saver
+        return log_saver
+
+    if func_to_log is not None:
+        return decorator(func_to_log)
+    return decorator
 
 
 class Log():
     """
     Декоратор, выполняющий логирование вызовов функций.
-    Сохраняет события типа info, содержащие
-    информацию о имени вызываемой функиции, параметры с которыми
-    вызывается функция, и модуль, вызывающий функцию.
+    Сохраняет события (по умолчанию info), содержащие
+    информацию о имени вызываемой функиции и функции, из которой она
+    вызвана. Как и log, проверяет уровень до любой работы, записывает
+    каждый sample-й вызов и при LOG_DECORATORS = false не оборачивает
+    функцию.
     """
+    def __init__(self, level=logging.INFO, sample=1):
+        self.level = level
+        self.sample = sample
+
     def __call__(self, func):
+        if not CONFIGS.LOG_DECORATORS:
+            return func
+        level = self.level
+        should_log = sampled(self.sample)
+
         @wraps(func)
         def decorated(*args, **kwargs):
-            LOGGER.info(
-                f'Функция {func.__name__} вызвана из функции '
-                f'{traceback.format_stack()[0].strip().split()[-1]}.'
-            )
+            if LOGGER.isEnabledFor(level) and should_log():
+                # Вызывающая функция - кадр над обёрткой
+                LOGGER.log(level, 'Функция %s вызвана из функции %s.',
+                           func.__name__, sys._getframe(1).f_code.co_name)
             # Декорированная функция
-            res = func(*args, **kwargs)
-            return res
+            return func(*args, **kwargs)
 
         return decorated
 
@@ -58,38 +94,21 @@ class Log():
 def login_required(func):
     """
     Декоратор, проверяющий, что клиент авторизован на сервере.
-    Проверяет, что передаваемый объект сокета находится в
-    списке авторизованных клиентов.
+    Декорирует метод вида method(self, message, session, ...): сессия
+    соединения должна принадлежать авторизованному пользователю
+    (session.username задан).
     За исключением передачи словаря-запроса
     на авторизацию. Если клиент не авторизован,
     генерирует исключение TypeError
     """
 
-    def checker(*args, **kwargs):
-        # проверяем, что первый аргумент - экземпляр MessageProcessor
-        # Импортить необходимо тут, иначе ошибка рекурсивного импорта.
-        from my_messenger.server.core import MessageProcessor
-        if isinstance(args[0], MessageProcessor):
-            found = False
-            for arg in args:
-                if isinstance(arg, socket.socket):
-                    # Проверяем, что данный сокет есть в списке names класса
-                    # MessageProcessor
-                    for client in args[0].names:
-                        if args[0].names[client] == arg:
-                            found = True
-
-            # Теперь надо проверить, что передаваемые аргументы не presence
-            # сообщение. Если presence, то разрешаем
-            for arg in args:
-                if isinstance(arg, dict):
-                    if CONFIGS['ACTION'] in arg and \
-                            arg[CONFIGS['ACTION']] == CONFIGS['PRESENCE']:
-                        found = True
-            # Если не не авторизован и не сообщение начала авторизации, то
-            # вызываем исключение.
-            if not found:
-                raise TypeError
-        return func(*args, **kwargs)
+    @wraps(func)
+    def checker(self, message, session, *args, **kwargs):
+        # Если сессия не авторизована и это не сообщение начала
+        # авторизации (presence), то вызываем исключение.
+        if session.username is None and \
+                message.get(CONFIGS.ACTION) != CONFIGS.PRESENCE:
+            raise TypeError
+        return func(self, message, session, *args, **kwargs)
 
     return checker
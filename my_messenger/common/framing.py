@@ -0,0 +1,206 @@
+"""
+Формат кадров протокола.
+
+Каждое сообщение передаётся кадром: заголовок из байта версии формата и
+4 байт длины (big-endian), за которым следует JSON в кодировке из
+конфигурации. Это позволяет выделять сообщения из потока TCP независимо
+от того, как ядро разбило или склеило данные.
+"""
+import json
+import struct
+
+from my_messenger.common.errors import IncorrectDataReceivedError
+
+# Текущая версия формата кадра
+FRAME_VERSION = 1
+
+# Заголовок кадра: версия (1 байт) и длина тела (4 байта)
+FRAME_HEADER = struct.Struct('>BI')
+
+# Максимальная длина тела кадра по умолчанию - защита от исчерпания памяти
+DEFAULT_MAX_FRAME_LENGTH = 16 * 1024 * 1024
+
+
+def encode_message(message, encoding):
+    """
+    Функция кодирования словаря в кадр.
+    :param message: словарь для передачи.
+    :param encoding: кодировка JSON.
+    :return: байты кадра.
+    """
+    return frame_payload(json.dumps(message).encode(encoding))
+
+
+def frame_payload(payload):
+    """
+    Функция оформления уже закодированного JSON в кадр.
+    :param payload: байты тела кадра.
+    :return: байты кадра.
+    """
+    return FRAME_HEADER.pack(FRAME_VERSION, len(payload)) + payload
+
+
+class BufferPool:
+    """
+    Класс - пул буферов приёма одного размера для всех соединений.
+    Декодер берёт буфер, когда приходят данные, и возвращает его, когда
+    все принятые кадры разобраны. Неактивные соединения буферов не
+    держат, а память под буферы переиспользуется без обращения к
+    аллокатору, поэтому занятая память зависит от числа одновременно
+    читающих соединений, а не от числа подключённых.
+    """
+
+    def __init__(self, block_size, max_free=1024):
+        self.block_size = block_size
+        # Сколько свободных буферов хранить, остальные отдаются сборщику
+        self.max_free = max_free
+        self.free = []
+        # Счётчики: создано буферов и выдано повторно
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self):
+        if self.free:
+            self.reused += 1
+            return self.free.pop()
+        self.created += 1
+        return bytearray(self.block_size)
+
+    def release(self, buffer):
+        # Буферы, выросшие под большой кадр, в пул не возвращаются
+        if len(buffer) == self.block_size and \
+                len(self.free) < self.max_free:
+            self.free.append(buffer)
+
+
+class FrameDecoder:
+    """
+    Класс - инкрементальный декодер кадров одного соединения.
+    Принимает данные через recv_into в переиспользуемый буфер, копит
+    неполные кадры между чтениями и отдаёт все полностью принятые.
+    Буфер растёт под длину кадра, поэтому размер сообщения ограничен
+    только max_frame_length. Если задан пул BufferPool, буфер берётся
+    из него на время приёма и возвращается после разбора всех кадров.
+    """
+
+    def __init__(self, initial_size=10240,
+                 max_frame_length=DEFAULT_MAX_FRAME_LENGTH, pool=None):
+        self.pool = pool
+        if pool is None:
+            self.buffer = bytearray(initial_size)
+            self.view = memoryview(self.buffer)
+        else:
+            self.buffer = None
+            self.view = None
+        # Границы непрочитанных данных в буфере
+        self.start = 0
+        self.end = 0
+        self.max_frame_length = max_frame_length
+
+    def __len__(self):
+        """Количество принятых, но ещё не разобранных байт."""
+        return self.end - self.start
+
+    def _reserve(self, size):
+        """Метод, гарантирующий size свободных байт в конце буфера."""
+        if self.buffer is None:
+            self.buffer = self.pool.acquire()
+            self.view = memoryview(self.buffer)
+        if len(self.buffer) - self.end >= size:
+            return
+        pending = self.end - self.start
+        if pending + size > len(self.buffer):
+            # Данных больше, чем помещается: выделяем буфер побольше
+            new_size = len(self.buffer)
+            while new_size < pending + size:
+                new_size *= 2
+            buffer = bytearray(new_size)
+            buffer[:pending] = self.view[self.start:self.end]
+            self.view.release()
+            if self.pool is not None:
+                self.pool.release(self.buffer)
+            self.buffer = buffer
+            self.view = memoryview(self.buffer)
+        else:
+            # Сдвигаем недочитанный хвост в начало буфера
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = pending
+
+    def _frame_length(self):
+        """Метод разбора заголовка кадра в начале непрочитанных данных."""
+        version, length = FRAME_HEADER.unpack_from(self.buffer, self.start)
+        if version != FRAME_VERSION or length > self.max_frame_length:
+            raise IncorrectDataReceivedError
+        return length
+
+    def _wanted(self):
+        """Сколько байт нужно, чтобы дочитать текущий кадр."""
+        pending = self.end - self.start
+        if pending < FRAME_HEADER.size:
+            return FRAME_HEADER.size - pending
+        return FRAME_HEADER.size + self._frame_length() - pending
+
+    def recv_from(self, sock):
+        """
+        Метод чтения из сокета в свободную часть буфера.
+        :return: количество прочитанных байт (0 - соединение закрыто).
+        """
+        self._reserve(max(self._wanted(), 1))
+        count = sock.recv_into(self.view[self.end:])
+        self.end += count
+        return count
+
+    def feed(self, data):
+        """Метод добавления уже принятых байт (для asyncio и тестов)."""
+        self._reserve(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def next_frame(self):
+        """
+        Метод, возвращающий тело следующего полного кадра как memoryview
+        или None, если кадр ещё не принят целиком. memoryview действителен
+        до следующего чтения в декодер.
+        """
+        if self.end - self.start < FRAME_HEADER.size:
+            return None
+        length = self._frame_length()
+        frame_start = self.start + FRAME_HEADER.size
+        frame_end = frame_start + length
+        if frame_end > self.end:
+            return None
+        self.start = frame_end
+        if self.start == self.end:
+            # Буфер разобран полностью - следующие данные пишем с начала
+            self.start = self.end = 0
+        return self.view[frame_start:frame_end]
+
+    def messages(self, encoding):
+        """
+        Генератор словарей из всех полностью принятых кадров.
+        Когда принятые данные разобраны целиком, буфер возвращается в пул.
+        """
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                if not self.end:
+                    self.close()
+                return
+            message = json.loads(str(frame, encoding))
+            if not isinstance(message, dict):
+                raise IncorrectDataReceivedError
+            yield message
+
+    def close(self):
+        """
+        Метод возврата буфера в пул (недочитанные данные теряются).
+        Без пула ничего не делает.
+        """
+        if self.pool is None or self.buffer is None:
+            return
+        self.view.release()
+        self.pool.release(self.buffer)
+        self.buffer = None
+        self.view = None
+        self.start = self.end = 0
@@ -1,49 +1,218 @@
+import configparser
+import errno
 import json
 import os
 import sys
+import threading
+import weakref
+from types import MappingProxyType
+
 from my_messenger.common.errors import IncorrectDataReceivedError
+from my_messenger.common.framing import FrameDecoder, encode_message
+
+# Декодеры кадров для сокетов, с которыми работают get_message/send_message.
+# Хранят недочитанные данные между вызовами и исчезают вместе с сокетом.
+_decoders = weakref.WeakKeyDictionary()
+
+
+def get_decoder(opened_socket, CONFIGS=None):
+    """
+    Функция, возвращающая декодер кадров, привязанный к сокету.
+    :param opened_socket: сокет для передачи данных.
+    :param CONFIGS: конфигурация (размер начального буфера и предел кадра).
+    :return: FrameDecoder.
+    """
+    decoder = _decoders.get(opened_socket)
+    if decoder is None:
+        if CONFIGS is None:
+            decoder = FrameDecoder()
+        else:
+            decoder = FrameDecoder(CONFIGS.get('MAX_PACKAGE_LENGTH'),
+                                   CONFIGS.get('MAX_FRAME_LENGTH'))
+        _decoders[opened_socket] = decoder
+    return decoder
 
 
 def get_message(opened_socket, CONFIGS):
     """
     Функция приёма сообщений от удалённых компьютеров.
-    Принимает сообщения JSON, декодирует полученное сообщение
-    и проверяет что получен словарь.
+    Читает из сокета до получения полного кадра, декодирует JSON
+    и проверяет что получен словарь. Лишние данные, пришедшие вместе
+    с кадром, остаются в декодере до следующего вызова.
     :param opened_socket: сокет для передачи данных.
     :param CONFIGS: конфигурация.
     :return: словарь - сообщение.
     """
-    encoded_response = opened_socket.recv(CONFIGS.get('MAX_PACKAGE_LENGTH'))
-    if isinstance(encoded_response, bytes):
-        json_response = encoded_response.decode(CONFIGS.get('ENCODING'))
-        response_dict = json.loads(json_response)
-        if isinstance(response_dict, dict):
-            return response_dict
-        raise IncorrectDataReceivedError
-    raise IncorrectDataReceivedError
+    decoder = get_decoder(opened_socket, CONFIGS)
+    while True:
+        frame = decoder.next_frame()
+        if frame is not None:
+            response_dict = json.loads(str(frame, CONFIGS.get('ENCODING')))
+            if isinstance(response_dict, dict):
+                return response_dict
+            raise IncorrectDataReceivedError
+        if not decoder.recv_from(opened_socket):
+            raise ConnectionResetError(
+                errno.ECONNRESET, 'Соединение закрыто удалённой стороной')
 
 
 def send_message(opened_socket, message, CONFIGS):
     """
     Функция отправки словарей через сокет.
-    Кодирует словарь в формат JSON и отправляет через сокет.
+    Кодирует словарь в кадр с JSON и отправляет через сокет.
     :param opened_socket: сокет для передачи
     :param message: словарь для передачи
     :param CONFIGS: конфигурация.
     :return: ничего не возвращает
     """
-    json_message = json.dumps(message)
-    encoded_message = json_message.encode(CONFIGS.get('ENCODING'))
-    opened_socket.send(encoded_message)
+    opened_socket.sendall(encode_message(message, CONFIGS.get('ENCODING')))
 
 
-def get_configs():
+# Файлы настроек ищутся относительно пакета, а не текущего каталога
+CONFIGS_PATH = os.path.join(os.path.dirname(__file__), 'configs.json')
+SERVER_INI_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'server.ini')
+
+# Префикс переменных окружения, переопределяющих настройки:
+# MESSENGER_DEFAULT_PORT=8888
+ENV_PREFIX = 'MESSENGER_'
+
+# Секция server.ini, переопределяющая настройки configs.json
+INI_SECTION = 'CONFIGS'
+
+_configs = None
+_configs_lock = threading.Lock()
+
+
+def freeze(value):
+    """
+    Функция, делающая значение настройки неизменяемым: словари
+    становятся MappingProxyType, списки - кортежами, строки интернируются
+    (ключи сообщений сравниваются с ними при каждом разборе).
+    """
+    if isinstance(value, dict):
+        return MappingProxyType(
+            {sys.intern(key): freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def thaw(value):
+    """Функция, обратная freeze: изменяемые словари и списки."""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def parse_override(value, default):
     """
-    функция получения словаря из json файла с настройками
+    Функция разбора переопределённого значения по типу значения из
+    configs.json: строковые настройки берутся как есть, числа, логические
+    значения, списки и словари разбираются как JSON и должны совпадать
+    по типу. Для настроек со значением null пустая строка и null - None,
+    иначе строка.
+    :raise ValueError: значение не подходит по типу.
     """
-    if not os.path.exists('common/configs.json'):
+    if isinstance(default, str):
+        return value
+    if default is None:
+        return None if value in ('', 'null') else value
+    if isinstance(default, bool) and \
+            value.lower() in configparser.ConfigParser.BOOLEAN_STATES:
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        parsed = value
+    if isinstance(default, float) and isinstance(parsed, int) and \
+            not isinstance(parsed, bool):
+        return float(parsed)
+    # bool - подкласс int, поэтому сравниваем типы точно
+    if type(parsed) is not type(default):
+        raise ValueError(
+            f'ожидается {type(default).__name__}, получено {value!r}')
+    return parsed
+
+
+class Config(dict):
+    """
+    Класс - неизменяемая конфигурация процесса.
+    Словарь экземпляра - он сам, поэтому CONFIGS.ACTION, CONFIGS['ACTION']
+    и CONFIGS.get('ACTION') - один поиск в словаре без вызова методов
+    на Python. Все изменяющие методы запрещены.
+    """
+
+    def __init__(self, values):
+        super().__init__(
+            (sys.intern(key), freeze(value)) for key, value in values.items())
+        object.__setattr__(self, '__dict__', self)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Конфигурация неизменяема')
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = __ior__ = \
+        clear = pop = popitem = setdefault = update = _read_only
+
+    def __repr__(self):
+        return f'Config({dict.__repr__(self)})'
+
+    def __reduce__(self):
+        # MappingProxyType не сериализуется pickle: передаём изменяемые
+        # значения, при загрузке Config заморозит их снова
+        return Config, ({key: thaw(value) for key, value in self.items()},)
+
+
+def load_configs(path=CONFIGS_PATH, ini_path=SERVER_INI_PATH,
+                 environ=None):
+    """
+    Функция загрузки конфигурации: configs.json, поверх - секция
+    [CONFIGS] файла server.ini, поверх - переменные окружения
+    MESSENGER_<НАСТРОЙКА>. Переопределяются только известные настройки,
+    значение приводится к типу значения из configs.json.
+    :return: Config.
+    :raise ValueError: значение переопределения не подходит по типу.
+    """
+    if not os.path.exists(path):
         print('Файл конфигурации не найден')
         sys.exit(1)
-    with open('common/configs.json') as configs_file:
-        CONFIGS = json.load(configs_file)
-        return CONFIGS
+    with open(path, encoding='utf-8') as configs_file:
+        values = json.load(configs_file)
+
+    ini = configparser.ConfigParser()
+    ini.read(ini_path, encoding='utf-8')
+    if INI_SECTION in ini:
+        for key, value in ini[INI_SECTION].items():
+            # configparser приводит имена к нижнему регистру
+            if key.upper() in values:
+                _override(values, key.upper(), value)
+
+    environ = os.environ if environ is None else environ
+    for key, value in environ.items():
+        if key.startswith(ENV_PREFIX) and key[len(ENV_PREFIX):] in values:
+            _override(values, key[len(ENV_PREFIX):], value)
+    return Config(values)
+
+
+def _override(values, key, value):
+    try:
+        values[key] = parse_override(value, values[key])
+    except ValueError as err:
+        raise ValueError(f'Неверное значение настройки {key}: {err}')
+
+
+def get_configs():
+    """
+    Функция получения конфигурации процесса. Файлы читаются при первом
+    вызове, дальше возвращается тот же объект Config.
+    """
+    global _configs
+    if _configs is None:
+        with _configs_lock:
+            if _configs is None:
+                _configs = load_configs()
+    return _configs
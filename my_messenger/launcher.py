@@ -1,8 +1,16 @@
 import subprocess
+import sys
+
+# Отдельное окно консоли для каждого процесса есть только в Windows
+CREATION_FLAGS = getattr(subprocess, 'CREATE_NEW_CONSOLE', 0)
 
 
 def main():
-    """Функция запуска лаунчера"""
+    """
+    Функция запуска лаунчера: сервер и клиенты с графическим интерфейсом
+    для ручной проверки. Для нагрузочного тестирования - генератор
+    нагрузки: python -m my_messenger.loadgen.
+    """
     process = []
 
     while True:
@@ -14,8 +22,8 @@ def main():
         elif action == 's':
             # Запускаем сервер!
             process.append(subprocess.Popen(
-                'python server.py',
-                creationflags=subprocess.CREATE_NEW_CONSOLE))
+                [sys.executable, 'server.py'],
+                creationflags=CREATION_FLAGS))
         elif action == 'k':
             print('Убедитесь, что на сервере зарегистрировано необходимо '
                   'количество клиентов с паролем 123456.')
@@ -26,8 +34,9 @@ def main():
             # Запускаем клиентов:
             for i in range(clients_count):
                 process.append(subprocess.Popen(
-                    f'python client.py -n test{i + 1} -p 123456',
-                    creationflags=subprocess.CREATE_NEW_CONSOLE))
+                    [sys.executable, 'client.py', '-n', f'test{i + 1}',
+                     '-p', '123456'],
+                    creationflags=CREATION_FLAGS))
         elif action == 'x':
             while process:
                 process.pop().kill()
@@ -0,0 +1,394 @@
+"""
+Генератор нагрузки на сервер мессенджера.
+
+Создаёт N виртуальных пользователей (при указании --database регистрирует
+их в базе сервера одной пачкой), подключает их как консольных клиентов
+протокола с настоящей авторизацией (presence, ответ 511 с HMAC хэша
+пароля) и рассылает между ними сообщения, зашифрованные PKCS1_OAEP, с
+заданной общей частотой. Все пользователи обслуживаются одним циклом
+asyncio, поэтому тысячи соединений работают в одном процессе.
+
+По окончании выводит пропускную способность, задержку доставки
+(p50/p99/p99.9, от отправки до получения адресатом) и число ошибок.
+
+Запуск (сервер уже работает, база - та же, что у сервера):
+
+    python -m my_messenger.loadgen -u 1000 -r 500 -d 30 \\
+        --database my_messenger/server_database.db3
+
+Сервер ограничивает частоту запросов: у каждого пользователя не больше
+50 сообщений в секунду, авторизаций с одного IP-адреса - 10 в секунду
+(секции USER_LIMITS, IP_LIMITS файла server.ini). Генератор подключается
+с одного адреса, поэтому при тысячах пользователей лимит presence стоит
+отключить (presence = off), иначе вход растянется; отказы 429 попадают в
+отчёт отдельной строкой.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import collections
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Cryptodome.Cipher import PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+
+sys.path.append('../')
+from my_messenger.common.errors import IncorrectDataReceivedError
+from my_messenger.common.framing import FRAME_HEADER, FRAME_VERSION, \
+    encode_message
+from my_messenger.common.utils import get_configs
+
+CONFIGS = get_configs()
+
+
+def password_hash(name, password):
+    """Функция хэширования пароля так же, как это делает клиент."""
+    return binascii.hexlify(hashlib.pbkdf2_hmac(
+        'sha512', password.encode('utf-8'),
+        name.lower().encode('utf-8'), 10000))
+
+
+def password_hashes(names, password):
+    """
+    Функция хэширования паролей всех пользователей. pbkdf2_hmac
+    отпускает GIL, поэтому хэши считаются параллельно в потоках.
+    """
+    with ThreadPoolExecutor(os.cpu_count()) as executor:
+        return dict(zip(names, executor.map(
+            password_hash, names, [password] * len(names))))
+
+
+def register_users(database_path, hashes):
+    """
+    Функция регистрации виртуальных пользователей в базе сервера.
+    Уже зарегистрированные пропускаются.
+    :return: количество добавленных пользователей.
+    """
+    # Импорт здесь: без --database генератору база не нужна
+    from my_messenger.server.database import ServerStorage
+
+    database = ServerStorage(database_path)
+    try:
+        known = {name for name, last_login in database.users_list()}
+        new_users = [(name, passwd_hash)
+                     for name, passwd_hash in hashes.items()
+                     if name not in known]
+        if new_users:
+            database.add_users(new_users)
+        return len(new_users)
+    finally:
+        database.close()
+
+
+def percentile(values, share):
+    """Функция - перцентиль share (0..1) отсортированного списка."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(share * len(values)) - 1))
+    return values[index]
+
+
+class LoadStats:
+    """Класс - счётчики и задержки доставки за время прогона."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.logged_in = 0
+        self.sent = 0
+        self.acked = 0
+        self.delivered = 0
+        self.latencies = []
+        # Вид ошибки -> количество
+        self.errors = collections.Counter()
+
+    def report(self):
+        """Метод формирования итогов прогона в виде словаря."""
+        duration = (self.finished or time.time()) - self.started
+        latencies = sorted(self.latencies)
+        return {
+            'users': self.logged_in,
+            'duration': round(duration, 3),
+            'sent': self.sent,
+            'acked': self.acked,
+            'delivered': self.delivered,
+            'throughput': round(self.delivered / duration, 1)
+            if duration else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.5) * 1000, 3),
+                'p99': round(percentile(latencies, 0.99) * 1000, 3),
+                'p999': round(percentile(latencies, 0.999) * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3) if latencies else 0.0
+            },
+            'errors': dict(self.errors)
+        }
+
+
+class VirtualUser:
+    """
+    Класс - консольный клиент протокола одного виртуального пользователя.
+    """
+
+    def __init__(self, name, passwd_hash, stats):
+        self.name = name
+        self.passwd_hash = passwd_hash
+        self.stats = stats
+        self.reader = None
+        self.writer = None
+        self.online = False
+        # Задача приёма сообщений после входа
+        self.task = None
+
+    async def read_message(self):
+        """Сопрограмма приёма одного кадра (None - соединение закрыто)."""
+        try:
+            header = await self.reader.readexactly(FRAME_HEADER.size)
+            version, length = FRAME_HEADER.unpack(header)
+            if version != FRAME_VERSION:
+                raise IncorrectDataReceivedError
+            payload = await self.reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+        return json.loads(payload.decode(CONFIGS.ENCODING))
+
+    def send(self, message):
+        self.writer.write(encode_message(message, CONFIGS.ENCODING))
+
+    async def login(self, address, port, pubkey, attempts=10):
+        """
+        Сопрограмма подключения и авторизации. На отказ 429 (лимит
+        авторизаций с адреса) повторяет попытку с нарастающей паузой.
+        :return: True, если пользователь вошёл.
+        """
+        delay = 0.1
+        for attempt in range(attempts):
+            self.reader, self.writer = await asyncio.open_connection(
+                address, port)
+            self.send({
+                CONFIGS.ACTION: CONFIGS.PRESENCE,
+                CONFIGS.TIME: time.time(),
+                CONFIGS.USER: {
+                    CONFIGS.ACCOUNT_NAME: self.name,
+                    CONFIGS.PUBLIC_KEY: pubkey
+                }
+            })
+            ans = await self.read_message() or {}
+            if ans.get(CONFIGS.RESPONSE) == 511:
+                digest = hmac.new(
+                    self.passwd_hash,
+                    ans[CONFIGS.DATA].encode('utf-8'),
+                    'MD5').digest()
+                self.send({
+                    CONFIGS.RESPONSE: 511,
+                    CONFIGS.DATA: binascii.b2a_base64(
+                        digest).decode('ascii')
+                })
+                ans = await self.read_message() or {}
+                if ans.get(CONFIGS.RESPONSE) == 200:
+                    self.online = True
+                    return True
+            self.writer.close()
+            code = ans.get(CONFIGS.RESPONSE, 'closed')
+            self.stats.errors[f'login {code}'] += 1
+            if code != 429:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
+        return False
+
+    async def receive(self):
+        """Сопрограмма приёма сообщений до закрытия соединения."""
+        stats = self.stats
+        try:
+            while True:
+                message = await self.read_message()
+                if message is None:
+                    break
+                action = message.get(CONFIGS.ACTION)
+                if action == CONFIGS.MESSAGE:
+                    sent_at = message.get(CONFIGS.TIME, 0)
+                    # Сообщения прошлых прогонов из очереди для
+                    # отключённых в статистику не идут
+                    if sent_at >= stats.started:
+                        stats.delivered += 1
+                        stats.latencies.append(time.time() - sent_at)
+                elif action == CONFIGS.PING:
+                    self.send({
+                        CONFIGS.ACTION: CONFIGS.PONG,
+                        CONFIGS.TIME: time.time()
+                    })
+                else:
+                    code = message.get(CONFIGS.RESPONSE)
+                    if code == 200:
+                        stats.acked += 1
+                    elif code not in (202, 205):
+                        stats.errors[f'response {code}'] += 1
+        except (OSError, ValueError, IncorrectDataReceivedError) as err:
+            stats.errors[type(err).__name__] += 1
+        finally:
+            if self.online:
+                self.online = False
+                stats.errors['disconnected'] += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.online = False
+            self.writer.close()
+
+
+async def connect_users(users, args, pubkey, stats):
+    """
+    Сопрограмма подключения пользователей: не больше args.concurrency
+    одновременных входов и не чаще args.connect_rate в секунду.
+    """
+    semaphore = asyncio.Semaphore(args.concurrency)
+    interval = 1 / args.connect_rate if args.connect_rate else 0
+
+    async def connect(user):
+        async with semaphore:
+            try:
+                if await user.login(args.addr, args.port, pubkey):
+                    stats.logged_in += 1
+                    user.task = asyncio.create_task(user.receive())
+            except OSError as err:
+                stats.errors[f'connect {type(err).__name__}'] += 1
+
+    tasks = []
+    for user in users:
+        tasks.append(asyncio.create_task(connect(user)))
+        if interval:
+            await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+
+
+async def send_messages(users, args, payloads, stats):
+    """
+    Сопрограмма отправки сообщений случайным парам пользователей с общей
+    частотой args.rate в течение args.duration секунд. Отправка идёт
+    порциями раз в такт, чтобы частота не зависела от точности sleep.
+    """
+    tick = 0.01
+    budget = 0.0
+    started = time.monotonic()
+    deadline = started + args.duration
+    last = started
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        budget += (now - last) * args.rate
+        last = now
+        online = [user for user in users if user.online]
+        if len(online) < 2:
+            stats.errors['no users online'] += 1
+            break
+        while budget >= 1:
+            budget -= 1
+            sender, recipient = random.sample(online, 2)
+            sender.send({
+                CONFIGS.ACTION: CONFIGS.MESSAGE,
+                CONFIGS.FROM_USER: sender.name,
+                CONFIGS.TO_USER: recipient.name,
+                CONFIGS.TIME: time.time(),
+                CONFIGS.MESSAGE_TEXT: random.choice(payloads)
+            })
+            stats.sent += 1
+        await asyncio.sleep(tick)
+
+
+async def run_load(args, hashes, payloads, pubkey):
+    """Сопрограмма прогона: вход, отправка, ожидание доставки, итоги."""
+    stats = LoadStats()
+    users = [VirtualUser(name, passwd_hash, stats)
+             for name, passwd_hash in hashes.items()]
+    await connect_users(users, args, pubkey, stats)
+    print(f'Вошли {stats.logged_in} из {len(users)} пользователей.')
+    # Задержки считаем только для сообщений этого прогона
+    stats.started = time.time()
+    await send_messages(users, args, payloads, stats)
+    # Ждём доставки отправленных сообщений
+    wait_until = time.monotonic() + args.drain
+    while stats.delivered + sum(
+            count for kind, count in stats.errors.items()
+            if kind.startswith('response')) < stats.sent and \
+            time.monotonic() < wait_until:
+        await asyncio.sleep(0.05)
+    stats.finished = time.time()
+    for user in users:
+        user.close()
+    await asyncio.sleep(0.1)
+    return stats.report()
+
+
+def arg_parser(argv=None):
+    """Парсер аргументов командной строки генератора нагрузки."""
+    parser = argparse.ArgumentParser(
+        description='messenger load generator')
+    parser.add_argument('-a', '--addr', type=str,
+                        default=CONFIGS.DEFAULT_IP_ADDRESS,
+                        help='server ip address')
+    parser.add_argument('-p', '--port', type=int,
+                        default=CONFIGS.DEFAULT_PORT, help='tcp-port')
+    parser.add_argument('-u', '--users', type=int, default=100,
+                        help='number of virtual users')
+    parser.add_argument('-r', '--rate', type=float, default=100,
+                        help='messages per second, all users together')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='seconds of sending')
+    parser.add_argument('--database', type=str, default=None,
+                        help='server database to register users in')
+    parser.add_argument('--prefix', type=str, default='load',
+                        help='user name prefix')
+    parser.add_argument('--password', type=str, default='123456')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='simultaneous logins')
+    parser.add_argument('--connect_rate', type=float, default=0,
+                        help='logins per second (0 - unlimited)')
+    parser.add_argument('--payloads', type=int, default=32,
+                        help='distinct pre-encrypted message texts')
+    parser.add_argument('--drain', type=float, default=5,
+                        help='seconds to wait for in-flight messages')
+    parser.add_argument('--json', type=str, default=None,
+                        help='write the report to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Основная функция генератора нагрузки."""
+    args = arg_parser(argv)
+    names = [f'{args.prefix}{index}' for index in range(args.users)]
+    print(f'Хэширование паролей {len(names)} пользователей...')
+    hashes = password_hashes(names, args.password)
+    if args.database:
+        added = register_users(args.database, hashes)
+        print(f'Зарегистрировано новых пользователей: {added}.')
+
+    # Один ключ на всех: генерация тысяч ключей RSA заняла бы минуты.
+    # Тексты шифруются заранее - сервер пересылает их не расшифровывая,
+    # а шифрование каждого сообщения ограничило бы частоту генератора.
+    keys = RSA.generate(2048)
+    pubkey = keys.publickey().export_key().decode('ascii')
+    encryptor = PKCS1_OAEP.new(keys.publickey())
+    payloads = [
+        base64.b64encode(encryptor.encrypt(
+            f'Сообщение нагрузки {index}'.encode('utf8'))).decode('ascii')
+        for index in range(args.payloads)]
+
+    report = asyncio.run(run_load(args, hashes, payloads, pubkey))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == '__main__':
+    main()
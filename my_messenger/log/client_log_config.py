@@ -3,6 +3,11 @@ import os
 import sys
 
 sys.path.append('../')
+from my_messenger.common.utils import get_configs
+from my_messenger.log.pipeline import CompressingFileHandler, \
+    setup_pipeline
+
+CONFIGS = get_configs()
 
 # Сообщения лога должны иметь следующий формат: "<дата-время>
 # <уровень_важности> <имя_модуля> <сообщение>"
@@ -18,13 +23,16 @@ path = os.path.join(path, 'client.log')
 steam = logging.StreamHandler(sys.stderr)
 steam.setFormatter(client_formatter)
 steam.setLevel(logging.INFO)
-log_file = logging.FileHandler(path, encoding='utf8')
+log_file = CompressingFileHandler(
+    path, when='D', interval=1, max_bytes=CONFIGS.LOG_MAX_BYTES,
+    backup_count=CONFIGS.LOG_BACKUP_COUNT)
 log_file.setFormatter(client_formatter)
 
-# создаём регистратор и настраиваем его
+# создаём регистратор и настраиваем его: запись в файл и на консоль
+# идёт в отдельном потоке через очередь
 client_logger = logging.getLogger('client')
-client_logger.addHandler(steam)
-client_logger.addHandler(log_file)
+queue_handler = setup_pipeline(
+    client_logger, (steam, log_file), CONFIGS.LOG_QUEUE_SIZE)
 client_logger.setLevel(logging.DEBUG)
 
 
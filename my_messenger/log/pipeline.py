@@ -0,0 +1,197 @@
+"""
+Асинхронный вывод логов через очередь.
+
+Логгер получает единственный обработчик - DroppingQueueHandler, который
+кладёт запись в ограниченную очередь и сразу возвращает управление.
+Запись в файл и на консоль выполняет поток QueueListener, поэтому
+server_logger.info на пути сообщения не ждёт диска и блокировки
+обработчика файла. Если очередь полна, запись отбрасывается и
+учитывается в счётчике dropped.
+
+Файл лога переключается раз в сутки или при превышении max_bytes,
+старый файл сжимается gzip в отдельном потоке, хранятся backup_count
+последних архивов. stop_pipeline дожидается сжатия, а файлы, оставшиеся
+несжатыми после аварийного завершения, сжимаются при следующем запуске.
+"""
+import atexit
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+from logging.handlers import QueueHandler, QueueListener, \
+    TimedRotatingFileHandler
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Класс - обработчик, передающий записи в ограниченную очередь.
+    При переполнении очереди запись теряется, а не блокирует вызывающий
+    поток; число потерянных записей - атрибут dropped.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Аргументы (словари сообщений) могут измениться до записи, поэтому
+        # строка собирается сразу. Время, уровень и трассировку
+        # оформляет поток записи; копия записи не нужна - других
+        # обработчиков у логгера нет.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Пишут из многих потоков, счётчик читают метрики: увеличиваем
+            # под блокировкой обработчика (RLock, handle() уже может её
+            # держать)
+            with self.lock:
+                self.dropped += 1
+
+
+class CompressingFileHandler(TimedRotatingFileHandler):
+    """
+    Класс - файл лога с ротацией по времени и по размеру.
+    Переименование файла при ротации происходит сразу, сжатие gzip и
+    удаление лишних архивов - в отдельном потоке. Потоки сжатия
+    выполняются по одному и дожидаются методом wait.
+    """
+
+    def __init__(self, filename, when='D', interval=1, max_bytes=0,
+                 backup_count=0, encoding='utf8'):
+        # Архивы удаляются по backup_count здесь, а не в предке: имена
+        # архивов предок не распознаёт
+        super().__init__(filename, when=when, interval=interval,
+                         encoding=encoding)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.namer = self.unique_name
+        self.rotator = self.rotate_and_compress
+        # Запущенные потоки сжатия и блокировка, по которой они
+        # выполняются по очереди (удаление старых архивов не пересекается)
+        self.compressors = []
+        self.compress_lock = threading.Lock()
+        self.recover()
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes and self.stream is not None:
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    @staticmethod
+    def unique_name(default_name):
+        """
+        Метод выбора имени архива: при нескольких ротациях за один
+        период к имени добавляется номер, архивы не перезаписываются.
+        """
+        name = default_name
+        number = 0
+        while os.path.exists(name) or os.path.exists(name + '.gz'):
+            number += 1
+            name = f'{default_name}.{number}'
+        return name
+
+    def rotate_and_compress(self, source, dest):
+        if not os.path.exists(source):
+            return
+        os.rename(source, dest)
+        self._start_compress([dest])
+
+    def _start_compress(self, paths):
+        """Метод запуска потока сжатия файлов paths."""
+        self.compressors = [thread for thread in self.compressors
+                            if thread.is_alive()]
+        thread = threading.Thread(target=self.compress, args=paths,
+                                  name='log-compress', daemon=True)
+        self.compressors.append(thread)
+        thread.start()
+
+    def wait(self, timeout=None):
+        """Метод ожидания завершения запущенных потоков сжатия."""
+        for thread in self.compressors:
+            thread.join(timeout)
+
+    def recover(self):
+        """
+        Метод обработки файлов, оставшихся от прерванного сжатия:
+        недописанные архивы (.gz.tmp) удаляются, несжатые старые файлы
+        лога сжимаются заново.
+        """
+        pending = []
+        for path in self._rotated():
+            if path.endswith('.gz.tmp'):
+                os.remove(path)
+            elif not path.endswith('.gz'):
+                pending.append(path)
+        if pending:
+            self._start_compress(pending)
+
+    def compress(self, *paths):
+        """Метод сжатия файлов лога и удаления старых архивов."""
+        with self.compress_lock:
+            for path in paths:
+                with open(path, 'rb') as source, \
+                        gzip.open(path + '.gz.tmp', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(path + '.gz.tmp', path + '.gz')
+                os.remove(path)
+            if self.backup_count:
+                for old in self.archives()[:-self.backup_count]:
+                    os.remove(old)
+
+    def _rotated(self):
+        """Метод получения путей всех старых файлов этого лога."""
+        directory, name = os.path.split(self.baseFilename)
+        return [os.path.join(directory, file_name)
+                for file_name in os.listdir(directory)
+                if file_name.startswith(name + '.')]
+
+    def archives(self):
+        """Метод получения архивов этого лога от старых к новым."""
+        paths = [path for path in self._rotated() if path.endswith('.gz')]
+        return sorted(paths, key=os.path.getmtime)
+
+
+def setup_pipeline(logger, handlers, queue_size):
+    """
+    Функция подключения обработчиков handlers к логгеру через очередь
+    размером queue_size. Поток записи останавливается (с выводом
+    оставшихся записей) при завершении процесса.
+    :return: DroppingQueueHandler логгера.
+    """
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    listener = QueueListener(
+        queue_handler.queue, *handlers, respect_handler_level=True)
+    queue_handler.listener = listener
+    logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(stop_pipeline, queue_handler, handlers)
+    return queue_handler
+
+
+def stop_pipeline(queue_handler, handlers):
+    """
+    Функция остановки потока записи с отчётом о потерянных записях.
+    Дожидается сжатия старых файлов лога, иначе при выходе из процесса
+    оно прервётся.
+    """
+    queue_handler.listener.stop()
+    for handler in handlers:
+        if isinstance(handler, CompressingFileHandler):
+            handler.wait()
+    if queue_handler.dropped:
+        record = logging.makeLogRecord({
+            'name': 'log', 'levelno': logging.WARNING,
+            'levelname': 'WARNING', 'module': 'pipeline',
+            'msg': f'Очередь лога была переполнена, потеряно записей: '
+                   f'{queue_handler.dropped}'})
+        for handler in handlers:
+            handler.handle(record)
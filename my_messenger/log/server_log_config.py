@@ -1,9 +1,13 @@
 import logging
 import os
 import sys
-from logging.handlers import TimedRotatingFileHandler
 
 sys.path.append('../')
+from my_messenger.common.utils import get_configs
+from my_messenger.log.pipeline import CompressingFileHandler, \
+    setup_pipeline
+
+CONFIGS = get_configs()
 
 # Сообщения лога должны иметь следующий формат: "<дата-время>
 # <уровень_важности> <имя_модуля> <сообщение>"
@@ -19,18 +23,20 @@ path = os.path.join(path, 'server.log')
 steam = logging.StreamHandler(sys.stderr)
 steam.setFormatter(server_formatter)
 steam.setLevel(logging.INFO)
-# На стороне сервера необходимо настроить ежедневную ротацию лог-файлов.
-log_file = logging.handlers.TimedRotatingFileHandler(
-    path, encoding='utf8', interval=1, when='D')
+# На стороне сервера необходимо настроить ежедневную ротацию лог-файлов,
+# а также ротацию по размеру; старые файлы сжимаются.
+log_file = CompressingFileHandler(
+    path, when='D', interval=1, max_bytes=CONFIGS.LOG_MAX_BYTES,
+    backup_count=CONFIGS.LOG_BACKUP_COUNT)
 log_file.setFormatter(server_formatter)
 
 # Создание именованного логгера
 server_logger = logging.getLogger('server')
 
-# Добавляем в логгер новый обработчик событий и устанавливаем уровень
-# логирования
-server_logger.addHandler(steam)
-server_logger.addHandler(log_file)
+# Обработчики пишут в отдельном потоке, логгер только ставит записи в
+# очередь; устанавливаем уровень логирования
+queue_handler = setup_pipeline(
+    server_logger, (steam, log_file), CONFIGS.LOG_QUEUE_SIZE)
 server_logger.setLevel(logging.DEBUG)
 
 if __name__ == '__main__':
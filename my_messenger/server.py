@@ -1,108 +1,9 @@
-import argparse
-import configparser
-import os
-import sys
-
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import Qt
-
-from common.utils import get_configs
-from common.decorators import log
-from log.server_log_config import server_logger
-from server.core import MessageProcessor
-from server.database import ServerStorage
-from server.main_window import MainWindow
-
-CONFIGS = get_configs()
-
-
-@log
-def arg_parser(default_port, default_address):
-    """Парсер аргументов коммандной строки."""
-    server_logger.debug(
-        f'Инициализация парсера аргументов коммандной строки: {sys.argv}')
-    parser = argparse.ArgumentParser(
-        description='command line server parameters')
-    parser.add_argument('-a', '--addr', type=str,
-                        default=default_address, help='ip address')
-    parser.add_argument('-p', '--port', type=int,
-                        default=default_port, help='tcp-port')
-    parser.add_argument('--no_gui', action='store_true')
-    args = parser.parse_args()
-    listen_address = args.addr
-    listen_port = args.port
-    gui_flag = args.no_gui
-    server_logger.debug('Аргументы успешно загружены.')
-    return listen_address, listen_port, gui_flag
-
-
-@log
-def config_load():
-    """Парсер конфигурационного ini файла."""
-    config = configparser.ConfigParser()
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    config.read(f"{dir_path}/{'server.ini'}")
-    # Если конфиг файл загружен правильно, запускаемся, иначе конфиг по
-    # умолчанию.
-    if 'SETTINGS' in config:
-        return config
-    else:
-        config.add_section('SETTINGS')
-        config.set('SETTINGS', 'Default_port',
-                   str(CONFIGS.get('DEFAULT_PORT')))
-        config.set('SETTINGS', 'Listen_Address', '')
-        config.set('SETTINGS', 'Database_path', '')
-        config.set('SETTINGS', 'Database_file', 'server_database.db3')
-        return config
-
-
-@log
-def main():
-    """Основная функция"""
-    # Загрузка файла конфигурации сервера
-    config = config_load()
-
-    # Загрузка параметров командной строки, если нет параметров, то задаём
-    # значения по умоланию.
-    listen_address, listen_port, gui_flag = arg_parser(
-        config['SETTINGS']['Default_port'],
-        config['SETTINGS']['Listen_Address'])
-
-    # Инициализация базы данных
-    database = ServerStorage(
-        os.path.join(
-            config['SETTINGS']['Database_path'],
-            config['SETTINGS']['Database_file']))
-
-    # Создание экземпляра класса - сервера и его запуск:
-    server = MessageProcessor(listen_address, listen_port, database)
-    server.daemon = True
-    server.start()
-
-    # Если  указан параметр без GUI то запускаем простенький обработчик
-    # консольного ввода
-    if gui_flag:
-        while True:
-            command = input('Введите exit для завершения работы сервера.')
-            if command == 'exit':
-                # Если выход, то завршаем основной цикл сервера.
-                server.running = False
-                server.join()
-                break
-
-    # Если не указан запуск без GUI, то запускаем GUI:
-    else:
-        # Создаём графическое окуружение для сервера:
-        server_app = QApplication(sys.argv)
-        server_app.setAttribute(Qt.AA_DisableWindowContextHelpButton)
-        main_window = MainWindow(database, server, config)
-
-        # Запускаем GUI
-        server_app.exec_()
-
-        # По закрытию окон останавливаем обработчик сообщений
-        server.running = False
-
+"""
+Запуск сервера: python server.py [--no_gui]. Аргументы и режимы описаны
+в server/cli.py, без GUI сервер можно запустить и как
+python -m my_messenger.server --no-gui.
+"""
+from my_messenger.server.cli import main
 
 if __name__ == '__main__':
     main()
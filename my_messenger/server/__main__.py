@@ -0,0 +1,7 @@
+"""
+Точка входа python -m my_messenger.server [--no-gui].
+"""
+from my_messenger.server.cli import main
+
+if __name__ == '__main__':
+    main()
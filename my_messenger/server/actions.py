@@ -0,0 +1,80 @@
+from my_messenger.common.utils import get_configs
+
+CONFIGS = get_configs()
+
+
+class Action:
+    """
+    Класс - описание действия протокола: обработчик и заранее
+    разрешённая схема обязательных полей сообщения.
+    """
+    __slots__ = ('name', 'handler', 'required', 'owner', 'nested')
+
+    def __init__(self, name, handler, required, owner, nested=()):
+        self.name = name
+        self.handler = handler
+        # Имена полей уже взяты из конфигурации, проверка - операция над
+        # множеством ключей словаря
+        self.required = frozenset(required)
+        # Поле, в котором клиент указывает своё имя (или None)
+        self.owner = owner
+        # Вложенные словари: пары (поле, множество обязательных ключей)
+        self.nested = tuple(
+            (field, frozenset(keys)) for field, keys in nested)
+
+    def accepts(self, message, username):
+        """
+        Метод проверки сообщения: все обязательные поля на месте,
+        вложенные поля - словари с обязательными ключами и, если задано
+        поле владельца, в нём имя текущего пользователя.
+        """
+        if not self.required <= message.keys():
+            return False
+        for field, keys in self.nested:
+            value = message.get(field)
+            if not isinstance(value, dict) or not keys <= value.keys():
+                return False
+        return self.owner is None or message[self.owner] == username
+
+
+class ActionRegistry:
+    """
+    Класс - реестр действий протокола: имя действия -> Action.
+    Обработчики регистрируются декоратором register, поэтому новое
+    действие добавляется без изменения кода разбора сообщений.
+    """
+
+    def __init__(self, actions=None):
+        self.actions = dict(actions or {})
+
+    def register(self, action, required=(), owner=None, nested=None):
+        """
+        Декоратор регистрации обработчика.
+        :param action: ключ конфигурации с именем действия ('MESSAGE').
+        :param required: ключи конфигурации обязательных полей.
+        :param owner: ключ конфигурации поля с именем отправителя.
+        :param nested: словарь поле -> ключи конфигурации обязательных
+        полей вложенного словаря ({'USER': ('ACCOUNT_NAME',)}).
+        """
+        def decorator(handler):
+            name = CONFIGS.get(action)
+            self.actions[name] = Action(
+                name,
+                handler,
+                [CONFIGS.get(key) for key in required],
+                CONFIGS.get(owner) if owner else None,
+                [(CONFIGS.get(field), [CONFIGS.get(key) for key in keys])
+                 for field, keys in (nested or {}).items()])
+            return handler
+
+        return decorator
+
+    def copy(self):
+        """Метод создания независимой копии реестра (для наследников)."""
+        return ActionRegistry(self.actions)
+
+    def get(self, name):
+        return self.actions.get(name)
+
+    def __contains__(self, name):
+        return name in self.actions
@@ -0,0 +1,671 @@
+import asyncio
+import binascii
+import hmac
+import json
+import os
+import threading
+import time
+
+from my_messenger.common.answers import RESPONSE_200, RESPONSE_400, \
+    RESPONSE_202, RESPONSE_511, RESPONSE_205, RESPONSE_429
+from my_messenger.common.descryptors import Port
+from my_messenger.common.errors import IncorrectDataReceivedError
+from my_messenger.common.framing import FRAME_HEADER, FRAME_VERSION, \
+    encode_message, frame_payload
+from my_messenger.common.utils import get_configs
+from my_messenger.log.server_log_config import server_logger
+from my_messenger.server.actions import Action, ActionRegistry
+from my_messenger.server.core import CLIENT_ERRORS, raise_open_files_limit
+from my_messenger.server.groups import GroupIndex, MEMBERSHIP_ACTIONS
+from my_messenger.server.limits import Limits
+from my_messenger.server.metrics import REGISTRY, ACTION_SECONDS, \
+    BYTES_RECEIVED, BYTES_SENT
+from my_messenger.server.outbound import DROP
+
+CONFIGS = get_configs()
+
+# Схема приветствия: как у PRESENCE в реестре движка с селектором,
+# имя и открытый ключ во вложенном USER обязательны
+PRESENCE = Action(
+    CONFIGS.PRESENCE, None,
+    (CONFIGS.ACTION, CONFIGS.TIME, CONFIGS.USER), None,
+    ((CONFIGS.USER, (CONFIGS.ACCOUNT_NAME, CONFIGS.PUBLIC_KEY)),))
+
+
+class AsyncMessageProcessor(threading.Thread):
+    """
+    Асинхронная реализация сервера на asyncio.
+    Каждое соединение обслуживается отдельной сопрограммой, поэтому
+    медленные клиенты и обмен при авторизации не задерживают остальных.
+    Интерфейс совпадает с MessageProcessor (start, stop, names,
+    service_update_lists, disconnect_user), поэтому с ним работает и GUI.
+    """
+    port = Port()
+
+    def __init__(self, listen_address, listen_port, database, limits=None):
+        # параментры подключения
+        self.addr = listen_address
+        self.port = listen_port
+
+        # база данных сервера
+        self.database = database
+
+        # Ограничения частоты запросов и допуска соединений
+        self.limits = limits if limits is not None else Limits.from_config()
+        self._too_many_frame = encode_message(
+            RESPONSE_429, CONFIGS.ENCODING)
+
+        # Цикл событий и объект сервера asyncio, создаются в run
+        self.loop = None
+        self.server = None
+        self._stop_event = None
+
+        # Флаг продолжения работы
+        self.running = True
+
+        # Отложенная рассылка 205 (None - рассылка не запланирована)
+        self._update_lists_handle = None
+
+        # словарь, содержащий имена пользователей и их StreamWriter.
+        self.names = dict()
+
+        # Участники групповых чатов: имя группы -> множество имён
+        self.groups = GroupIndex.load(database)
+
+        # Все открытые соединения: StreamWriter -> задача обслуживания
+        self.connections = dict()
+
+        # Кадры, отброшенные по политике drop для медленных клиентов
+        self.dropped = 0
+
+        self._register_metrics()
+
+        # конструктор предка (по имени поток выбирает профилировщик)
+        super().__init__(name='message-processor')
+
+    def _register_metrics(self):
+        """Метод регистрации метрик состояния (как в MessageProcessor)."""
+        self._action_seconds = {
+            name: ACTION_SECONDS.labels(name) for name in self.actions.actions}
+        REGISTRY.gauge(
+            'messenger_connections', 'Открытые соединения клиентов.',
+            func=lambda: len(self.connections))
+        REGISTRY.gauge(
+            'messenger_authenticated_sessions',
+            'Авторизованные пользователи.', func=lambda: len(self.names))
+        REGISTRY.gauge(
+            'messenger_outbound_queue_bytes',
+            'Байт в исходящих очередях всех клиентов.',
+            func=lambda: sum(self._write_buffer_sizes()))
+        REGISTRY.gauge(
+            'messenger_outbound_queue_max_bytes',
+            'Самая длинная исходящая очередь клиента, байт.',
+            func=lambda: max(self._write_buffer_sizes(), default=0))
+        REGISTRY.counter(
+            'messenger_rate_limited_requests_total',
+            'Запросы, отклонённые по лимиту частоты.',
+            func=lambda: self.limits.rejected_requests)
+        REGISTRY.counter(
+            'messenger_rejected_connections_total',
+            'Соединения, отклонённые при допуске.',
+            func=lambda: self.limits.rejected_connections)
+
+    def _write_buffer_sizes(self):
+        """Метод возвращающий размеры буферов записи транспортов."""
+        return [writer.transport.get_write_buffer_size()
+                for writer in list(self.connections)]
+
+    def run(self):
+        """Метод - запуск цикла событий в потоке сервера."""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """Сопрограмма, принимающая соединения до вызова stop."""
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if not self.running:
+            self._stop_event.set()
+
+        server_logger.info(
+            f'Запущен asyncio сервер, порт для подключений: {self.port} ,'
+            f' адрес с которого принимаются подключения: {self.addr}.'
+            f' Если адрес не указан, принимаются соединения с любых адресов.')
+        raise_open_files_limit()
+
+        self.server = await asyncio.start_server(
+            self.handle_connection,
+            self.addr,
+            self.port,
+            backlog=CONFIGS.LISTEN_BACKLOG)
+        self.loop.call_later(
+            CONFIGS.RATE_LIMIT_PURGE_INTERVAL, self._purge_limits)
+        async with self.server:
+            await self._stop_event.wait()
+            self.server.close()
+            # Закрываем соединения: сопрограммы клиентов получат EOF и
+            # завершатся штатно, отметив выход пользователей.
+            for writer in list(self.connections):
+                writer.close()
+            await asyncio.gather(
+                *self.connections.values(), return_exceptions=True)
+
+    def _purge_limits(self):
+        """Освобождение неактивных корзин лимитов, раз в интервал."""
+        self.limits.purge()
+        self.loop.call_later(
+            CONFIGS.RATE_LIMIT_PURGE_INTERVAL, self._purge_limits)
+
+    def stop(self):
+        """Метод останавливающий сервер. Безопасен из любого потока."""
+        self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def read_message(self, reader, timeout=None):
+        """
+        Сопрограмма приёма кадра с сообщением от клиента.
+        Возвращает словарь или None, если клиент закрыл соединение.
+        :param timeout: время ожидания начала кадра (asyncio.TimeoutError).
+        Начатый кадр должен прийти целиком за IDLE_TIMEOUT.
+        """
+        try:
+            header = await asyncio.wait_for(
+                reader.readexactly(FRAME_HEADER.size), timeout)
+        except asyncio.IncompleteReadError:
+            return None
+        version, length = FRAME_HEADER.unpack(header)
+        if version != FRAME_VERSION or \
+                length > CONFIGS.MAX_FRAME_LENGTH:
+            raise IncorrectDataReceivedError
+        try:
+            payload = await asyncio.wait_for(
+                reader.readexactly(length), CONFIGS.IDLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise IncorrectDataReceivedError
+        BYTES_RECEIVED.inc(FRAME_HEADER.size + length)
+        message = json.loads(payload.decode(CONFIGS.ENCODING))
+        if isinstance(message, dict):
+            return message
+        raise IncorrectDataReceivedError
+
+    async def next_message(self, reader, writer, username):
+        """
+        Сопрограмма ожидания следующего сообщения клиента.
+        До авторизации ждёт не дольше AUTH_TIMEOUT. Авторизованному
+        клиенту, молчащему PING_INTERVAL секунд, отправляет ping; если
+        ничего не пришло и к IDLE_TIMEOUT - asyncio.TimeoutError.
+        """
+        if username is None:
+            return await self.read_message(
+                reader, CONFIGS.AUTH_TIMEOUT)
+        try:
+            return await self.read_message(
+                reader, CONFIGS.PING_INTERVAL)
+        except asyncio.TimeoutError:
+            self.send(writer, {CONFIGS.ACTION: CONFIGS.PING})
+            await writer.drain()
+        return await self.read_message(
+            reader,
+            CONFIGS.IDLE_TIMEOUT - CONFIGS.PING_INTERVAL)
+
+    def write(self, writer, data):
+        """
+        Метод записи закодированного кадра в буфер транспорта клиента.
+        Если в буфере больше OUTBOUND_HIGH_WATERMARK байт (клиент не
+        успевает принимать), применяется политика SLOW_CONSUMER_POLICY:
+        drop - кадр отбрасывается, иначе соединение закрывается (сброс
+        на диск, spill, движок asyncio не поддерживает).
+        :return: False, если кадр не записан.
+        """
+        transport = writer.transport
+        if transport.is_closing():
+            return False
+        queued = transport.get_write_buffer_size()
+        if queued and queued + len(data) > CONFIGS.OUTBOUND_HIGH_WATERMARK:
+            if CONFIGS.SLOW_CONSUMER_POLICY == DROP:
+                self.dropped += 1
+                return False
+            server_logger.warning(
+                f'Клиент {writer.get_extra_info("peername")} не успевает '
+                f'принимать данные ({queued} байт в очереди), '
+                f'соединение закрыто.')
+            # abort, а не close: накопленный буфер не дописывается
+            transport.abort()
+            return False
+        self._write(writer, data)
+        return True
+
+    @staticmethod
+    def _write(writer, data):
+        """Метод записи кадра в буфер транспорта без проверки политики."""
+        writer.write(data)
+        BYTES_SENT.inc(len(data))
+
+    def send(self, writer, message):
+        """Метод записи сообщения в буфер транспорта клиента."""
+        self.write(writer, encode_message(message, CONFIGS.ENCODING))
+
+    async def handle_connection(self, reader, writer):
+        """Сопрограмма, обслуживающая одно соединение клиента."""
+        if not self.limits.admit(len(self.connections)):
+            server_logger.debug(
+                f'Соединение с {writer.get_extra_info("peername")} '
+                f'отклонено: превышен лимит подключений.')
+            writer.close()
+            return
+        server_logger.info(
+            f'Установлено соединение с: '
+            f'{writer.get_extra_info("peername")}')
+        username = None
+        self.connections[writer] = asyncio.current_task()
+        # drain ждёт, пока буфер не опустится до нижней границы
+        writer.transport.set_write_buffer_limits(
+            CONFIGS.OUTBOUND_HIGH_WATERMARK,
+            CONFIGS.OUTBOUND_LOW_WATERMARK)
+        try:
+            while self.running:
+                message = await self.next_message(reader, writer, username)
+                if message is None:
+                    break
+                server_logger.debug(
+                    f'Обработка сообщения от клиента: {message}')
+                # До авторизации принимается только сообщение о присутствии
+                if username is None:
+                    if not self.limits.allow(
+                            message.get(CONFIGS.ACTION), None,
+                            writer.get_extra_info('peername')[0]):
+                        self.write(writer, self._too_many_frame)
+                        await writer.drain()
+                        break
+                    username = await self.authorize_user(
+                        message, reader, writer)
+                    if username is None:
+                        break
+                    await self.deliver_offline(writer, username)
+                elif not self.process_client_message(
+                        message, writer, username):
+                    break
+                await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                *CLIENT_ERRORS) as err:
+            server_logger.debug(
+                f'Getting data from client exception',
+                exc_info=err
+            )
+        finally:
+            self.remove_client(writer, username)
+
+    def remove_client(self, writer, username):
+        """Метод закрывающий соединение и отмечающий выход пользователя."""
+        server_logger.info(
+            f'Клиент {writer.get_extra_info("peername")} '
+            f'отключился от сервера')
+        if username is not None and self.names.get(username) is writer:
+            self.database.user_logout(username)
+            del self.names[username]
+        self.connections.pop(writer, None)
+        writer.close()
+
+    async def authorize_user(self, message, reader, writer):
+        """
+        Сопрограмма авторизации пользователя.
+        Возвращает имя пользователя или None, если авторизация не пройдена.
+        """
+        # Схема проверяется до обращения к names: ошибка в середине
+        # авторизации оставила бы имя занятым
+        if message.get(CONFIGS.ACTION) != CONFIGS.PRESENCE or \
+                not PRESENCE.accepts(message, None):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Запрос некорректен.'
+            self.send(writer, response)
+            await writer.drain()
+            return None
+        name = message[CONFIGS.USER][CONFIGS.ACCOUNT_NAME]
+        server_logger.debug(f'Start auth process for {name}')
+
+        # Если имя пользователя уже занято то возвращаем 400
+        if name in self.names:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Имя пользователя уже занято.'
+            self.send(writer, response)
+            await writer.drain()
+            return None
+
+        # Проверяем что пользователь зарегистрирован на сервере.
+        if not self.database.check_user(name):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Пользователь не зарегистрирован.'
+            self.send(writer, response)
+            await writer.drain()
+            return None
+
+        # Отвечаем 511 со случайной строкой и ждём от клиента её HMAC
+        message_auth = RESPONSE_511
+        random_str = binascii.hexlify(os.urandom(64))
+        message_auth[CONFIGS.DATA] = random_str.decode('ascii')
+        digest = hmac.new(
+            self.database.get_hash(name), random_str, 'MD5').digest()
+        self.send(writer, message_auth)
+        await writer.drain()
+        ans = await asyncio.wait_for(
+            self.read_message(reader), CONFIGS.AUTH_TIMEOUT)
+        if ans is None:
+            return None
+        try:
+            client_digest = binascii.a2b_base64(ans[CONFIGS.DATA])
+        except (binascii.Error, KeyError, TypeError):
+            # Некорректный ответ - как неверный пароль: 400 и отключение
+            client_digest = b''
+
+        # Пока шёл обмен, под этим именем мог войти другой клиент
+        if ans.get(CONFIGS.RESPONSE) == 511 and \
+                hmac.compare_digest(digest, client_digest) and \
+                name not in self.names:
+            self.names[name] = writer
+            client_ip, client_port = writer.get_extra_info('peername')[:2]
+            self.database.user_login(
+                name,
+                client_ip,
+                client_port,
+                message[CONFIGS.USER][CONFIGS.PUBLIC_KEY])
+            self.send(writer, RESPONSE_200)
+            return name
+
+        response = RESPONSE_400
+        response[CONFIGS.ERROR] = 'Неверный пароль.'
+        self.send(writer, response)
+        await writer.drain()
+        return None
+
+    async def deliver_offline(self, writer, username):
+        """
+        Сопрограмма доставки сообщений, накопленных пока пользователь был
+        отключён. Сообщения читаются порциями по OFFLINE_BATCH; следующая
+        порция - после отправки предыдущей, так память ограничена.
+        """
+        # Дожидаемся записи сообщений, сохранённых до входа
+        await self.loop.run_in_executor(None, self.database.flush)
+        cursor = 0
+        while True:
+            rows = self.database.get_offline(
+                username, cursor, CONFIGS.OFFLINE_BATCH)
+            if not rows:
+                break
+            # Порция ограничена OFFLINE_BATCH и дописывается до следующей,
+            # поэтому политика медленного клиента к ней не применяется
+            for row_id, payload in rows:
+                self._write(writer, frame_payload(
+                    payload.encode(CONFIGS.ENCODING)))
+            cursor = rows[-1][0]
+            await writer.drain()
+            self.database.delete_offline(username, cursor)
+
+    def process_client_message(self, message, writer, username):
+        """
+        Метод - обработчик сообщений авторизованного клиента.
+        Возвращает False, если соединение нужно закрыть.
+        """
+        action = self.actions.get(message.get(CONFIGS.ACTION))
+        if action is None or not action.accepts(message, username):
+            # иначе отдаём Bad request
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Запрос некорректен.'
+            self.send(writer, response)
+            return True
+        if not self.limits.allow(
+                action.name, username, writer.get_extra_info('peername')[0]):
+            self.write(writer, self._too_many_frame)
+            return True
+        start = time.perf_counter()
+        result = action.handler(self, message, writer, username)
+        self._action_seconds[action.name].observe(
+            time.perf_counter() - start)
+        return result is not False
+
+    # Реестр действий протокола (presence обрабатывает authorize_user)
+    actions = ActionRegistry()
+
+    # Если это сообщение, то отправляем его получателю.
+    @actions.register(
+        'MESSAGE',
+        required=('TO_USER', 'TIME', 'FROM_USER', 'MESSAGE_TEXT'),
+        owner='FROM_USER')
+    def _on_message(self, message, writer, username):
+        recipient = message[CONFIGS.TO_USER]
+        if recipient in self.names:
+            self.database.process_message(username, recipient)
+            self.send(self.names[recipient], message)
+            server_logger.info(
+                f'Отправлено сообщение пользователю {recipient} '
+                f'от пользователя {username}.')
+            self.send(writer, RESPONSE_200)
+        elif self.database.check_user(recipient):
+            # Получатель не в сети - сохраняем сообщение до его входа
+            self.database.process_message(username, recipient)
+            self.database.store_offline(recipient, json.dumps(message))
+            self.send(writer, RESPONSE_200)
+        else:
+            response = RESPONSE_400
+            response[CONFIGS.get(
+                'ERROR')] = 'Пользователь не зарегистрирован на сервере.'
+            self.send(writer, response)
+
+    # ответ клиента на проверку связи
+    @actions.register('PONG')
+    def _on_pong(self, message, writer, username):
+        pass
+
+    # если клиент выходит
+    @actions.register('EXIT', required=('ACCOUNT_NAME',),
+                      owner='ACCOUNT_NAME')
+    def _on_exit(self, message, writer, username):
+        return False
+
+    def publish_group(self, message):
+        """
+        Метод рассылки сообщения или уведомления подключённым участникам
+        группы, кроме автора. Сообщение кодируется один раз.
+        """
+        if message[CONFIGS.ACTION] in MEMBERSHIP_ACTIONS:
+            self.groups.apply(message)
+            author = message[CONFIGS.ACCOUNT_NAME]
+        else:
+            author = message[CONFIGS.FROM_USER]
+        members = self.groups.get(message[CONFIGS.GROUP])
+        data = None
+        for name in members:
+            member_writer = self.names.get(name)
+            if member_writer is None or name == author:
+                continue
+            if data is None:
+                data = encode_message(message, CONFIGS.ENCODING)
+            self.write(member_writer, data)
+
+    @staticmethod
+    def _group_event(action, group, username):
+        """Уведомление участникам группы об изменении её состава."""
+        return {
+            CONFIGS.ACTION: CONFIGS.get(action),
+            CONFIGS.TIME: time.time(),
+            CONFIGS.GROUP: group,
+            CONFIGS.ACCOUNT_NAME: username
+        }
+
+    # Групповые чаты: сервер хранит состав групп и зашифрованные для
+    # участников ключи групп, тексты пересылает без изменений.
+    @actions.register('CREATE_GROUP', required=('GROUP', 'USER'),
+                      owner='USER')
+    def _on_create_group(self, message, writer, username):
+        group = message[CONFIGS.GROUP]
+        if not isinstance(group, str) or not group or group in self.groups:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Группа уже существует.'
+            self.send(writer, response)
+            return
+        self.database.create_group(
+            group, username, message.get(CONFIGS.DATA))
+        self.publish_group(self._group_event('CREATE_GROUP', group, username))
+        self.send(writer, RESPONSE_200)
+
+    @actions.register('JOIN_GROUP', required=('GROUP', 'USER'),
+                      owner='USER')
+    def _on_join_group(self, message, writer, username):
+        group = message[CONFIGS.GROUP]
+        if group not in self.groups:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Группа не найдена.'
+            self.send(writer, response)
+            return
+        if not self.groups.is_member(group, username):
+            self.database.add_group_member(group, username)
+            self.publish_group(
+                self._group_event('JOIN_GROUP', group, username))
+        self.send(writer, {
+            **RESPONSE_202,
+            CONFIGS.LIST_INFO: sorted(self.groups.get(group)),
+            CONFIGS.DATA: self.database.get_group_key(group, username)
+        })
+
+    @actions.register('LEAVE_GROUP', required=('GROUP', 'USER'),
+                      owner='USER')
+    def _on_leave_group(self, message, writer, username):
+        group = message[CONFIGS.GROUP]
+        if not self.groups.is_member(group, username):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Вы не участник группы.'
+            self.send(writer, response)
+            return
+        self.database.remove_group_member(group, username)
+        self.publish_group(self._group_event('LEAVE_GROUP', group, username))
+        self.send(writer, RESPONSE_200)
+
+    @actions.register(
+        'GROUP_MESSAGE',
+        required=('GROUP', 'TIME', 'FROM_USER', 'MESSAGE_TEXT'),
+        owner='FROM_USER')
+    def _on_group_message(self, message, writer, username):
+        if not self.groups.is_member(message[CONFIGS.GROUP], username):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Вы не участник группы.'
+            self.send(writer, response)
+            return
+        self.publish_group(message)
+        self.send(writer, RESPONSE_200)
+
+    @actions.register('GROUP_KEY',
+                      required=('GROUP', 'USER', 'ACCOUNT_NAME', 'DATA'),
+                      owner='USER')
+    def _on_group_key(self, message, writer, username):
+        group = message[CONFIGS.GROUP]
+        member = message[CONFIGS.ACCOUNT_NAME]
+        if not self.groups.is_member(group, username) or \
+                not self.groups.is_member(group, member):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Вы не участник группы.'
+            self.send(writer, response)
+            return
+        self.database.set_group_key(
+            group, member, message[CONFIGS.DATA])
+        notice = {
+            CONFIGS.ACTION: CONFIGS.GROUP_KEY,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.GROUP: group,
+            CONFIGS.FROM_USER: username,
+            CONFIGS.TO_USER: member,
+            CONFIGS.DATA: message[CONFIGS.DATA]
+        }
+        if member in self.names:
+            self.send(self.names[member], notice)
+        else:
+            self.database.store_offline(member, json.dumps(notice))
+        self.send(writer, RESPONSE_200)
+
+    # если это запрос контакт-листа
+    @actions.register('GET_CONTACTS', required=('USER',), owner='USER')
+    def _on_get_contacts(self, message, writer, username):
+        response = RESPONSE_202
+        response[CONFIGS.LIST_INFO] = \
+            self.database.get_contacts(username)
+        self.send(writer, response)
+
+    # если это добавление контакта
+    @actions.register('ADD_CONTACT', required=('ACCOUNT_NAME', 'USER'),
+                      owner='USER')
+    def _on_add_contact(self, message, writer, username):
+        self.database.add_contact(
+            username, message[CONFIGS.ACCOUNT_NAME])
+        self.send(writer, RESPONSE_200)
+
+    # если это удаление контакта
+    @actions.register('REMOVE_CONTACT', required=('ACCOUNT_NAME', 'USER'),
+                      owner='USER')
+    def _on_remove_contact(self, message, writer, username):
+        self.database.remove_contact(
+            username, message[CONFIGS.ACCOUNT_NAME])
+        self.send(writer, RESPONSE_200)
+
+    # если это запрос известных пользователей
+    @actions.register('USERS_REQUEST', required=('ACCOUNT_NAME',),
+                      owner='ACCOUNT_NAME')
+    def _on_users_request(self, message, writer, username):
+        version = self.database.directory_version
+        self.send(writer, {
+            **RESPONSE_202,
+            CONFIGS.LIST_INFO:
+                [user[0] for user in self.database.users_list()],
+            CONFIGS.DIRECTORY_VERSION: version
+        })
+
+    # Если это запрос публичного ключа пользователя
+    @actions.register('PUBLIC_KEY_REQUEST', required=('ACCOUNT_NAME',))
+    def _on_public_key_request(self, message, writer, username):
+        pubkey = self.database.get_pubkey(
+            message[CONFIGS.ACCOUNT_NAME])
+        # может быть, что ключа ещё нет (пользователь никогда не логинился,
+        # тогда шлём 400)
+        if pubkey:
+            response = RESPONSE_511
+            response[CONFIGS.DATA] = pubkey
+        else:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = \
+                'Нет публичного ключа для данного пользователя'
+        self.send(writer, response)
+
+    def service_update_lists(self):
+        """
+        Метод реализующий отправки сервисного сообщения 205 клиентам.
+        Безопасен для вызова из потока GUI. Вызовы в течение
+        UPDATE_LISTS_DELAY объединяются в одну рассылку.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._schedule_update_lists)
+
+    def _schedule_update_lists(self):
+        if self._update_lists_handle is None:
+            self._update_lists_handle = self.loop.call_later(
+                CONFIGS.UPDATE_LISTS_DELAY, self._broadcast_205)
+
+    def _broadcast_205(self):
+        """Рассылка 205 с версией справочника, кодируется один раз."""
+        self._update_lists_handle = None
+        data = encode_message({
+            **RESPONSE_205,
+            CONFIGS.DIRECTORY_VERSION: self.database.directory_version
+        }, CONFIGS.ENCODING)
+        for writer in self.names.values():
+            self.write(writer, data)
+
+    def disconnect_user(self, name):
+        """
+        Метод разрывающий соединение с удалённым из базы пользователем.
+        Безопасен для вызова из потока GUI.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._disconnect, name)
+
+    def _disconnect(self, name):
+        self.groups.remove_user(name)
+        writer = self.names.pop(name, None)
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,204 @@
+"""
+Запуск сервера из командной строки.
+
+Модуль импортирует только то, что нужно в любом режиме: PyQt5 и окна
+сервера загружаются лишь при запуске с GUI, asyncio - для движка
+asyncio, multiprocessing - для режима воркеров, http.server - при
+заданном порте метрик, профилировщик - по команде profile или с
+--profile_signal. Поэтому запуск без GUI
+
+    python -m my_messenger.server --no-gui
+
+не загружает Qt и стартует быстрее и с меньшей памятью.
+"""
+import argparse
+import configparser
+import os
+import signal
+import sys
+
+from my_messenger.common.utils import get_configs
+from my_messenger.common.decorators import log
+from my_messenger.log.server_log_config import server_logger
+from my_messenger.server.core import MessageProcessor
+from my_messenger.server.database import ServerStorage
+from my_messenger.server.limits import Limits
+
+CONFIGS = get_configs()
+
+# Каталог пакета: рядом с ним лежит файл настроек server.ini
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+@log
+def arg_parser(default_port, default_address):
+    """Парсер аргументов коммандной строки."""
+    server_logger.debug(
+        f'Инициализация парсера аргументов коммандной строки: {sys.argv}')
+    parser = argparse.ArgumentParser(
+        description='command line server parameters')
+    parser.add_argument('-a', '--addr', type=str,
+                        default=default_address, help='ip address')
+    parser.add_argument('-p', '--port', type=int,
+                        default=default_port, help='tcp-port')
+    parser.add_argument('--no_gui', '--no-gui', action='store_true',
+                        help='run without Qt, console commands only')
+    parser.add_argument('--engine', choices=('threaded', 'asyncio'),
+                        default='threaded', help='server engine')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of worker processes (SO_REUSEPORT)')
+    parser.add_argument('--metrics_port', type=int,
+                        default=CONFIGS.METRICS_PORT,
+                        help='prometheus metrics http port (0 - disabled)')
+    parser.add_argument('--profile_signal', '--profile-signal',
+                        action='store_true',
+                        default=CONFIGS.PROFILE_ON_SIGNAL,
+                        help='start profiling on PROFILE_SIGNAL')
+    args = parser.parse_args()
+    listen_address = args.addr
+    listen_port = args.port
+    gui_flag = args.no_gui
+    engine = args.engine
+    workers = args.workers
+    metrics_port = args.metrics_port
+    profile_signal = args.profile_signal
+    server_logger.debug('Аргументы успешно загружены.')
+    return listen_address, listen_port, gui_flag, engine, workers, \
+        metrics_port, profile_signal
+
+
+@log
+def config_load():
+    """Парсер конфигурационного ini файла."""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(PACKAGE_DIR, CONFIGS.SERVER_CONFIG))
+    # Если конфиг файл загружен правильно, запускаемся, иначе конфиг по
+    # умолчанию.
+    if 'SETTINGS' in config:
+        return config
+    else:
+        config.add_section('SETTINGS')
+        config.set('SETTINGS', 'Default_port',
+                   str(CONFIGS.DEFAULT_PORT))
+        config.set('SETTINGS', 'Listen_Address', '')
+        config.set('SETTINGS', 'Database_path', '')
+        config.set('SETTINGS', 'Database_file', 'server_database.db3')
+        return config
+
+
+def console(server):
+    """
+    Функция - обработчик консольного ввода режима без GUI.
+    Без консоли (запуск в контейнере) сервер работает до SIGTERM.
+    """
+    # SIGTERM обрабатываем как Ctrl+C, чтобы штатно отметить выход
+    # пользователей и дописать базу
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        try:
+            while True:
+                command = input('Введите exit для завершения работы '
+                                'сервера, profile - для снятия профиля.')
+                if command == 'exit':
+                    break
+                elif command == 'profile':
+                    from my_messenger.server.profiler import \
+                        start_profiling
+                    start_profiling()
+        except EOFError:
+            while server.is_alive():
+                server.join(1)
+    except KeyboardInterrupt:
+        pass
+
+
+def gui(database, server, config):
+    """Функция запуска графической оболочки сервера."""
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import Qt
+    from my_messenger.server.main_window import MainWindow
+
+    # Создаём графическое окуружение для сервера:
+    server_app = QApplication(sys.argv)
+    server_app.setAttribute(Qt.AA_DisableWindowContextHelpButton)
+    main_window = MainWindow(database, server, config)
+
+    # Запускаем GUI
+    server_app.exec_()
+
+
+def stop_profiling():
+    """
+    Функция записи незаконченного профиля до выхода. Профилировщик
+    загружают только консоль, GUI или обработчик сигнала, поэтому
+    останавливать его нужно, лишь если он загружен.
+    """
+    profiler = sys.modules.get('my_messenger.server.profiler')
+    if profiler is not None:
+        profiler.stop_profiling()
+
+
+@log
+def main():
+    """Основная функция"""
+    # Загрузка файла конфигурации сервера
+    config = config_load()
+
+    # Загрузка параметров командной строки, если нет параметров, то задаём
+    # значения по умоланию.
+    listen_address, listen_port, gui_flag, engine, workers, metrics_port, \
+        profile_signal = arg_parser(config['SETTINGS']['Default_port'],
+                                    config['SETTINGS']['Listen_Address'])
+    database_path = os.path.join(
+        config['SETTINGS']['Database_path'],
+        config['SETTINGS']['Database_file'])
+    # Лимиты запросов и подключений: configs.json и секции server.ini
+    limits = Limits.from_config(config)
+
+    # Несколько процессов-воркеров на одном порту, только без GUI
+    if workers > 1:
+        from my_messenger.server.workers import run_workers
+        run_workers(listen_address, listen_port, database_path, workers,
+                    limits, metrics_port, profile_signal)
+        return
+
+    # Выгрузка метрик в формате Prometheus, если задан порт
+    if metrics_port:
+        from my_messenger.server.metrics import start_metrics_server
+        start_metrics_server(CONFIGS.METRICS_ADDRESS, metrics_port)
+
+    # Инициализация базы данных
+    database = ServerStorage(database_path)
+
+    # Создание экземпляра класса - сервера и его запуск:
+    if engine == 'asyncio':
+        from my_messenger.server.async_core import AsyncMessageProcessor
+        server = AsyncMessageProcessor(
+            listen_address, listen_port, database, limits=limits)
+    else:
+        server = MessageProcessor(
+            listen_address, listen_port, database, limits=limits)
+    server.daemon = True
+    server.start()
+
+    # Профилирование по сигналу, если включено: kill -USR2 <pid>
+    if profile_signal:
+        from my_messenger.server.profiler import install_signal_handler
+        install_signal_handler()
+
+    # Если  указан параметр без GUI то запускаем простенький обработчик
+    # консольного ввода, иначе GUI.
+    if gui_flag:
+        console(server)
+    else:
+        gui(database, server, config)
+
+    # Завершаем основной цикл сервера
+    server.stop()
+    server.join()
+
+    # Незаконченный профиль записываем до выхода
+    stop_profiling()
+
+    # Дожидаемся записи в базу всех изменений, включая выход пользователей
+    database.close()
@@ -1,21 +1,58 @@
 import binascii
+import collections
 import hmac
 import json
 import os
-import select
+import selectors
 import threading
 import socket
+import time
 
 from my_messenger.common.answers import RESPONSE_200, RESPONSE_400, \
-    RESPONSE_202, RESPONSE_511, RESPONSE_205
+    RESPONSE_202, RESPONSE_511, RESPONSE_205, RESPONSE_429
 from my_messenger.common.decorators import login_required
 from my_messenger.common.descryptors import Port
-from my_messenger.common.utils import get_configs, get_message, send_message
+from my_messenger.common.errors import IncorrectDataReceivedError
+from my_messenger.common.framing import BufferPool, FrameDecoder, \
+    encode_message, frame_payload
+from my_messenger.common.utils import get_configs
 from my_messenger.common.decorators import log
 from my_messenger.log.server_log_config import server_logger
+from my_messenger.server.actions import ActionRegistry
+from my_messenger.server.groups import GroupIndex, MEMBERSHIP_ACTIONS
+from my_messenger.server.limits import Limits
+from my_messenger.server.metrics import REGISTRY, ACTION_SECONDS, \
+    BYTES_RECEIVED, BYTES_SENT
+from my_messenger.server.outbound import OutboundBuffer
+from my_messenger.server.session import AuthState, Session
+from my_messenger.server.timers import TimerWheel
 
 CONFIGS = get_configs()
 
+# Ошибки приёма и разбора данных клиента: соединение с ним закрывается.
+# Общие для цикла селектора и движка asyncio.
+CLIENT_ERRORS = (OSError, json.JSONDecodeError, UnicodeDecodeError,
+                 IncorrectDataReceivedError, KeyError, TypeError)
+
+
+def raise_open_files_limit():
+    """
+    Функция поднимающая мягкий лимит открытых файловых дескрипторов
+    процесса до жёсткого. Без этого сервер упирается в 1024 соединения.
+    На платформах без модуля resource ничего не делает.
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as err:
+            server_logger.warning(
+                f'Не удалось поднять лимит открытых файлов: {err}')
+
 
 class MessageProcessor(threading.Thread):
     """
@@ -25,32 +62,106 @@ class MessageProcessor(threading.Thread):
     """
     port = Port()
 
-    def __init__(self, listen_address, listen_port, database):
+    def __init__(self, listen_address, listen_port, database,
+                 reuse_port=False, router=None, limits=None):
         # параментры подключения
         self.addr = listen_address
         self.port = listen_port
 
+        # Режим воркеров: общий порт (SO_REUSEPORT) и маршрутизатор
+        # сообщений для пользователей других воркеров.
+        self.reuse_port = reuse_port
+        self.router = router
+
         # база данных сервера
         self.database = database
 
+        # Ограничения частоты запросов и допуска соединений
+        self.limits = limits if limits is not None else Limits.from_config()
+
         # Сокет, через который будет осуществляться работа
         self.sock = None
 
-        # список подключённых клиентов.
-        self.clients = []
+        # Селектор, отслеживающий готовность сокетов (epoll/kqueue/select)
+        self.selector = None
+
+        # Подключённые клиенты: дескриптор сокета -> Session.
+        self.sessions = dict()
+
+        # Пара сокетов для пробуждения цикла из других потоков (GUI) и
+        # очередь вызовов, которые цикл должен выполнить у себя.
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._pending_calls = collections.deque()
 
-        # Сокеты
-        self.listen_sockets = None
-        self.error_sockets = None
+        # Буферы приёма: соединение держит буфер, только пока в нём
+        # есть неразобранные данные
+        self.buffers = BufferPool(
+            CONFIGS.MAX_PACKAGE_LENGTH, CONFIGS.RECV_POOL_SIZE)
+
+        # Таймеры цикла: сроки авторизации и проверки активности клиентов
+        self.timers = TimerWheel(
+            CONFIGS.TIMER_TICK, CONFIGS.TIMER_WHEEL_SLOTS)
+
+        # Запрос проверки связи и отказ по лимиту кодируются один раз
+        self._ping_frame = encode_message(
+            {CONFIGS.ACTION: CONFIGS.PING},
+            CONFIGS.ENCODING)
+        self._too_many_frame = encode_message(
+            RESPONSE_429, CONFIGS.ENCODING)
+
+        # Таймер отложенной рассылки 205 (None - рассылка не запланирована)
+        self._update_lists_timer = None
+        # Таймер очистки корзин лимитов: взводится, только пока корзины
+        # есть, чтобы простаивающий цикл не просыпался каждый такт колеса
+        self._purge_timer = None
 
         # Флаг продолжения работы
         self.running = True
 
-        # словарь, содержащий сопоставленные имена и соответствующие им сокеты.
+        # словарь, содержащий имена авторизованных пользователей и их сессии.
         self.names = dict()
 
-        # конструктор предка
-        super().__init__()
+        # Участники групповых чатов: имя группы -> множество имён
+        self.groups = GroupIndex.load(database)
+
+        self._register_metrics()
+
+        # конструктор предка (по имени поток выбирает профилировщик)
+        super().__init__(name='message-processor')
+
+    def _register_metrics(self):
+        """
+        Метод регистрации метрик состояния сервера. Значения вычисляются
+        при выгрузке метрик и не требуют учёта в цикле.
+        """
+        # Гистограммы времени обработки берутся по имени действия заранее
+        self._action_seconds = {
+            name: ACTION_SECONDS.labels(name) for name in self.actions.actions}
+        REGISTRY.gauge(
+            'messenger_connections', 'Открытые соединения клиентов.',
+            func=lambda: len(self.sessions))
+        REGISTRY.gauge(
+            'messenger_authenticated_sessions',
+            'Авторизованные пользователи.', func=lambda: len(self.names))
+        REGISTRY.gauge(
+            'messenger_outbound_queue_bytes',
+            'Байт в исходящих очередях всех клиентов.',
+            func=lambda: sum(len(session.out_buffer)
+                             for session in list(self.sessions.values())))
+        REGISTRY.gauge(
+            'messenger_outbound_queue_max_bytes',
+            'Самая длинная исходящая очередь клиента, байт.',
+            func=lambda: max((len(session.out_buffer)
+                              for session in list(self.sessions.values())),
+                             default=0))
+        REGISTRY.counter(
+            'messenger_rate_limited_requests_total',
+            'Запросы, отклонённые по лимиту частоты.',
+            func=lambda: self.limits.rejected_requests)
+        REGISTRY.counter(
+            'messenger_rejected_connections_total',
+            'Соединения, отклонённые при допуске.',
+            func=lambda: self.limits.rejected_connections)
 
     def run(self):
         """Метод - основной цикл потока."""
@@ -59,60 +170,313 @@ class MessageProcessor(threading.Thread):
 
         # основной цикл программы сервера
         while self.running:
-            # ждём подключения, если таймаут вышел, ловим исключение
+            self.run_once()
+
+        self.close_all()
+
+    def run_once(self, timeout=None):
+        """
+        Метод - одна итерация цикла: ждём событий до срока ближайшего
+        таймера (не дольше timeout), обрабатываем готовые сокеты и
+        наступившие таймеры. Цикл будят готовые сокеты или вызов из
+        другого потока.
+        """
+        wait = self._next_timeout()
+        if timeout is not None:
+            wait = timeout if wait is None else min(wait, timeout)
+        try:
+            events = self.selector.select(wait)
+        except OSError as err:
+            server_logger.error(f'Ошибка работы с сокетами: {err.errno}')
+            return
+        for key, mask in events:
+            callback = key.data
+            callback(key.fileobj, mask)
+        self._run_timers()
+
+    def stop(self):
+        """Метод останавливающий основной цикл. Безопасен из любого потока."""
+        self.running = False
+        self.wakeup()
+
+    def wakeup(self):
+        """Метод пробуждающий цикл, ожидающий в select."""
+        try:
+            self._wakeup_send.send(b'\0')
+        except BlockingIOError:
+            # буфер пары уже полон - цикл и так проснётся
+            pass
+        except OSError:
+            pass
+
+    def call_soon(self, func, *args):
+        """
+        Метод планирующий вызов func(*args) в потоке основного цикла.
+        Используется GUI для операций с сокетами клиентов.
+        """
+        self._pending_calls.append((func, args))
+        self.wakeup()
+
+    def call_later(self, delay, func, *args):
+        """
+        Метод планирующий вызов func(*args) через delay секунд.
+        Вызывается только из потока основного цикла.
+        :return: объект Timer, который можно отменить.
+        """
+        return self.timers.call_later(delay, func, *args)
+
+    def _next_timeout(self):
+        """Метод вычисляющий таймаут select до следующего такта таймеров."""
+        return self.timers.next_timeout()
+
+    def _run_timers(self):
+        """Метод выполняющий таймеры, срок которых наступил."""
+        self.timers.advance()
+
+    def _on_wakeup(self, sock, mask):
+        """Обработчик пробуждения: вычитывает пару и выполняет вызовы."""
+        try:
+            while sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._pending_calls:
+            func, args = self._pending_calls.popleft()
+            func(*args)
+
+    def _accept(self, sock, mask):
+        """Обработчик готовности слушающего сокета: принимает соединения."""
+        while True:
             try:
                 # принимает запрос на установку соединения
-                client, client_address = self.sock.accept()
-            except OSError:
-                pass  # timeout вышел
-            else:
-                server_logger.info(
-                    f'Установлено соединение с: {str(client_address)}')
-                client.settimeout(5)
-                self.clients.append(client)
-
-            recv_data_lst = []
-            send_data_lst = []
-            err_lst = []
-            # проверяем на наличие ждущих клиентов
-            try:
-                if self.clients:
-                    recv_data_lst, self.listen_sockets, self.error_sockets = \
-                        select.select(self.clients, self.clients, [], 0)
+                client, client_address = sock.accept()
+            except BlockingIOError:
+                return
             except OSError as err:
-                server_logger.error(f'Ошибка работы с сокетами: {err.errno}')
-
-            # принимаем сообщения и если ошибка, исключаем клиента
-            if recv_data_lst:
-                for client_with_message in recv_data_lst:
-                    try:
+                server_logger.error(
+                    f'Ошибка при приёме соединения: {err.errno}')
+                return
+            if not self.limits.admit(len(self.sessions)):
+                server_logger.debug(
+                    f'Соединение с {client_address} отклонено: '
+                    f'превышен лимит подключений.')
+                client.close()
+                continue
+            server_logger.info(
+                f'Установлено соединение с: {str(client_address)}')
+            self.add_client(client, client_address)
+
+    def add_client(self, client, client_address):
+        """
+        Метод подключения сокета клиента к циклу: создаёт сессию и
+        регистрирует сокет в селекторе.
+        :return: Session.
+        """
+        client.setblocking(False)
+        session = Session(
+            client,
+            client_address,
+            OutboundBuffer(
+                CONFIGS.OUTBOUND_HIGH_WATERMARK,
+                CONFIGS.OUTBOUND_LOW_WATERMARK,
+                CONFIGS.SLOW_CONSUMER_POLICY),
+            FrameDecoder(CONFIGS.MAX_PACKAGE_LENGTH,
+                         CONFIGS.MAX_FRAME_LENGTH,
+                         self.buffers))
+        self.sessions[session.fd] = session
+        self.selector.register(
+            client, selectors.EVENT_READ, self._on_client_event)
+        # Не авторизовавшийся за AUTH_TIMEOUT клиент будет отключён
+        session.timer = self.call_later(
+            CONFIGS.AUTH_TIMEOUT, self._check_idle, session)
+        return session
+
+    def _on_client_event(self, client, mask):
+        """Обработчик событий клиентского сокета."""
+        session = self.sessions.get(client.fileno())
+        if session is None:
+            return
+        if mask & selectors.EVENT_WRITE:
+            self._flush(session)
+        if mask & selectors.EVENT_READ and session.sock is not None \
+                and not session.closing:
+            # принимаем данные, разбираем все полные кадры и если ошибка,
+            # исключаем клиента
+            try:
+                received = session.decoder.recv_from(client)
+                if not received:
+                    self.remove_client(session)
+                    return
+                BYTES_RECEIVED.inc(received)
+                session.last_seen = time.monotonic()
+                session.ping_pending = False
+                for message in session.decoder.messages(
+                        CONFIGS.ENCODING):
+                    session.messages_in += 1
+                    # Соединение в середине авторизации ждёт только
+                    # ответа на запрос 511
+                    if session.auth is not None:
+                        self.finish_auth(message, session)
+                    else:
                         self.process_client_message(
-                            get_message(
-                                client_with_message,
-                                CONFIGS),
-                            client_with_message,
-                            CONFIGS)
-                    except (OSError, json.JSONDecodeError, TypeError) as err:
-                        server_logger.debug(
-                            f'Getting data from client exception',
-                            exc_info=err
-                        )
-                        self.remove_client(client_with_message)
-
-    def remove_client(self, client):
+                            message, session, CONFIGS)
+                    if session.sock is None or session.closing:
+                        break
+            except BlockingIOError:
+                pass
+            except CLIENT_ERRORS as err:
+                server_logger.debug(
+                    f'Getting data from client exception',
+                    exc_info=err
+                )
+                self.remove_client(session)
+
+    def _queue_message(self, session, message):
+        """Метод постановки сообщения в исходящий буфер клиента."""
+        self._queue_data(
+            session, encode_message(message, CONFIGS.ENCODING))
+
+    def _queue_data(self, session, data):
+        """
+        Метод постановки закодированного кадра в исходящий буфер клиента.
+        Если буфер был пуст, данные сразу пробуем отправить; остаток
+        ждёт готовности сокета к записи. Если клиент не успевает принимать
+        данные, применяется политика SLOW_CONSUMER_POLICY.
+        """
+        if session.sock is None:
+            return
+        buffer = session.out_buffer
+        was_empty = not buffer
+        was_overloaded = buffer.overloaded
+        if not buffer.push(data):
+            server_logger.warning(
+                f'Клиент {session.name} не успевает принимать '
+                f'данные ({len(buffer)} байт в очереди), соединение закрыто.')
+            self.remove_client(session)
+            return
+        session.messages_out += 1
+        if buffer.overloaded and not was_overloaded:
+            server_logger.warning(
+                f'Очередь клиента {session.name} превысила '
+                f'{buffer.high_watermark} байт, политика: {buffer.policy}.')
+        if was_empty:
+            self._flush(session)
+        elif buffer.overloaded != was_overloaded:
+            self._update_interest(session)
+
+    def _close_after_send(self, session):
+        """
+        Метод закрытия соединения после отправки всего буфера (например,
+        ответа 400 на неудачную авторизацию).
+        """
+        if session.sock is None:
+            return
+        if not session.out_buffer:
+            self.remove_client(session)
+            return
+        session.closing = True
+        self._update_interest(session)
+
+    def _flush(self, session):
+        """Метод отправки накопленного буфера, когда сокет готов к записи."""
+        if session.sock is None:
+            return
+        try:
+            BYTES_SENT.inc(session.out_buffer.send_to(session.sock))
+        except OSError:
+            self.remove_client(session)
+            return
+        if not session.out_buffer and session.closing:
+            self.remove_client(session)
+            return
+        # Следующую порцию накопленных сообщений - только когда предыдущая
+        # целиком ушла в сокет, так память на доставку ограничена.
+        if not session.out_buffer and session.offline_cursor is not None:
+            self._deliver_offline(session)
+        self._update_interest(session)
+
+    def _update_interest(self, session):
+        """
+        Метод перерегистрации сокета в селекторе.
+        На запись - только пока есть что отправлять; на чтение - пока
+        клиент не перегружен ответами (обратное давление) и не закрывается.
+        """
+        buffer = session.out_buffer
+        events = 0
+        if buffer:
+            events |= selectors.EVENT_WRITE
+        if not session.closing and not buffer.overloaded:
+            events |= selectors.EVENT_READ
+        if events and \
+                events != self.selector.get_key(session.sock).events:
+            self.selector.modify(session.sock, events, self._on_client_event)
+
+    def queue_depths(self):
+        """
+        Метод возвращающий глубину исходящих очередей (в байтах)
+        по авторизованным пользователям.
+        """
+        return {name: len(session.out_buffer)
+                for name, session in self.names.items()}
+
+    def remove_client(self, session, logout=True):
         """
         Метод обработчик клиента с которым прервана связь.
-        Ищет клиента и удаляет его из списков и базы:
+        Удаляет сессию из словарей и отмечает выход пользователя в базе.
         """
-        server_logger.info(
-            f'Клиент {client.getpeername()} отключился от сервера')
-        for name in self.names:
-            if self.names[name] == client:
-                self.database.user_logout(name)
-                del self.names[name]
-                break
-        self.clients.remove(client)
-        client.close()
+        if session.sock is None:
+            return
+        if session.timer is not None:
+            session.timer.cancel()
+            session.timer = None
+        session.auth = None
+        server_logger.info(f'Клиент {session.name} отключился от сервера')
+        if session.username is not None and \
+                self.names.get(session.username) is session:
+            del self.names[session.username]
+            if logout:
+                self.database.user_logout(session.username)
+            if self.router:
+                self.router.unregister(session.username)
+        # Сессию убираем до закрытия сокета: дескриптор может быть
+        # сразу выдан новому соединению.
+        del self.sessions[session.fd]
+        self.selector.unregister(session.sock)
+        session.out_buffer.close()
+        session.decoder.close()
+        session.sock.close()
+        session.sock = None
+
+    def is_online(self, name):
+        """
+        Метод проверяющий, что пользователь подключён к серверу
+        (в режиме воркеров - к любому из них).
+        """
+        if name in self.names:
+            return True
+        return bool(self.router) and self.router.locate(name) is not None
+
+    def disconnect_user(self, name):
+        """
+        Метод разрывающий соединение с удалённым из базы пользователем.
+        Запись о выходе в базу не вносится - пользователя там уже нет.
+        Безопасен для вызова из потока GUI.
+        """
+        if threading.current_thread() is not self:
+            self.call_soon(self.disconnect_user, name)
+            return
+        self.groups.remove_user(name)
+        if name in self.names:
+            self.remove_client(self.names[name], logout=False)
+
+    def close_all(self):
+        """Метод закрывающий все сокеты при завершении работы."""
+        for session in list(self.sessions.values()):
+            self.remove_client(session)
+        self.selector.close()
+        self.sock.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
 
     def init_socket(self):
         """Метод инициализатор сокета."""
@@ -121,212 +485,393 @@ class MessageProcessor(threading.Thread):
             f' адрес с которого принимаются подключения: {self.addr}.'
             f' Если адрес не указан, принимаются соединения с любых адресов.')
 
+        raise_open_files_limit()
+
         # сервер создаёт сокет
         transport = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.reuse_port:
+            transport.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         # привязывает сокет к IP-адресу и порту машины
         transport.bind((self.addr, self.port))
-        # Таймаут для операций с сокетом (0.5 секунды)
-        transport.settimeout(0.5)
+        # Неблокирующий режим: ожиданием занимается селектор
+        transport.setblocking(False)
 
         self.sock = transport
         # готов принимать соединения
-        self.sock.listen(CONFIGS.get('MAX_CONNECTIONS'))
+        self.sock.listen(CONFIGS.LISTEN_BACKLOG)
+
+        # Регистрируем слушающий сокет и сокет пробуждения на чтение
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ, self._accept)
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(
+            self._wakeup_recv, selectors.EVENT_READ, self._on_wakeup)
+        if self.router:
+            self.router.attach(self)
+
+    def _arm_purge(self):
+        """Метод постановки таймера очистки, если есть корзины лимитов."""
+        if self._purge_timer is None and self.limits:
+            self._purge_timer = self.call_later(
+                CONFIGS.RATE_LIMIT_PURGE_INTERVAL, self._purge_limits)
+
+    def _purge_limits(self):
+        """Обработчик таймера: освобождает неактивные корзины лимитов."""
+        self._purge_timer = None
+        self.limits.purge()
+        self._arm_purge()
 
     @log
     def process_message(self, message):
         """
         Метод отправки сообщения клиенту.
         """
-        if message[CONFIGS.get('TO_USER')] in self.names and self.names[
-                message[CONFIGS.get('TO_USER')]] in self.listen_sockets:
-            try:
-                send_message(
-                    self.names[message[CONFIGS.get('TO_USER')]],
-                    message,
-                    CONFIGS
-                )
-                server_logger.info(
-                    f'Отправлено сообщение пользователю '
-                    f'{message[CONFIGS.get("TO_USER")]} '
-                    f'от пользователя {message[CONFIGS.get("FROM_USER")]}.')
-            except OSError:
-                self.remove_client(message[CONFIGS.get('TO_USER')])
-        elif message[CONFIGS.get('TO_USER')] in self.names and self.names[
-                message[CONFIGS.get('TO_USER')]] not in self.listen_sockets:
-            server_logger.error(
-                f'Связь с клиентом {message[CONFIGS.get("TO_USER")]} '
-                f'была потеряна. '
-                f'Соединение закрыто, доставка невозможна.')
-            self.remove_client(self.names[message[CONFIGS.get('TO_USER')]])
+        if message[CONFIGS.TO_USER] in self.names:
+            self._queue_message(
+                self.names[message[CONFIGS.TO_USER]], message)
+            server_logger.info(
+                f'Отправлено сообщение пользователю '
+                f'{message[CONFIGS.TO_USER]} '
+                f'от пользователя {message[CONFIGS.FROM_USER]}.')
+        elif self.router and self.router.forward(message):
+            server_logger.info(
+                f'Сообщение для пользователя '
+                f'{message[CONFIGS.TO_USER]} '
+                f'передано воркеру '
+                f'{self.router.locate(message[CONFIGS.TO_USER])}.')
+        else:
+            # Получатель не в сети - сохраняем сообщение до его входа
+            self.database.store_offline(
+                message[CONFIGS.TO_USER], json.dumps(message))
+            server_logger.info(
+                f'Пользователь {message[CONFIGS.TO_USER]} '
+                f'не в сети, сообщение сохранено для доставки.')
+
+    def publish_group(self, message):
+        """
+        Метод рассылки сообщения или уведомления всем участникам группы,
+        в режиме воркеров - и участникам на других воркерах.
+        """
+        self.deliver_group(message)
+        if self.router:
+            self.router.broadcast(message)
+
+    def deliver_group(self, message):
+        """
+        Метод доставки сообщения группы подключённым к этому процессу
+        участникам, кроме автора. Уведомления о составе группы сначала
+        применяются к индексу. Сообщение кодируется один раз, в буферы
+        участников ставится один и тот же кадр.
+        """
+        if message[CONFIGS.ACTION] in MEMBERSHIP_ACTIONS:
+            self.groups.apply(message)
+            author = message[CONFIGS.ACCOUNT_NAME]
+        else:
+            author = message[CONFIGS.FROM_USER]
+        members = self.groups.get(message[CONFIGS.GROUP])
+        # Перебираем меньшее из множеств: участников или подключённых
+        if len(members) <= len(self.names):
+            recipients = [self.names[name] for name in members
+                          if name in self.names]
         else:
-            server_logger.error(
-                f'Пользователь {message[CONFIGS.get("TO_USER")]} '
-                f'не зарегистрирован на сервере, '
-                f'отправка сообщения невозможна.')
+            recipients = [session for name, session in self.names.items()
+                          if name in members]
+        data = None
+        for session in recipients:
+            if session.username == author:
+                continue
+            if data is None:
+                data = encode_message(message, CONFIGS.ENCODING)
+            self._queue_data(session, data)
+
+    @staticmethod
+    def _group_event(action, group, username):
+        """Уведомление участникам группы об изменении её состава."""
+        return {
+            CONFIGS.ACTION: CONFIGS.get(action),
+            CONFIGS.TIME: time.time(),
+            CONFIGS.GROUP: group,
+            CONFIGS.ACCOUNT_NAME: username
+        }
+
+    def _start_offline_delivery(self, session):
+        """
+        Метод начала доставки сообщений, накопленных пока пользователь
+        был отключён. Вызывается после записи в базу всех изменений,
+        поставленных до входа пользователя.
+        """
+        if session.sock is None or session.username is None:
+            return
+        session.offline_cursor = 0
+        self._flush(session)
+
+    def _deliver_offline(self, session):
+        """
+        Метод постановки в буфер очередной порции накопленных сообщений.
+        Предыдущая порция уже передана в сокет, её удаляем из базы.
+        """
+        if session.offline_cursor:
+            self.database.delete_offline(
+                session.username, session.offline_cursor)
+        rows = self.database.get_offline(
+            session.username, session.offline_cursor,
+            CONFIGS.OFFLINE_BATCH)
+        if not rows:
+            session.offline_cursor = None
+            return
+        buffer = session.out_buffer
+        for row_id, payload in rows:
+            frame = frame_payload(payload.encode(CONFIGS.ENCODING))
+            # Порция не должна переполнять буфер: сверх верхней границы
+            # кадр отбросила бы политика медленного клиента, а строка
+            # всё равно удалилась бы из базы. Остаток уйдёт следующей
+            # порцией, когда буфер опустеет.
+            if buffer and len(buffer) + len(frame) > buffer.high_watermark:
+                break
+            dropped = buffer.dropped
+            if not buffer.push(frame) or buffer.dropped != dropped:
+                break
+            session.messages_out += 1
+            # Курсор (и удаление из базы) - только по принятым кадрам
+            session.offline_cursor = row_id
 
     @login_required
     # метод проверки сообщения клиента
-    def process_client_message(self, message, client, CONFIGS):
-        """Метод - отбработчик поступающих сообщений."""
+    def process_client_message(self, message, session, CONFIGS):
+        """
+        Метод - обработчик поступающих сообщений.
+        Находит действие в реестре actions одним обращением к словарю,
+        проверяет схему сообщения и вызывает обработчик.
+        """
         server_logger.debug(f'Обработка сообщения от клиента: {message}')
-
-        # если это сообщение о присутствии, принимаем и отвечаем
-        if CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('PRESENCE') and \
-                CONFIGS.get('TIME') in message and \
-                CONFIGS.get('USER') in message:
-            # Если сообщение о присутствии то вызываем функцию авторизации.
-            self.authorize_user(message, client)
-
-        # Если это сообщение, то отправляем его получателю.
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('MESSAGE') and \
-                CONFIGS.get('TO_USER') in message and \
-                CONFIGS.get('TIME') in message and \
-                CONFIGS.get('FROM_USER') in message and \
-                CONFIGS.get('MESSAGE_TEXT') in message and \
-                self.names[message[CONFIGS.get('FROM_USER')]] == client:
-            if message[CONFIGS.get('TO_USER')] in self.names:
-                self.database.process_message(message[CONFIGS.get(
-                    'FROM_USER')], message[CONFIGS.get('TO_USER')])
-                self.process_message(message)
-                try:
-                    send_message(client, RESPONSE_200, CONFIGS)
-                except OSError:
-                    self.remove_client(client)
-            else:
-                response = RESPONSE_400
-                response[CONFIGS.get(
-                    'ERROR')] = 'Пользователь не зарегистрирован на сервере.'
-                try:
-                    send_message(client, response, CONFIGS)
-                except OSError:
-                    pass
+        action = self.actions.get(message.get(CONFIGS.ACTION))
+        if action is None or not action.accepts(message, session.username):
+            # иначе отдаём Bad request
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Запрос некорректен.'
+            self._queue_message(session, response)
             return
-
-        # если клиент выходит
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('EXIT') and \
-                CONFIGS.get('ACCOUNT_NAME') in message and \
-                self.names[message[CONFIGS.get('ACCOUNT_NAME')]] == client:
-            self.remove_client(client)
-
-        # если это запрос контакт-листа
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('GET_CONTACTS') \
-                and CONFIGS.get('USER') in message and \
-                self.names[message[CONFIGS.get('USER')]] == client:
-            response = RESPONSE_202
-            response[CONFIGS.get('LIST_INFO')] = self.database.get_contacts(
-                message[CONFIGS.get('USER')])
-            try:
-                send_message(client, response, CONFIGS)
-            except OSError:
-                self.remove_client(client)
-
-        # если это добавление контакта
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('ADD_CONTACT') \
-                and CONFIGS.get("ACCOUNT_NAME") in message and \
-                CONFIGS.get('USER') in message and \
-                self.names[message[CONFIGS.get('USER')]] == client:
-            self.database.add_contact(message[CONFIGS.get(
-                'USER')], message[CONFIGS.get("ACCOUNT_NAME")])
-            try:
-                send_message(client, RESPONSE_200, CONFIGS)
-            except OSError:
-                self.remove_client(client)
-
-        # если это удаление контакта
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == \
-                CONFIGS.get('REMOVE_CONTACT') and \
-                CONFIGS.get('ACCOUNT_NAME') in message and \
-                CONFIGS.get('USER') in message and \
-                self.names[message[CONFIGS.get('USER')]] == client:
-            self.database.remove_contact(message[CONFIGS.get(
-                'USER')], message[CONFIGS.get('ACCOUNT_NAME')])
-            try:
-                send_message(client, RESPONSE_200, CONFIGS)
-            except OSError:
-                self.remove_client(client)
-
-        # если это запрос известных пользователей
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == CONFIGS.get('USERS_REQUEST')\
-                and CONFIGS.get('ACCOUNT_NAME') in message and \
-                self.names[message[CONFIGS.get('ACCOUNT_NAME')]] == client:
-            response = RESPONSE_202
-            response[CONFIGS.get('LIST_INFO')] = \
-                [user[0] for user in self.database.users_list()]
-            try:
-                send_message(client, response, CONFIGS)
-            except OSError:
-                self.remove_client(client)
-
-        # Если это запрос публичного ключа пользователя
-        elif CONFIGS.get('ACTION') in message and \
-                message[CONFIGS.get('ACTION')] == \
-                CONFIGS.get('PUBLIC_KEY_REQUEST') and \
-                CONFIGS.get('ACCOUNT_NAME') in message:
-            response = RESPONSE_511
-            response[CONFIGS.get('DATA')] = self.database.get_pubkey(
-                message[CONFIGS.get('ACCOUNT_NAME')])
-            # может быть, что ключа ещё нет (пользователь никогда не логинился,
-            # тогда шлём 400)
-            if response[CONFIGS.get('DATA')]:
-                try:
-                    send_message(client, response, CONFIGS)
-                except OSError:
-                    self.remove_client(client)
-            else:
-                response = RESPONSE_400
-                response[CONFIGS.get('ERROR')] = \
-                    'Нет публичного ключа для данного пользователя'
-                try:
-                    send_message(client, response, CONFIGS)
-                except OSError:
-                    self.remove_client(client)
-
-        # иначе отдаём Bad request
+        allowed = self.limits.allow(
+            action.name, session.username, session.address[0])
+        self._arm_purge()
+        if not allowed:
+            self._queue_data(session, self._too_many_frame)
+            return
+        start = time.perf_counter()
+        action.handler(self, message, session)
+        self._action_seconds[action.name].observe(
+            time.perf_counter() - start)
+
+    # Реестр действий протокола. Наследники расширяют его копию:
+    # actions = MessageProcessor.actions.copy()
+    actions = ActionRegistry()
+
+    # если это сообщение о присутствии, вызываем функцию авторизации.
+    @actions.register('PRESENCE', required=('TIME', 'USER'),
+                      nested={'USER': ('ACCOUNT_NAME', 'PUBLIC_KEY')})
+    def _on_presence(self, message, session):
+        self.authorize_user(message, session)
+
+    # Если это сообщение, то отправляем его получателю.
+    @actions.register(
+        'MESSAGE',
+        required=('TO_USER', 'TIME', 'FROM_USER', 'MESSAGE_TEXT'),
+        owner='FROM_USER')
+    def _on_message(self, message, session):
+        # Отключённому, но зарегистрированному пользователю сообщение
+        # сохраняется и будет доставлено при входе.
+        if self.is_online(message[CONFIGS.TO_USER]) or \
+                self.database.check_user(message[CONFIGS.TO_USER]):
+            self.database.process_message(message[CONFIGS.get(
+                'FROM_USER')], message[CONFIGS.TO_USER])
+            self.process_message(message)
+            self._queue_message(session, RESPONSE_200)
         else:
             response = RESPONSE_400
-            response[CONFIGS.get('ERROR')] = 'Запрос некорректен.'
-            try:
-                send_message(client, response, CONFIGS)
-            except OSError:
-                self.remove_client(client)
-
-    def authorize_user(self, message, sock):
+            response[CONFIGS.get(
+                'ERROR')] = 'Пользователь не зарегистрирован на сервере.'
+            self._queue_message(session, response)
+
+    # ответ клиента на проверку связи: активность уже отмечена при приёме
+    @actions.register('PONG')
+    def _on_pong(self, message, session):
+        pass
+
+    # если клиент выходит
+    @actions.register('EXIT', required=('ACCOUNT_NAME',),
+                      owner='ACCOUNT_NAME')
+    def _on_exit(self, message, session):
+        self.remove_client(session)
+
+    # если это запрос контакт-листа
+    @actions.register('GET_CONTACTS', required=('USER',), owner='USER')
+    def _on_get_contacts(self, message, session):
+        response = RESPONSE_202
+        response[CONFIGS.LIST_INFO] = self.database.get_contacts(
+            session.username)
+        self._queue_message(session, response)
+
+    # если это добавление контакта
+    @actions.register('ADD_CONTACT', required=('ACCOUNT_NAME', 'USER'),
+                      owner='USER')
+    def _on_add_contact(self, message, session):
+        self.database.add_contact(
+            session.username, message[CONFIGS.ACCOUNT_NAME])
+        self._queue_message(session, RESPONSE_200)
+
+    # если это удаление контакта
+    @actions.register('REMOVE_CONTACT', required=('ACCOUNT_NAME', 'USER'),
+                      owner='USER')
+    def _on_remove_contact(self, message, session):
+        self.database.remove_contact(
+            session.username, message[CONFIGS.ACCOUNT_NAME])
+        self._queue_message(session, RESPONSE_200)
+
+    # если это запрос известных пользователей
+    @actions.register('USERS_REQUEST', required=('ACCOUNT_NAME',),
+                      owner='ACCOUNT_NAME')
+    def _on_users_request(self, message, session):
+        # Версию берём до запроса: если справочник изменится между ними,
+        # клиент получит следующую 205 и обновит список ещё раз.
+        version = self.database.directory_version
+        self._queue_message(session, {
+            **RESPONSE_202,
+            CONFIGS.LIST_INFO:
+                [user[0] for user in self.database.users_list()],
+            CONFIGS.DIRECTORY_VERSION: version
+        })
+
+    # Если это запрос публичного ключа пользователя
+    @actions.register('PUBLIC_KEY_REQUEST', required=('ACCOUNT_NAME',))
+    def _on_public_key_request(self, message, session):
+        response = RESPONSE_511
+        response[CONFIGS.DATA] = self.database.get_pubkey(
+            message[CONFIGS.ACCOUNT_NAME])
+        # может быть, что ключа ещё нет (пользователь никогда не логинился,
+        # тогда шлём 400)
+        if response[CONFIGS.DATA]:
+            self._queue_message(session, response)
+        else:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = \
+                'Нет публичного ключа для данного пользователя'
+            self._queue_message(session, response)
+
+    # Групповые чаты. Сервер хранит состав групп и ключ группы,
+    # зашифрованный открытым ключом каждого участника; тексты сообщений
+    # зашифрованы ключом группы и пересылаются без изменений.
+    @actions.register('CREATE_GROUP', required=('GROUP', 'USER'),
+                      owner='USER')
+    def _on_create_group(self, message, session):
+        group = message[CONFIGS.GROUP]
+        if not isinstance(group, str) or not group or group in self.groups:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Группа уже существует.'
+            self._queue_message(session, response)
+            return
+        self.database.create_group(
+            group, session.username, message.get(CONFIGS.DATA))
+        self.publish_group(
+            self._group_event('CREATE_GROUP', group, session.username))
+        self._queue_message(session, RESPONSE_200)
+
+    # вступление в группу: в ответ состав группы и ключ участника,
+    # остальные участники получают уведомление и могут передать ключ
+    @actions.register('JOIN_GROUP', required=('GROUP', 'USER'),
+                      owner='USER')
+    def _on_join_group(self, message, session):
+        group = message[CONFIGS.GROUP]
+        if group not in self.groups:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Группа не найдена.'
+            self._queue_message(session, response)
+            return
+        if not self.groups.is_member(group, session.username):
+            self.database.add_group_member(group, session.username)
+            self.publish_group(
+                self._group_event('JOIN_GROUP', group, session.username))
+        self._queue_message(session, {
+            **RESPONSE_202,
+            CONFIGS.LIST_INFO: sorted(self.groups.get(group)),
+            CONFIGS.DATA: self.database.get_group_key(
+                group, session.username)
+        })
+
+    @actions.register('LEAVE_GROUP', required=('GROUP', 'USER'),
+                      owner='USER')
+    def _on_leave_group(self, message, session):
+        group = message[CONFIGS.GROUP]
+        if not self.groups.is_member(group, session.username):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Вы не участник группы.'
+            self._queue_message(session, response)
+            return
+        self.database.remove_group_member(group, session.username)
+        self.publish_group(
+            self._group_event('LEAVE_GROUP', group, session.username))
+        self._queue_message(session, RESPONSE_200)
+
+    @actions.register(
+        'GROUP_MESSAGE',
+        required=('GROUP', 'TIME', 'FROM_USER', 'MESSAGE_TEXT'),
+        owner='FROM_USER')
+    def _on_group_message(self, message, session):
+        if not self.groups.is_member(
+                message[CONFIGS.GROUP], session.username):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Вы не участник группы.'
+            self._queue_message(session, response)
+            return
+        self.publish_group(message)
+        self._queue_message(session, RESPONSE_200)
+
+    # передача ключа группы участнику (ключ зашифрован его открытым ключом)
+    @actions.register('GROUP_KEY',
+                      required=('GROUP', 'USER', 'ACCOUNT_NAME', 'DATA'),
+                      owner='USER')
+    def _on_group_key(self, message, session):
+        group = message[CONFIGS.GROUP]
+        member = message[CONFIGS.ACCOUNT_NAME]
+        if not self.groups.is_member(group, session.username) or \
+                not self.groups.is_member(group, member):
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Вы не участник группы.'
+            self._queue_message(session, response)
+            return
+        self.database.set_group_key(
+            group, member, message[CONFIGS.DATA])
+        self.process_message({
+            CONFIGS.ACTION: CONFIGS.GROUP_KEY,
+            CONFIGS.TIME: time.time(),
+            CONFIGS.GROUP: group,
+            CONFIGS.FROM_USER: session.username,
+            CONFIGS.TO_USER: member,
+            CONFIGS.DATA: message[CONFIGS.DATA]
+        })
+        self._queue_message(session, RESPONSE_200)
+
+    def authorize_user(self, message, session):
         """Метод реализующий авторизцию пользователей."""
         # Если имя пользователя уже занято то возвращаем 400
         server_logger.debug(
-            f'Start auth process for {message[CONFIGS.get("USER")]}')
-        if message[CONFIGS.get('USER')][CONFIGS.get(
-                'ACCOUNT_NAME')] in self.names.keys():
+            f'Start auth process for {message[CONFIGS.USER]}')
+        if self.is_online(message[CONFIGS.USER][CONFIGS.get(
+                'ACCOUNT_NAME')]):
             response = RESPONSE_400
-            response[CONFIGS.get('ERROR')] = 'Имя пользователя уже занято.'
-            try:
-                server_logger.debug(f'Username busy, sending {response}')
-                send_message(sock, response, CONFIGS)
-            except OSError:
-                server_logger.debug('OS Error')
-                pass
-            self.clients.remove(sock)
-            sock.close()
+            response[CONFIGS.ERROR] = 'Имя пользователя уже занято.'
+            server_logger.debug(f'Username busy, sending {response}')
+            self._queue_message(session, response)
+            self._close_after_send(session)
 
         # Проверяем что пользователь зарегистрирован на сервере.
-        elif not self.database.check_user(message[CONFIGS.get('USER')]
-                                          [CONFIGS.get('ACCOUNT_NAME')]):
+        elif not self.database.check_user(message[CONFIGS.USER]
+                                          [CONFIGS.ACCOUNT_NAME]):
             response = RESPONSE_400
-            response[CONFIGS.get('ERROR')] = 'Пользователь не зарегистрирован.'
-            try:
-                server_logger.debug(f'Unknown username, sending {response}')
-                send_message(sock, response, CONFIGS)
-            except OSError:
-                pass
-            self.clients.remove(sock)
-            sock.close()
+            response[CONFIGS.ERROR] = 'Пользователь не зарегистрирован.'
+            server_logger.debug(f'Unknown username, sending {response}')
+            self._queue_message(session, response)
+            self._close_after_send(session)
         else:
             server_logger.debug('Correct username, starting passwd check.')
             # Иначе отвечаем 511 и проводим процедуру авторизации
@@ -335,56 +880,128 @@ class MessageProcessor(threading.Thread):
             # Набор байтов в hex представлении
             random_str = binascii.hexlify(os.urandom(64))
             # В словарь байты нельзя, декодируем (json.dumps -> TypeError)
-            message_auth[CONFIGS.get('DATA')] = random_str.decode('ascii')
+            message_auth[CONFIGS.DATA] = random_str.decode('ascii')
             # Создаём хэш пароля и связки с рандомной строкой, сохраняем
             # серверную версию ключа
             hash = hmac.new(self.database.get_hash(message[CONFIGS.get(
-                'USER')][CONFIGS.get('ACCOUNT_NAME')]), random_str, 'MD5')
+                'USER')][CONFIGS.ACCOUNT_NAME]), random_str, 'MD5')
             digest = hash.digest()
             server_logger.debug(f'Auth message = {message_auth}')
-            try:
-                # Обмен с клиентом
-                send_message(sock, message_auth, CONFIGS)
-                ans = get_message(sock, CONFIGS)
-            except OSError as err:
-                server_logger.debug('Error in auth, data:', exc_info=err)
-                sock.close()
-                return
-            client_digest = binascii.a2b_base64(ans[CONFIGS.get('DATA')])
-            # Если ответ клиента корректный, то сохраняем его в список
-            # пользователей.
-            if CONFIGS.get('RESPONSE') in ans and \
-                    ans[CONFIGS.get('RESPONSE')] == 511 and \
-                    hmac.compare_digest(digest, client_digest):
-                self.names[message[CONFIGS.get(
-                    'USER')][CONFIGS.get('ACCOUNT_NAME')]] = sock
-                client_ip, client_port = sock.getpeername()
-                try:
-                    send_message(sock, RESPONSE_200, CONFIGS)
-                except OSError:
-                    self.remove_client(message[CONFIGS.get(
-                        'USER')][CONFIGS.get('ACCOUNT_NAME')])
-                # добавляем пользователя в список активных и если у него
-                # изменился открытый ключ сохраняем новый
-                self.database.user_login(
-                    message[CONFIGS.get('USER')][CONFIGS.get('ACCOUNT_NAME')],
-                    client_ip,
-                    client_port,
-                    message[CONFIGS.get('USER')][CONFIGS.get('PUBLIC_KEY')])
-            else:
+            # Ответ клиента придёт в цикл событий; до тех пор сессия
+            # хранит состояние авторизации. Срок авторизации отсчитывается
+            # таймером сессии с момента подключения.
+            session.auth = AuthState(
+                message[CONFIGS.USER][CONFIGS.ACCOUNT_NAME],
+                message[CONFIGS.USER][CONFIGS.PUBLIC_KEY],
+                digest)
+            self._queue_message(session, message_auth)
+
+    def finish_auth(self, ans, session):
+        """
+        Метод - второй шаг авторизации: проверка ответа клиента
+        на запрос 511.
+        """
+        state = session.auth
+        session.auth = None
+        try:
+            client_digest = binascii.a2b_base64(ans[CONFIGS.DATA])
+        except (KeyError, TypeError, ValueError):
+            client_digest = b''
+        # Если ответ клиента корректный, то сохраняем его в список
+        # пользователей. Пока шёл обмен, под этим именем мог войти другой
+        # клиент - тогда отказываем.
+        if ans.get(CONFIGS.RESPONSE) == 511 and \
+                hmac.compare_digest(state.digest, client_digest) and \
+                not self.is_online(state.username):
+            # Справочник воркеров может быть переполнен - тогда отказываем
+            # только этому клиенту
+            if self.router and not self.router.register(state.username):
                 response = RESPONSE_400
-                response[CONFIGS.get('ERROR')] = 'Неверный пароль.'
-                try:
-                    send_message(sock, response, CONFIGS)
-                except OSError:
-                    pass
-                self.clients.remove(sock)
-                sock.close()
+                response[CONFIGS.ERROR] = 'Сервер перегружен.'
+                self._queue_message(session, response)
+                self._close_after_send(session)
+                return
+            session.username = state.username
+            self.names[state.username] = session
+            client_ip, client_port = session.address[:2]
+            # добавляем пользователя в список активных и если у него
+            # изменился открытый ключ сохраняем новый
+            self.database.user_login(
+                state.username,
+                client_ip,
+                client_port,
+                state.public_key)
+            self._queue_message(session, RESPONSE_200)
+            self.database.after_write(
+                self.call_soon, self._start_offline_delivery, session)
+            # Срок авторизации сменяется проверками активности
+            session.timer.cancel()
+            session.timer = self.call_later(
+                CONFIGS.PING_INTERVAL, self._check_idle, session)
+        else:
+            response = RESPONSE_400
+            response[CONFIGS.ERROR] = 'Неверный пароль.'
+            self._queue_message(session, response)
+            self._close_after_send(session)
+
+    def _check_idle(self, session):
+        """
+        Обработчик таймера сессии. Не авторизовавшийся вовремя клиент
+        отключается. Авторизованному клиенту, от которого ничего не
+        приходило PING_INTERVAL секунд, отправляется ping; если ответа нет
+        и через IDLE_TIMEOUT, соединение считается оборванным: оно
+        закрывается, а выход пользователя отмечается в базе.
+        """
+        session.timer = None
+        if session.sock is None:
+            return
+        if not session.authorized:
+            server_logger.info(
+                f'Истекло время авторизации клиента {session.name}')
+            self.remove_client(session)
+            return
+        idle = time.monotonic() - session.last_seen
+        if idle >= CONFIGS.IDLE_TIMEOUT:
+            server_logger.info(
+                f'Клиент {session.name} не отвечает {idle:.0f} с, '
+                f'соединение закрыто.')
+            self.remove_client(session)
+            return
+        if idle >= CONFIGS.PING_INTERVAL:
+            if not session.ping_pending:
+                session.ping_pending = True
+                self._queue_data(session, self._ping_frame)
+                if session.sock is None:
+                    return
+            delay = CONFIGS.IDLE_TIMEOUT - idle
+        else:
+            delay = CONFIGS.PING_INTERVAL - idle
+        session.timer = self.call_later(delay, self._check_idle, session)
 
     def service_update_lists(self):
-        """Метод реализующий отправки сервисного сообщения 205 клиентам."""
-        for client in self.names:
-            try:
-                send_message(self.names[client], RESPONSE_205, CONFIGS)
-            except OSError:
-                self.remove_client(self.names[client])
+        """
+        Метод реализующий отправки сервисного сообщения 205 клиентам.
+        Вызывается из GUI, поэтому сама рассылка выполняется в потоке
+        основного цикла. Вызовы в течение UPDATE_LISTS_DELAY объединяются
+        в одну рассылку.
+        """
+        if threading.current_thread() is not self:
+            self.call_soon(self.service_update_lists)
+            return
+        if self._update_lists_timer is None:
+            self._update_lists_timer = self.call_later(
+                CONFIGS.UPDATE_LISTS_DELAY,
+                self._broadcast_update_lists)
+
+    def _broadcast_update_lists(self):
+        """
+        Метод рассылки 205 с текущей версией справочника пользователей.
+        Сообщение кодируется один раз для всех клиентов.
+        """
+        self._update_lists_timer = None
+        data = encode_message({
+            **RESPONSE_205,
+            CONFIGS.DIRECTORY_VERSION: self.database.directory_version
+        }, CONFIGS.ENCODING)
+        for session in list(self.names.values()):
+            self._queue_data(session, data)
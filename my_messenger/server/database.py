@@ -1,16 +1,215 @@
+import collections
 import datetime
+import queue
+import threading
+import time
 
-from sqlalchemy import create_engine, Table, Column, Integer, String, \
-    MetaData, ForeignKey, DateTime, Text
+from sqlalchemy import create_engine, event, Table, Column, Integer, \
+    String, MetaData, ForeignKey, DateTime, Text, bindparam, inspect, select
 from sqlalchemy.orm import mapper, sessionmaker
 
+from my_messenger.common.utils import get_configs
+from my_messenger.log.server_log_config import server_logger
+from my_messenger.server.directory import UserDirectory, UserEntry
+from my_messenger.server.metrics import REGISTRY, DB_SECONDS, timed
+
+CONFIGS = get_configs()
+
+
+class WriteCallback:
+    """
+    Класс - метка в очереди записи: вызывает func(*args) в потоке записи
+    после коммита всех операций, поставленных раньше неё.
+    """
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def set(self):
+        try:
+            self.func(*self.args)
+        except Exception as err:
+            server_logger.error(f'Ошибка в обработчике записи: {err}')
+
+
+class Deferred:
+    """
+    Класс - операция, выполняемая в конце группы записи. Из нескольких
+    операций с одним ключом в группе выполняется одна.
+    """
+    __slots__ = ('key', 'func', 'args')
+
+    def __init__(self, key, func, args):
+        self.key = key
+        self.func = func
+        self.args = args
+
+
+class StorageWriter(threading.Thread):
+    """
+    Класс - поток отложенной записи в базу данных.
+    Берёт изменения из очереди и применяет их группами в одной транзакции:
+    коммит выполняется, когда набралось DB_WRITE_BATCH операций или прошло
+    DB_FLUSH_INTERVAL секунд с первой операции группы. Сетевой поток
+    только кладёт операцию в очередь и не ждёт диска. Периодические
+    операции (every) поток выполняет по своему таймеру, даже если
+    очередь пуста.
+    """
+
+    def __init__(self, session, batch_size, flush_interval):
+        super().__init__(name='storage-writer', daemon=True)
+        self.session = session
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        # Периодические операции: [срок, интервал, func, args]
+        self.periodic = []
+
+    def submit(self, func, *args):
+        """Метод постановки операции func(session, *args) в очередь."""
+        self.queue.put((func, args))
+
+    def defer(self, key, func, *args):
+        """
+        Метод постановки операции func(session, *args), выполняемой в конце
+        группы, один раз на ключ (например, обслуживание таблицы после
+        серии вставок).
+        """
+        self.queue.put(Deferred(key, func, args))
+
+    def every(self, interval, func, *args):
+        """
+        Метод регистрации операции func(session, *args), выполняемой раз
+        в interval секунд: с очередной группой записи или отдельно, если
+        записывать больше нечего. Вызывается до запуска потока.
+        """
+        self.periodic.append(
+            [time.monotonic() + interval, interval, func, args])
+
+    def _due(self):
+        """Метод выбора периодических операций, срок которых наступил."""
+        now = time.monotonic()
+        due = []
+        for task in self.periodic:
+            if now >= task[0]:
+                task[0] = now + task[1]
+                due.append((task[2], task[3]))
+        return due
+
+    def _timeout(self):
+        """Время ожидания очереди до срока ближайшей периодической операции."""
+        if not self.periodic:
+            return None
+        return max(min(task[0] for task in self.periodic) - time.monotonic(),
+                   0)
+
+    def after_write(self, func, *args):
+        """
+        Метод планирующий вызов func(*args) после записи всех поставленных
+        ранее операций. Вызов выполняется в потоке записи.
+        """
+        if self.is_alive():
+            self.queue.put(WriteCallback(func, args))
+        else:
+            func(*args)
+
+    def flush(self, timeout=None):
+        """
+        Барьер: ждёт, пока будут записаны все поставленные ранее операции.
+        :return: False, если не дождались за timeout.
+        """
+        if not self.is_alive():
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self):
+        """Метод завершения потока после записи всей очереди."""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self._timeout())
+            except queue.Empty:
+                self._apply(self._due())
+                continue
+            batch = []
+            deferred = dict()
+            barriers = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # Набираем группу до размера пачки или истечения интервала
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, (threading.Event, WriteCallback)):
+                    barriers.append(item)
+                elif isinstance(item, Deferred):
+                    deferred[item.key] = (item.func, item.args)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=max(timeout, 0)) \
+                        if batch else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            batch.extend(deferred.values())
+            batch.extend(self._due())
+            self._apply(batch)
+            for barrier in barriers:
+                barrier.set()
+            if stop:
+                return
+
+    def _apply(self, batch):
+        """Метод применения группы операций одной транзакцией."""
+        if not batch:
+            return
+        try:
+            for func, args in batch:
+                start = time.perf_counter()
+                func(self.session, *args)
+                DB_SECONDS.labels(func.__name__.lstrip('_')).observe(
+                    time.perf_counter() - start)
+            start = time.perf_counter()
+            self.session.commit()
+            DB_SECONDS.labels('commit').observe(time.perf_counter() - start)
+            return
+        except Exception as err:
+            server_logger.error(f'Ошибка групповой записи в базу: {err}')
+            self.session.rollback()
+        # Группа откатилась целиком - повторяем операции по одной, чтобы
+        # ошибка в одной не потеряла остальные.
+        for func, args in batch:
+            try:
+                func(self.session, *args)
+                self.session.commit()
+            except Exception as err:
+                server_logger.error(
+                    f'Ошибка записи в базу ({func.__name__}): {err}')
+                self.session.rollback()
+
 
 class ServerStorage:
     """
     Класс - оболочка для работы с базой данных сервера.
     Использует SQLite базу данных, реализован с помощью
     SQLAlchemy ORM и используется классический подход.
+    Чтение выполняется сразу, а изменения записываются потоком
+    StorageWriter; метод flush дожидается их записи.
     """
+    # Отображения классов на таблицы общие для всех экземпляров и
+    # создаются при первом открытии базы в процессе
+    _mapped = False
 
     class AllUsers:
         """Класс - отображение таблицы всех пользователей."""
@@ -59,6 +258,40 @@ class ServerStorage:
             self.sent = 0
             self.accepted = 0
 
+    class OfflineMessages:
+        """
+        Класс - отображение таблицы сообщений, ожидающих доставки
+        отключённому получателю. Сообщение хранится в виде JSON, как оно
+        пришло от отправителя (текст остаётся зашифрованным).
+        """
+
+        def __init__(self, recipient, created, payload):
+            self.id = None
+            self.recipient = recipient
+            self.created = created
+            self.payload = payload
+
+    class Groups:
+        """Класс - отображение таблицы групповых чатов."""
+
+        def __init__(self, name, created):
+            self.id = None
+            self.name = name
+            self.created = created
+
+    class GroupMembers:
+        """
+        Класс - отображение таблицы участников групп. Для каждого участника
+        хранится ключ группы, зашифрованный его открытым ключом: сервер
+        ключ группы не знает.
+        """
+
+        def __init__(self, group, user, key=None):
+            self.id = None
+            self.group = group
+            self.user = user
+            self.key = key
+
     def __init__(self, path):
         # Создаём движок базы данных
         self.database_engine = create_engine(
@@ -67,6 +300,8 @@ class ServerStorage:
             pool_recycle=7200,
             connect_args={
                 'check_same_thread': False})
+        # WAL: чтение не ждёт коммитов потока записи
+        event.listen(self.database_engine, 'connect', self._set_pragmas)
 
         # Создаём объект MetaData
         self.metadata = MetaData()
@@ -92,7 +327,8 @@ class ServerStorage:
         # Создаём таблицу истории входов
         user_login_history = Table('Login_history', self.metadata,
                                    Column('id', Integer, primary_key=True),
-                                   Column('name', ForeignKey('Users.id')),
+                                   Column('name', ForeignKey('Users.id'),
+                                          index=True),
                                    Column('date_time', DateTime),
                                    Column('ip', String),
                                    Column('port', String)
@@ -101,27 +337,82 @@ class ServerStorage:
         # Создаём таблицу контактов пользователей
         contacts = Table('Contacts', self.metadata,
                          Column('id', Integer, primary_key=True),
-                         Column('user', ForeignKey('Users.id')),
-                         Column('contact', ForeignKey('Users.id'))
+                         Column('user', ForeignKey('Users.id'), index=True),
+                         Column('contact', ForeignKey('Users.id'),
+                                index=True)
                          )
 
         # Создаём таблицу статистики пользователей
         users_history_table = Table('History', self.metadata,
                                     Column('id', Integer, primary_key=True),
-                                    Column('user', ForeignKey('Users.id')),
+                                    Column('user', ForeignKey('Users.id'),
+                                           index=True),
                                     Column('sent', Integer),
                                     Column('accepted', Integer)
                                     )
 
+        # Создаём таблицу сообщений для отключённых пользователей
+        offline_messages_table = Table(
+            'Offline_messages', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('recipient', ForeignKey('Users.id'), index=True),
+            Column('created', DateTime),
+            Column('payload', Text))
+
+        # Создаём таблицы групп и их участников
+        groups_table = Table('Groups', self.metadata,
+                             Column('id', Integer, primary_key=True),
+                             Column('name', String, unique=True),
+                             Column('created', DateTime)
+                             )
+        group_members_table = Table(
+            'Group_members', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('group', ForeignKey('Groups.id'), index=True),
+            Column('user', ForeignKey('Users.id'), index=True),
+            Column('key', Text))
+
+        # Запрос сохранения сообщения для отключённого пользователя:
+        # INSERT ... SELECT по имени получателя одним выражением, без
+        # загрузки объектов ORM. Для неизвестного имени ничего не вставит.
+        self._insert_offline = offline_messages_table.insert().from_select(
+            ['recipient', 'created', 'payload'],
+            select([users_table.c.id,
+                    bindparam('p_created', type_=DateTime),
+                    bindparam('p_payload', type_=Text)]).where(
+                users_table.c.name == bindparam('p_name')))
+
+        # Запрос прибавления накопленных счётчиков к строке статистики,
+        # выполняется одним executemany для всех пользователей
+        self._update_history = users_history_table.update().where(
+            users_history_table.c.id == bindparam('p_id')).values(
+            sent=users_history_table.c.sent + bindparam('p_sent'),
+            accepted=users_history_table.c.accepted + bindparam(
+                'p_accepted'))
+
         # Создаём таблицы
         self.metadata.create_all(self.database_engine)
+        # create_all не добавляет индексы в уже существующие таблицы -
+        # создаём недостающие в базе прежней версии
+        inspector = inspect(self.database_engine)
+        for table in self.metadata.sorted_tables:
+            existing = {index['name']
+                        for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(self.database_engine)
 
         # Создаём отображения
-        mapper(self.AllUsers, users_table)
-        mapper(self.ActiveUsers, active_users_table)
-        mapper(self.LoginHistory, user_login_history)
-        mapper(self.UsersContacts, contacts)
-        mapper(self.UsersHistory, users_history_table)
+        if not ServerStorage._mapped:
+            mapper(self.AllUsers, users_table)
+            mapper(self.ActiveUsers, active_users_table)
+            mapper(self.LoginHistory, user_login_history)
+            mapper(self.UsersContacts, contacts)
+            mapper(self.UsersHistory, users_history_table)
+            mapper(self.OfflineMessages, offline_messages_table)
+            mapper(self.Groups, groups_table)
+            mapper(self.GroupMembers, group_members_table)
+            ServerStorage._mapped = True
 
         # Создаём сессию
         Session = sessionmaker(bind=self.database_engine)
@@ -130,160 +421,510 @@ class ServerStorage:
         # Если в таблице активных пользователей есть записи, то их необходимо
         # удалить
         self.session.query(self.ActiveUsers).delete()
+        # и удалить недоставленные сообщения с истёкшим сроком хранения
+        self.session.query(self.OfflineMessages).filter(
+            self.OfflineMessages.created < self._offline_expiry()
+        ).delete(synchronize_session=False)
         self.session.commit()
 
+        # Справочник пользователей в памяти: имя -> id, хэш пароля,
+        # открытый ключ и строка статистики. Ключ, присланный при входе,
+        # попадает в справочник сразу, не дожидаясь записи в базу.
+        self.users = UserDirectory(
+            self._load_user,
+            CONFIGS.USER_CACHE_SIZE,
+            CONFIGS.USER_NEGATIVE_CACHE_SIZE,
+            CONFIGS.USER_CACHE_TTL,
+            CONFIGS.USER_NEGATIVE_CACHE_TTL)
+        # Счётчик изменений базы другими соединениями (поток записи,
+        # другие процессы) при последней сверке справочника и время
+        # следующей сверки
+        self.data_version = None
+        self.data_version_deadline = 0.0
+
+        # Версия справочника пользователей: растёт при регистрации и
+        # удалении, клиенты сравнивают её со своей перед обновлением списков.
+        self.directory_version = 0
+
+        # Поток записи со своей сессией (и своим соединением)
+        self.writer = StorageWriter(
+            Session(),
+            CONFIGS.DB_WRITE_BATCH,
+            CONFIGS.DB_FLUSH_INTERVAL)
+
+        # Счётчики статистики сообщений копятся в памяти (id строки
+        # History -> [отправлено, принято]) и записываются в базу потоком
+        # записи по таймеру раз в STATS_FLUSH_INTERVAL секунд.
+        # stats_flushing - переданные потоку записи, но ещё не
+        # закоммиченные; при откате они остаются и уходят со следующей
+        # записью. stats_version нечётна, пока идёт коммит счётчиков:
+        # message_history по ней узнаёт, что прочитанное могло уже
+        # включать stats_flushing.
+        self.stats = collections.defaultdict(lambda: [0, 0])
+        self.stats_flushing = dict()
+        self.stats_written = False
+        self.stats_version = 0
+        self.stats_lock = threading.Lock()
+        event.listen(self.writer.session, 'before_commit',
+                     self._stats_committing)
+        event.listen(self.writer.session, 'after_commit',
+                     self._stats_committed)
+        event.listen(self.writer.session, 'after_rollback',
+                     self._stats_rolled_back)
+        self.writer.every(CONFIGS.STATS_FLUSH_INTERVAL, self._flush_stats)
+        self.writer.start()
+        REGISTRY.gauge(
+            'messenger_db_write_queue',
+            'Операции, ожидающие записи в базу.',
+            func=self.writer.queue.qsize)
+        REGISTRY.counter(
+            'messenger_user_cache_hits_total',
+            'Запросы пользователя, обслуженные справочником в памяти.',
+            func=lambda: self.users.hits)
+        REGISTRY.counter(
+            'messenger_user_cache_misses_total',
+            'Запросы пользователя, потребовавшие чтения из базы.',
+            func=lambda: self.users.misses)
+
+    @staticmethod
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    def _load_user(self, name, session=None):
+        """
+        Метод чтения записи справочника из базы одним запросом.
+        Вызывается справочником при промахе; session - сессия потока,
+        которому нужна запись (по умолчанию сессия чтения).
+        """
+        row = (session or self.session).query(
+            self.AllUsers.id,
+            self.AllUsers.passwd_hash,
+            self.AllUsers.pubkey,
+            self.UsersHistory.id
+        ).outerjoin(
+            self.UsersHistory, self.UsersHistory.user == self.AllUsers.id
+        ).filter(self.AllUsers.name == name).first()
+        return UserEntry(*row) if row else None
+
+    def flush(self, timeout=None):
+        """Метод ожидания записи всех поставленных в очередь изменений."""
+        return self.writer.flush(timeout)
+
+    def after_write(self, func, *args):
+        """
+        Метод планирующий вызов func(*args) после записи всех поставленных
+        в очередь изменений. Вызов выполняется в потоке записи.
+        """
+        self.writer.after_write(func, *args)
+
+    def close(self):
+        """Метод записи очереди изменений и закрытия базы."""
+        self.writer.submit(self._flush_stats)
+        self.writer.stop()
+        self.writer.session.close()
+        self.session.close()
+        self.database_engine.dispose()
+
     def user_login(self, username, ip_address, port, key):
         """
         Метод выполняющийся при входе пользователя, записывает в базу
         факт входа
         Обновляет открытый ключ пользователя при его изменении.
         """
-        # Запрос в таблицу пользователей на наличие там пользователя с таким
-        # именем
-        rez = self.session.query(self.AllUsers).filter_by(name=username)
-
-        # Если имя пользователя уже присутствует в таблице, обновляем
-        # время последнего входа и проверяем корректность ключа.
-        # Если клиент прислал новый ключ, сохраняем его.
-        if rez.count():
-            user = rez.first()
-            user.last_login = datetime.datetime.now()
-            if user.pubkey != key:
-                user.pubkey = key
-        # Если нету, то генерируем исключение
-        else:
+        self.users.get(username)
+        self.users.set_pubkey(username, key)
+        self.writer.submit(
+            self._user_login, username, ip_address, port, key)
+
+    def _user_login(self, session, username, ip_address, port, key):
+        # Ищем пользователя в справочнике, если его нет - генерируем
+        # исключение
+        user = self.users.get(username, session)
+        if user is None:
             raise ValueError('Пользователь не зарегистрирован.')
 
+        # Обновляем время последнего входа и ключ одним запросом, без
+        # загрузки объекта (ключ в справочнике уже новый, поэтому
+        # записываем его без сравнения).
+        session.query(self.AllUsers).filter_by(id=user.id).update(
+            {'last_login': datetime.datetime.now(), 'pubkey': key},
+            synchronize_session=False)
+
         # Теперь можно создать запись в таблицу активных пользователей о факте
         # входа.
         new_active_user = self.ActiveUsers(
             user.id, ip_address, port, datetime.datetime.now())
-        self.session.add(new_active_user)
+        session.add(new_active_user)
 
         # и сохранить в историю входов
         history = self.LoginHistory(
             user.id, datetime.datetime.now(), ip_address, port)
-        self.session.add(history)
-
-        # Сохрраняем изменения
-        self.session.commit()
+        session.add(history)
 
     def add_user(self, name, passwd_hash):
         """
         Метод регистрации пользователя.
         Принимает имя и хэш пароля, создаёт запись в таблице статистики.
+        Дожидается записи, так как пользователь сразу может подключиться.
         """
+        self.writer.submit(self._add_user, name, passwd_hash)
+        self.flush()
+        self.users.invalidate(name)
+        self.directory_version += 1
+
+    def add_users(self, users):
+        """
+        Метод регистрации пачки пользователей (генератор нагрузки).
+        Принимает пары (имя, хэш пароля), записывает их группами
+        потока записи и дожидается записи.
+        """
+        for name, passwd_hash in users:
+            self.writer.submit(self._add_user, name, passwd_hash)
+        self.flush()
+        # Имена могли быть в отрицательном кэше
+        self.users.clear()
+        self.directory_version += 1
+
+    def _add_user(self, session, name, passwd_hash):
         user_row = self.AllUsers(name, passwd_hash)
-        self.session.add(user_row)
-        self.session.commit()
+        session.add(user_row)
+        session.flush()
         history_row = self.UsersHistory(user_row.id)
-        self.session.add(history_row)
-        self.session.commit()
+        session.add(history_row)
 
     def remove_user(self, name):
-        """Метод удаляющий пользователя из базы."""
-        user = self.session.query(self.AllUsers).filter_by(name=name).first()
-        self.session.query(self.ActiveUsers).filter_by(user=user.id).delete()
-        self.session.query(self.LoginHistory).filter_by(name=user.id).delete()
-        self.session.query(self.UsersContacts).filter_by(user=user.id).delete()
-        self.session.query(
+        """Метод удаляющий пользователя из базы. Дожидается записи."""
+        self.writer.submit(self._remove_user, name)
+        self.flush()
+        self.users.invalidate(name)
+        self.directory_version += 1
+
+    def _remove_user(self, session, name):
+        user = session.query(self.AllUsers).filter_by(name=name).first()
+        session.query(self.ActiveUsers).filter_by(user=user.id).delete()
+        session.query(self.LoginHistory).filter_by(name=user.id).delete()
+        session.query(self.UsersContacts).filter_by(user=user.id).delete()
+        session.query(
             self.UsersContacts).filter_by(
             contact=user.id).delete()
-        self.session.query(self.UsersHistory).filter_by(user=user.id).delete()
-        self.session.query(self.AllUsers).filter_by(name=name).delete()
-        self.session.commit()
+        session.query(self.UsersHistory).filter_by(user=user.id).delete()
+        session.query(
+            self.OfflineMessages).filter_by(
+            recipient=user.id).delete()
+        session.query(self.GroupMembers).filter_by(user=user.id).delete()
+        session.query(self.AllUsers).filter_by(name=name).delete()
 
+    # Методы чтения запрашивают столбцы, а не объекты: объекты из карты
+    # идентичности этой сессии не видели бы изменений потока записи.
+    def _sync_users(self):
+        """
+        Метод сверки справочника пользователей с базой.
+        Не чаще раза в USER_CACHE_SYNC_INTERVAL секунд проверяет, писал
+        ли кто-нибудь в базу (другой процесс зарегистрировал пользователя
+        или сохранил новый ключ), и если да - сбрасывает справочник
+        целиком. PRAGMA data_version не читает таблиц.
+        """
+        now = time.monotonic()
+        if now < self.data_version_deadline:
+            return
+        self.data_version_deadline = now + CONFIGS.USER_CACHE_SYNC_INTERVAL
+        version = self.session.execute('PRAGMA data_version').scalar()
+        if version != self.data_version:
+            self.data_version = version
+            self.users.clear()
+
+    # Сведения о пользователе по имени отвечает справочник в памяти.
+    @timed(DB_SECONDS)
     def get_hash(self, name):
         """Метод получения хэша пароля пользователя."""
-        user = self.session.query(self.AllUsers).filter_by(name=name).first()
-        return user.passwd_hash
+        self._sync_users()
+        user = self.users.get(name)
+        return user.passwd_hash if user else None
 
+    @timed(DB_SECONDS)
     def get_pubkey(self, name):
         """Метод получения публичного ключа пользователя."""
-        user = self.session.query(self.AllUsers).filter_by(name=name).first()
-        return user.pubkey
+        self._sync_users()
+        user = self.users.get(name)
+        return user.pubkey if user else None
 
+    @timed(DB_SECONDS)
     def check_user(self, name):
         """Метод проверяющий существование пользователя."""
-        if self.session.query(self.AllUsers).filter_by(name=name).count():
-            return True
-        else:
-            return False
+        self._sync_users()
+        return self.users.get(name) is not None
 
     def user_logout(self, username):
         """Метод фиксирующий отключения пользователя."""
+        self.writer.submit(self._user_logout, username)
+
+    def _user_logout(self, session, username):
         # Запрашиваем пользователя, что покидает нас
-        user = self.session.query(
-            self.AllUsers).filter_by(
-            name=username).first()
+        user = self.users.get(username, session)
+        if user is None:
+            return
 
         # Удаляем его из таблицы активных пользователей.
-        self.session.query(self.ActiveUsers).filter_by(user=user.id).delete()
-
-        # Применяем изменения
-        self.session.commit()
+        session.query(self.ActiveUsers).filter_by(user=user.id).delete()
 
     def process_message(self, sender, recipient):
-        """Метод записывающий в таблицу статистики факт передачи сообщения."""
-        # Получаем ID отправителя и получателя
-        sender = self.session.query(
-            self.AllUsers).filter_by(
-            name=sender).first().id
-        recipient = self.session.query(
-            self.AllUsers).filter_by(
-            name=recipient).first().id
-        # Запрашиваем строки из истории и увеличиваем счётчики
-        sender_row = self.session.query(
-            self.UsersHistory).filter_by(
-            user=sender).first()
-        sender_row.sent += 1
-        recipient_row = self.session.query(
-            self.UsersHistory).filter_by(
-            user=recipient).first()
-        recipient_row.accepted += 1
+        """
+        Метод учитывающий в статистике факт передачи сообщения.
+        Счётчики увеличиваются в памяти, запись в базу - пачкой по
+        таймеру потока записи раз в STATS_FLUSH_INTERVAL секунд и при
+        закрытии базы.
+        """
+        # Получаем строки статистики отправителя и получателя
+        sender = self.users.get(sender)
+        recipient = self.users.get(recipient)
+        if sender is None or recipient is None:
+            return
+        with self.stats_lock:
+            self.stats[sender.history_id][0] += 1
+            self.stats[recipient.history_id][1] += 1
 
-        self.session.commit()
+    def _flush_stats(self, session):
+        # Забираем накопленное к ещё не записанному и прибавляем всё
+        # одним executemany
+        with self.stats_lock:
+            for history_id, (sent, accepted) in self.stats.items():
+                counters = self.stats_flushing.setdefault(history_id, [0, 0])
+                counters[0] += sent
+                counters[1] += accepted
+            self.stats.clear()
+            if not self.stats_flushing:
+                return
+            params = [
+                {'p_id': history_id, 'p_sent': sent, 'p_accepted': accepted}
+                for history_id, (sent, accepted)
+                in self.stats_flushing.items()]
+        session.execute(self._update_history, params)
+        self.stats_written = True
+
+    def _stats_committing(self, session):
+        if self.stats_written:
+            with self.stats_lock:
+                self.stats_version += 1
+
+    def _stats_committed(self, session):
+        if self.stats_written:
+            with self.stats_lock:
+                self.stats_flushing.clear()
+                self.stats_version += 1
+            self.stats_written = False
+
+    def _stats_rolled_back(self, session):
+        if self.stats_written:
+            with self.stats_lock:
+                self.stats_version += self.stats_version % 2
+            self.stats_written = False
+
+    @staticmethod
+    def _offline_expiry():
+        """Время, раньше которого недоставленные сообщения устарели."""
+        return datetime.datetime.now() - datetime.timedelta(
+            seconds=CONFIGS.OFFLINE_MESSAGE_TTL)
+
+    def store_offline(self, recipient, payload):
+        """
+        Метод сохранения сообщения для отключённого пользователя.
+        :param recipient: имя получателя.
+        :param payload: сообщение в виде строки JSON.
+        """
+        self.writer.submit(
+            self._store_offline, recipient, datetime.datetime.now(), payload)
+        # Лимит и срок хранения проверяем не после каждой вставки, а один
+        # раз в конце группы записи.
+        self.writer.defer(
+            ('trim_offline', recipient), self._trim_offline, recipient)
+
+    def _store_offline(self, session, recipient, created, payload):
+        session.execute(self._insert_offline, {
+            'p_name': recipient,
+            'p_created': created,
+            'p_payload': payload})
+
+    def _trim_offline(self, session, recipient):
+        # Очередь пользователя ограничена: устаревшие и самые старые
+        # сверх лимита сообщения удаляем.
+        user = self.users.get(recipient, session)
+        if user is None:
+            return
+        user = user.id
+        session.query(self.OfflineMessages).filter(
+            self.OfflineMessages.recipient == user,
+            self.OfflineMessages.created < self._offline_expiry()
+        ).delete(synchronize_session=False)
+        cutoff = session.query(self.OfflineMessages.id).filter_by(
+            recipient=user).order_by(
+            self.OfflineMessages.id.desc()).offset(
+            CONFIGS.OFFLINE_QUEUE_LIMIT).limit(1).scalar()
+        if cutoff is not None:
+            dropped = session.query(self.OfflineMessages).filter(
+                self.OfflineMessages.recipient == user,
+                self.OfflineMessages.id <= cutoff
+            ).delete(synchronize_session=False)
+            server_logger.warning(
+                f'Очередь сообщений пользователя {recipient} переполнена, '
+                f'удалено старых сообщений: {dropped}')
+
+    @timed(DB_SECONDS)
+    def get_offline(self, username, after_id=0, limit=100):
+        """
+        Метод возвращающий порцию недоставленных сообщений пользователя:
+        список кортежей (id, сообщение JSON) с id больше after_id.
+        """
+        return self.session.query(
+            self.OfflineMessages.id,
+            self.OfflineMessages.payload
+        ).join(self.AllUsers).filter(
+            self.AllUsers.name == username,
+            self.OfflineMessages.id > after_id,
+            self.OfflineMessages.created >= self._offline_expiry()
+        ).order_by(self.OfflineMessages.id).limit(limit).all()
+
+    def delete_offline(self, username, up_to_id):
+        """Метод удаления доставленных сообщений с id до up_to_id."""
+        self.writer.submit(self._delete_offline, username, up_to_id)
+
+    def _delete_offline(self, session, username, up_to_id):
+        user = self.users.get(username, session)
+        if not user:
+            return
+        session.query(self.OfflineMessages).filter(
+            self.OfflineMessages.recipient == user.id,
+            self.OfflineMessages.id <= up_to_id
+        ).delete(synchronize_session=False)
+
+    def create_group(self, name, creator, key=None):
+        """
+        Метод создания группы. Создатель становится её первым участником.
+        :param key: ключ группы, зашифрованный открытым ключом создателя.
+        """
+        self.writer.submit(
+            self._create_group, name, creator, datetime.datetime.now(), key)
+
+    def _create_group(self, session, name, creator, created, key):
+        user = self.users.get(creator, session)
+        if user is None or session.query(
+                self.Groups).filter_by(name=name).count():
+            return
+        group_row = self.Groups(name, created)
+        session.add(group_row)
+        session.flush()
+        session.add(self.GroupMembers(group_row.id, user.id, key))
+
+    def _group_member(self, session, group, username):
+        """Запрос строки участника группы по именам группы и пользователя."""
+        return session.query(self.GroupMembers).filter(
+            self.GroupMembers.group == session.query(
+                self.Groups.id).filter_by(name=group).as_scalar(),
+            self.GroupMembers.user == session.query(
+                self.AllUsers.id).filter_by(name=username).as_scalar())
+
+    def add_group_member(self, group, username):
+        """Метод добавления пользователя в группу."""
+        self.writer.submit(self._add_group_member, group, username)
+
+    def _add_group_member(self, session, group, username):
+        if self._group_member(session, group, username).count():
+            return
+        group_id = session.query(
+            self.Groups.id).filter_by(name=group).scalar()
+        user = self.users.get(username, session)
+        if group_id is None or user is None:
+            return
+        session.add(self.GroupMembers(group_id, user.id))
+
+    def remove_group_member(self, group, username):
+        """Метод исключения пользователя из группы."""
+        self.writer.submit(self._remove_group_member, group, username)
+
+    def _remove_group_member(self, session, group, username):
+        self._group_member(session, group, username).delete(
+            synchronize_session=False)
+
+    def set_group_key(self, group, username, key):
+        """
+        Метод сохранения ключа группы для участника.
+        :param key: ключ группы, зашифрованный открытым ключом участника.
+        """
+        self.writer.submit(self._set_group_key, group, username, key)
+
+    def _set_group_key(self, session, group, username, key):
+        self._group_member(session, group, username).update(
+            {'key': key}, synchronize_session=False)
+
+    @timed(DB_SECONDS)
+    def get_group_key(self, group, username):
+        """Метод получения зашифрованного ключа группы участника."""
+        return self._group_member(
+            self.session, group, username).with_entities(
+            self.GroupMembers.key).scalar()
+
+    @timed(DB_SECONDS)
+    def groups_list(self):
+        """Метод возвращающий список имён групп."""
+        return [row[0] for row in self.session.query(self.Groups.name).all()]
+
+    @timed(DB_SECONDS)
+    def group_members(self):
+        """
+        Метод возвращающий участников всех групп: список кортежей
+        (имя группы, имя пользователя).
+        """
+        return self.session.query(
+            self.Groups.name,
+            self.AllUsers.name
+        ).select_from(self.GroupMembers).join(
+            self.Groups, self.GroupMembers.group == self.Groups.id).join(
+            self.AllUsers, self.GroupMembers.user == self.AllUsers.id).all()
 
     def add_contact(self, user, contact):
         """Метод добавления контакта для пользователя."""
+        self.writer.submit(self._add_contact, user, contact)
+
+    def _add_contact(self, session, user, contact):
         # Получаем ID пользователей
-        user = self.session.query(self.AllUsers).filter_by(name=user).first()
-        contact = self.session.query(
-            self.AllUsers).filter_by(
-            name=contact).first()
+        user = self.users.get(user, session)
+        contact = self.users.get(contact, session)
 
         # Проверяем что не дубль и что контакт может существовать (полю
         # пользователь мы доверяем)
-        if not contact or self.session.query(self.UsersContacts).filter_by(
+        if not user or not contact or session.query(
+                self.UsersContacts).filter_by(
                 user=user.id, contact=contact.id).count():
             return
 
         # Создаём объект и заносим его в базу
         contact_row = self.UsersContacts(user.id, contact.id)
-        self.session.add(contact_row)
-        self.session.commit()
+        session.add(contact_row)
 
     # Функция удаляет контакт из базы данных
     def remove_contact(self, user, contact):
         """Метод удаления контакта пользователя."""
+        self.writer.submit(self._remove_contact, user, contact)
+
+    def _remove_contact(self, session, user, contact):
         # Получаем ID пользователей
-        user = self.session.query(self.AllUsers).filter_by(name=user).first()
-        contact = self.session.query(
-            self.AllUsers).filter_by(
-            name=contact).first()
+        user = self.users.get(user, session)
+        contact = self.users.get(contact, session)
 
         # Проверяем что контакт может существовать (полю пользователь мы
         # доверяем)
-        if not contact:
+        if not user or not contact:
             return
 
         # Удаляем требуемое
-        self.session.query(self.UsersContacts).filter(
+        session.query(self.UsersContacts).filter(
             self.UsersContacts.user == user.id,
             self.UsersContacts.contact == contact.id
         ).delete()
-        self.session.commit()
 
+    @timed(DB_SECONDS)
     def users_list(self):
         """
         Метод возвращающий список известных пользователей со
@@ -297,6 +938,7 @@ class ServerStorage:
         # Возвращаем список кортежей
         return query.all()
 
+    @timed(DB_SECONDS)
     def active_users_list(self):
         """Метод возвращающий список активных пользователей."""
         # Запрашиваем соединение таблиц и собираем кортежи имя, адрес, порт,
@@ -310,6 +952,7 @@ class ServerStorage:
         # Возвращаем список кортежей
         return query.all()
 
+    @timed(DB_SECONDS)
     def login_history(self, username=None):
         """Метод возвращающий историю входов."""
         # Запрашиваем историю входа
@@ -324,29 +967,70 @@ class ServerStorage:
         # Возвращаем список кортежей
         return query.all()
 
+    @timed(DB_SECONDS)
     def get_contacts(self, username):
         """Метод возвращающий список контактов пользователя."""
         # Запрашивааем указанного пользователя
-        user = self.session.query(self.AllUsers).filter_by(name=username).one()
+        user = self.users.get(username)
+        if user is None:
+            return []
 
         # Запрашиваем его список контактов
-        query = self.session.query(self.UsersContacts, self.AllUsers.name). \
-            filter_by(user=user.id). \
+        query = self.session.query(self.AllUsers.name). \
+            select_from(self.UsersContacts). \
+            filter(self.UsersContacts.user == user.id). \
             join(self.AllUsers, self.UsersContacts.contact == self.AllUsers.id)
 
         # выбираем только имена пользователей и возвращаем их.
-        return [contact[1] for contact in query.all()]
+        return [contact[0] for contact in query.all()]
 
+    @timed(DB_SECONDS)
     def message_history(self):
-        """Метод возвращающий статистику сообщений."""
+        """
+        Метод возвращающий статистику сообщений, включая ещё не
+        записанные в базу счётчики.
+        """
         query = self.session.query(
+            self.UsersHistory.id,
             self.AllUsers.name,
             self.AllUsers.last_login,
             self.UsersHistory.sent,
             self.UsersHistory.accepted
         ).join(self.AllUsers)
+        # Если во время чтения коммитились счётчики, прочитанное могло
+        # уже включать stats_flushing - читаем заново.
+        for _ in range(100):
+            with self.stats_lock:
+                version = self.stats_version
+            if not version % 2:
+                rows = query.all()
+                with self.stats_lock:
+                    if version == self.stats_version:
+                        return self._merge_stats(rows)
+            time.sleep(0.01)
+        rows = query.all()
+        with self.stats_lock:
+            return self._merge_stats(rows)
+
+    def _merge_stats(self, rows):
+        """
+        Метод прибавления к строкам статистики ещё не записанных
+        счётчиков. Вызывается под stats_lock.
+        """
+        pending = [self.stats_flushing, self.stats]
+        pending = [counters for counters in pending if counters]
+        if not pending:
+            return [row[1:] for row in rows]
+        result = []
+        for history_id, name, last_login, sent, accepted in rows:
+            for counters in pending:
+                delta = counters.get(history_id)
+                if delta:
+                    sent += delta[0]
+                    accepted += delta[1]
+            result.append((name, last_login, sent, accepted))
         # Возвращаем список кортежей
-        return query.all()
+        return result
 
 
 # Отладка
@@ -363,4 +1047,5 @@ if __name__ == '__main__':
     test_db.add_contact('test1', 'test6')
     test_db.remove_contact('test1', 'test3')
     test_db.process_message('test1', 'test2')
+    test_db.flush()
     print(test_db.message_history())
@@ -0,0 +1,117 @@
+import collections
+import threading
+import time
+
+# Запись справочника: id пользователя, хэш пароля, открытый ключ и id
+# строки статистики (History)
+UserEntry = collections.namedtuple(
+    'UserEntry', ('id', 'passwd_hash', 'pubkey', 'history_id'))
+
+
+class UserDirectory:
+    """
+    Класс - кэш справочника пользователей перед базой данных.
+    При промахе запись читается функцией loader(name, *args) и
+    запоминается; имена, которых нет в базе, запоминаются отдельно
+    (отрицательный кэш), поэтому перебор несуществующих имён при
+    авторизации не доходит до SQLite. Оба кэша вытесняют давно не
+    использованные имена (LRU), размер 0 - без ограничения.
+
+    Базу могут менять и другие процессы (воркеры, генератор нагрузки),
+    поэтому записи живут не дольше ttl секунд, а имена из отрицательного
+    кэша - не дольше negative_ttl секунд (0 - без ограничения).
+
+    Кэшем пользуются сетевой поток и поток записи, поэтому словари
+    защищены блокировкой. Чтение из базы идёт без блокировки; если за
+    это время справочник изменился (invalidate, set_pubkey), прочитанное
+    не запоминается - оно могло устареть.
+    """
+
+    def __init__(self, loader, max_size=0, negative_size=0, ttl=0,
+                 negative_ttl=0, clock=time.monotonic):
+        self.loader = loader
+        self.max_size = max_size
+        self.negative_size = negative_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        # Имя -> (запись, срок годности) и имя -> срок годности
+        self.entries = collections.OrderedDict()
+        self.missing = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, *args):
+        """
+        Метод получения записи пользователя.
+        :return: UserEntry или None, если пользователя нет.
+        """
+        now = self.clock()
+        with self.lock:
+            cached = self.entries.get(name)
+            if cached is not None:
+                entry, expires = cached
+                if now < expires:
+                    self.entries.move_to_end(name)
+                    self.hits += 1
+                    return entry
+                del self.entries[name]
+            expires = self.missing.get(name)
+            if expires is not None:
+                if now < expires:
+                    self.missing.move_to_end(name)
+                    self.hits += 1
+                    return None
+                del self.missing[name]
+            self.misses += 1
+            generation = self.generation
+        entry = self.loader(name, *args)
+        with self.lock:
+            if generation == self.generation:
+                if entry is None:
+                    self._remember(self.missing, name,
+                                   self._expires(now, self.negative_ttl),
+                                   self.negative_size)
+                else:
+                    self._remember(self.entries, name,
+                                   (entry, self._expires(now, self.ttl)),
+                                   self.max_size)
+        return entry
+
+    @staticmethod
+    def _expires(now, ttl):
+        return now + ttl if ttl else float('inf')
+
+    @staticmethod
+    def _remember(cache, name, value, size):
+        cache[name] = value
+        if size and len(cache) > size:
+            cache.popitem(last=False)
+
+    def set_pubkey(self, name, key):
+        """Метод замены открытого ключа в записи пользователя."""
+        with self.lock:
+            self.generation += 1
+            cached = self.entries.get(name)
+            if cached is not None:
+                entry, expires = cached
+                self.entries[name] = (entry._replace(pubkey=key), expires)
+
+    def invalidate(self, name):
+        """
+        Метод сброса сведений о пользователе (регистрация, удаление):
+        следующий запрос прочитает его из базы.
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(name, None)
+            self.missing.pop(name, None)
+
+    def clear(self):
+        """Метод очистки кэша."""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.missing.clear()
@@ -0,0 +1,77 @@
+from my_messenger.common.utils import get_configs
+
+CONFIGS = get_configs()
+
+# Действия групп, меняющие состав участников
+MEMBERSHIP_ACTIONS = frozenset((
+    CONFIGS.CREATE_GROUP,
+    CONFIGS.JOIN_GROUP,
+    CONFIGS.LEAVE_GROUP,
+))
+
+# Действия, которые рассылаются всем участникам группы
+GROUP_ACTIONS = MEMBERSHIP_ACTIONS | {CONFIGS.GROUP_MESSAGE}
+
+
+class GroupIndex:
+    """
+    Класс - индекс участников групп в памяти: имя группы -> множество
+    имён пользователей. Загружается из базы при старте сервера, дальше
+    обновляется обработчиками действий групп, поэтому рассылка сообщения
+    группе не обращается к базе данных.
+    """
+
+    def __init__(self):
+        self.members = dict()
+
+    @classmethod
+    def load(cls, database):
+        """Метод построения индекса по данным базы."""
+        index = cls()
+        for group in database.groups_list():
+            index.create(group)
+        for group, username in database.group_members():
+            index.add(group, username)
+        return index
+
+    def create(self, group):
+        self.members.setdefault(group, set())
+
+    def add(self, group, username):
+        self.members.setdefault(group, set()).add(username)
+
+    def remove(self, group, username):
+        if group in self.members:
+            self.members[group].discard(username)
+
+    def remove_user(self, username):
+        """Метод исключения пользователя из всех групп."""
+        for members in self.members.values():
+            members.discard(username)
+
+    def get(self, group):
+        """Метод возвращающий участников группы (пустое множество, если
+        группы нет)."""
+        return self.members.get(group, frozenset())
+
+    def is_member(self, group, username):
+        return username in self.members.get(group, ())
+
+    def apply(self, message):
+        """
+        Метод применения к индексу уведомления о создании группы,
+        вступлении или выходе участника (ACCOUNT_NAME).
+        """
+        action = message[CONFIGS.ACTION]
+        group = message[CONFIGS.GROUP]
+        username = message[CONFIGS.ACCOUNT_NAME]
+        if action == CONFIGS.LEAVE_GROUP:
+            self.remove(group, username)
+        else:
+            self.add(group, username)
+
+    def __contains__(self, group):
+        return group in self.members
+
+    def __len__(self):
+        return len(self.members)
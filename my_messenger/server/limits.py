@@ -0,0 +1,158 @@
+import time
+
+from my_messenger.common.utils import get_configs
+
+CONFIGS = get_configs()
+
+
+class TokenBucket:
+    """
+    Класс - корзина маркеров: пополняется со скоростью rate маркеров в
+    секунду до burst, каждый запрос забирает один маркер.
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def consume(self, now):
+        """Метод списания маркера. False - лимит исчерпан."""
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return True
+        self.tokens = tokens
+        return False
+
+    def full(self, now):
+        """Метод проверки, что корзина уже наполнилась до burst."""
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Класс - ограничение частоты запросов по ключу (имени пользователя
+    или IP-адресу) отдельно для каждого действия протокола.
+    :param rules: словарь действие -> (rate, burst); правило default
+    применяется к действиям без своего правила, None - без ограничения.
+    """
+
+    def __init__(self, rules):
+        self.rules = dict(rules)
+        self.default = self.rules.pop('default', None)
+        # (ключ, действие) -> TokenBucket
+        self.buckets = dict()
+
+    def allow(self, key, action, now):
+        rule = self.rules.get(action, self.default)
+        if not rule:
+            return True
+        bucket = self.buckets.get((key, action))
+        if bucket is None:
+            bucket = self.buckets[(key, action)] = TokenBucket(
+                rule[0], rule[1], now)
+        return bucket.consume(now)
+
+    def purge(self, now):
+        """
+        Метод удаления наполнившихся корзин: их состояние совпадает с
+        новой корзиной, а память под отключившихся клиентов освобождается.
+        """
+        for key in [key for key, bucket in self.buckets.items()
+                    if bucket.full(now)]:
+            del self.buckets[key]
+
+
+class Limits:
+    """
+    Класс - ограничения нагрузки сервера: частота запросов каждого
+    пользователя и каждого IP-адреса по действиям и допуск новых
+    соединений (не больше max_connections одновременно и не чаще
+    accept_rate в секунду с запасом accept_burst).
+    """
+
+    def __init__(self, user_rules, ip_rules, max_connections, accept_rate,
+                 accept_burst):
+        self.users = RateLimiter(user_rules)
+        self.addresses = RateLimiter(ip_rules)
+        self.max_connections = max_connections
+        self.accept = TokenBucket(accept_rate, accept_burst, time.monotonic())
+        # Счётчики отказов
+        self.rejected_requests = 0
+        self.rejected_connections = 0
+
+    @staticmethod
+    def parse_rule(value):
+        """
+        Функция разбора правила из server.ini: "запросов в секунду,
+        размер пачки" ("1, 5"); 0 или off - без ограничения.
+        """
+        value = value.strip().lower()
+        if value in ('', '0', 'off', 'none'):
+            return None
+        rate, _, burst = value.partition(',')
+        rate = float(rate)
+        return rate, float(burst) if burst.strip() else max(rate, 1)
+
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Метод создания ограничений: значения по умолчанию из configs.json,
+        секции USER_LIMITS, IP_LIMITS и ADMISSION файла server.ini
+        (если переданы) их дополняют.
+        """
+        rules = {}
+        for section, key in (('USER_LIMITS', 'USER_RATE_LIMITS'),
+                             ('IP_LIMITS', 'IP_RATE_LIMITS')):
+            rules[section] = {action: tuple(rule) if rule else None
+                              for action, rule in CONFIGS.get(key).items()}
+            if config is not None and section in config:
+                for action, value in config[section].items():
+                    rules[section][action] = cls.parse_rule(value)
+        admission = {
+            'max_connections': CONFIGS.MAX_CLIENT_CONNECTIONS,
+            'accept_rate': CONFIGS.ACCEPT_RATE,
+            'accept_burst': CONFIGS.ACCEPT_BURST
+        }
+        if config is not None and 'ADMISSION' in config:
+            for name in admission:
+                if name in config['ADMISSION']:
+                    admission[name] = float(config['ADMISSION'][name])
+        return cls(rules['USER_LIMITS'], rules['IP_LIMITS'], **admission)
+
+    def allow(self, action, username, address, now=None):
+        """
+        Метод проверки запроса: лимит IP-адреса и, для авторизованного
+        клиента, лимит пользователя. False - запрос нужно отклонить.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.addresses.allow(address, action, now) and (
+                username is None or self.users.allow(username, action, now)):
+            return True
+        self.rejected_requests += 1
+        return False
+
+    def admit(self, connections, now=None):
+        """Метод допуска нового соединения при connections открытых."""
+        if now is None:
+            now = time.monotonic()
+        if connections < self.max_connections and self.accept.consume(now):
+            return True
+        self.rejected_connections += 1
+        return False
+
+    def __bool__(self):
+        """Есть ли корзины запросов, которые предстоит освобождать."""
+        return bool(self.users.buckets or self.addresses.buckets)
+
+    def purge(self, now=None):
+        """Метод освобождения памяти под неактивные корзины."""
+        if now is None:
+            now = time.monotonic()
+        self.users.purge(now)
+        self.addresses.purge(now)
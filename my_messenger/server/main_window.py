@@ -41,6 +41,9 @@ class MainWindow(QMainWindow):
         # Кнопка вывести историю сообщений
         self.show_history_button = QAction('История клиентов', self)
 
+        # Кнопка снятия профиля работающего сервера
+        self.profile_btn = QAction('Профилирование', self)
+
         # Статусбар
         self.statusBar()
         self.statusBar().showMessage('Server Working')
@@ -53,6 +56,7 @@ class MainWindow(QMainWindow):
         self.toolbar.addAction(self.config_btn)
         self.toolbar.addAction(self.register_btn)
         self.toolbar.addAction(self.remove_btn)
+        self.toolbar.addAction(self.profile_btn)
 
         # Настройки геометрии основного окна
         # Поскольку работать с динамическими размерами мы не умеем, и мало
@@ -81,6 +85,7 @@ class MainWindow(QMainWindow):
         self.config_btn.triggered.connect(self.server_config)
         self.register_btn.triggered.connect(self.reg_user)
         self.remove_btn.triggered.connect(self.rem_user)
+        self.profile_btn.triggered.connect(self.start_profiling)
 
         # Последним параметром отображаем окно.
         self.show()
@@ -131,3 +136,15 @@ class MainWindow(QMainWindow):
         global rem_window
         rem_window = DelUserDialog(self.database, self.server_thread)
         rem_window.show()
+
+    def start_profiling(self):
+        """Метод запускающий профилирование сервера."""
+        # Модуль профилировщика загружается только по запросу
+        from my_messenger.server.profiler import start_profiling
+        sampler = start_profiling()
+        if sampler is None:
+            self.statusBar().showMessage('Профилирование уже запущено')
+        else:
+            self.statusBar().showMessage(
+                f'Профилирование: {sampler.seconds} с, результат в '
+                f'{sampler.directory}')
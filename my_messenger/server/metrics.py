@@ -0,0 +1,274 @@
+import bisect
+import threading
+import time
+from functools import wraps
+
+from my_messenger.log.server_log_config import server_logger, \
+    queue_handler as log_queue_handler
+
+# Границы корзин гистограмм задержек по умолчанию, секунды
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    """
+    Класс - монотонно растущий счётчик.
+    Запись - одно сложение без блокировок: под GIL потеря приращения
+    возможна только при гонке двух потоков и для статистики допустима.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield name, (), self.value
+
+
+class Gauge(Counter):
+    """Класс - текущее значение, которое может и уменьшаться."""
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram:
+    """
+    Класс - гистограмма с фиксированными границами корзин.
+    observe находит корзину двоичным поиском и увеличивает её счётчик,
+    накопленные значения (как ждёт Prometheus) считаются при выгрузке.
+    """
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self, name):
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield f'{name}_bucket', (('le', repr(bound)),), total
+        total += self.counts[-1]
+        yield f'{name}_bucket', (('le', '+Inf'),), total
+        yield f'{name}_sum', (), self.sum
+        yield f'{name}_count', (), total
+
+
+class Family:
+    """
+    Класс - метрика с именем, описанием и набором меток.
+    Значения для каждого сочетания меток создаются при первом обращении
+    к labels и затем берутся из словаря. Метрика с функцией func не
+    хранит значения, а вычисляет его при выгрузке (число сессий, глубина
+    очередей), поэтому ничего не стоит на горячем пути.
+    """
+
+    def __init__(self, name, documentation, kind, factory, labelnames=(),
+                 func=None):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.factory = factory
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self.children = dict()
+
+    def labels(self, *values):
+        """Метод получения значения метрики для сочетания меток."""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, self.factory())
+        return child
+
+    def render(self):
+        """Метод выгрузки метрики в текстовом формате Prometheus."""
+        lines = [f'# HELP {self.name} {escape_help(self.documentation)}',
+                 f'# TYPE {self.name} {self.kind}']
+        if self.func is not None:
+            lines.append(f'{self.name} {format_value(self.func())}')
+            return lines
+        for values, child in sorted(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            for name, extra, value in child.samples(self.name):
+                lines.append(
+                    f'{name}{format_labels(labels + extra)} '
+                    f'{format_value(value)}')
+        return lines
+
+
+def escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+class Registry:
+    """
+    Класс - реестр метрик процесса.
+    Методы counter, gauge и histogram возвращают уже зарегистрированную
+    метрику с тем же именем, поэтому модули и несколько экземпляров
+    сервера в одном процессе могут объявлять одни и те же метрики.
+    Метрика без меток возвращается сразу значением (Counter, Gauge,
+    Histogram), с метками - объектом Family.
+    """
+
+    def __init__(self):
+        self.families = dict()
+        self.lock = threading.Lock()
+
+    def _register(self, name, documentation, kind, factory, labelnames,
+                  func):
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = Family(
+                    name, documentation, kind, factory, labelnames, func)
+            elif func is not None:
+                # Новый экземпляр сервера заменяет источник значения
+                family.func = func
+        if family.labelnames or family.func is not None:
+            return family
+        return family.labels()
+
+    def counter(self, name, documentation, labelnames=(), func=None):
+        return self._register(
+            name, documentation, 'counter', Counter, labelnames, func)
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        return self._register(
+            name, documentation, 'gauge', Gauge, labelnames, func)
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._register(
+            name, documentation, 'histogram',
+            lambda: Histogram(buckets), labelnames, None)
+
+    def render(self):
+        """Метод выгрузки всех метрик в текстовом формате Prometheus."""
+        with self.lock:
+            families = list(self.families.values())
+        lines = []
+        for family in families:
+            try:
+                lines.extend(family.render())
+            except Exception as err:
+                server_logger.error(
+                    f'Ошибка вычисления метрики {family.name}: {err}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+# Реестр процесса и общие метрики сервера
+REGISTRY = Registry()
+
+ACTION_SECONDS = REGISTRY.histogram(
+    'messenger_action_seconds',
+    'Время обработки запроса клиента по действиям протокола.',
+    ('action',))
+DB_SECONDS = REGISTRY.histogram(
+    'messenger_db_seconds',
+    'Время выполнения запросов и записи в базу данных.',
+    ('query',))
+BYTES_RECEIVED = REGISTRY.counter(
+    'messenger_received_bytes_total', 'Принято байт от клиентов.')
+BYTES_SENT = REGISTRY.counter(
+    'messenger_sent_bytes_total', 'Отправлено байт клиентам.')
+REGISTRY.counter(
+    'messenger_log_dropped_total',
+    'Записи лога, потерянные из-за переполнения очереди.',
+    func=lambda: log_queue_handler.dropped)
+
+
+def timed(histogram, label=None):
+    """
+    Декоратор, записывающий время выполнения функции в гистограмму
+    histogram с меткой label (по умолчанию - имя функции).
+    """
+    def decorator(func):
+        child = histogram.labels(label or func.__name__)
+        clock = time.perf_counter
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(clock() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def start_metrics_server(address, port, registry=REGISTRY):
+    """
+    Функция запуска HTTP сервера выгрузки метрик в отдельном потоке.
+    Метрики отдаются по адресу http://address:port/metrics.
+    http.server импортируется здесь: без порта метрик он не нужен.
+    :return: объект ThreadingHTTPServer (остановка - shutdown).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        """Класс - обработчик HTTP запросов к выгрузке метрик."""
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            server_logger.debug(f'Запрос метрик: {format % args}')
+
+    server = ThreadingHTTPServer((address, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    thread = threading.Thread(
+        target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    server_logger.info(
+        f'Метрики доступны по адресу http://{address}:{port}/metrics')
+    return server
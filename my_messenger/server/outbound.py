@@ -0,0 +1,149 @@
+import collections
+import itertools
+import tempfile
+
+# Политики для клиента, который не успевает принимать данные:
+# отбрасывать новые сообщения, сбрасывать их на диск или отключать клиента.
+DROP = 'drop'
+SPILL = 'spill'
+DISCONNECT = 'disconnect'
+
+POLICIES = (DROP, SPILL, DISCONNECT)
+
+# Сколько кадров отправлять одним вызовом sendmsg
+SEND_BATCH = 64
+
+
+class OutboundBuffer:
+    """
+    Класс - ограниченный исходящий буфер одного соединения.
+    Хранит закодированные кадры и отправляет их, когда сокет готов к
+    записи. При превышении верхней границы (high_watermark) применяется
+    политика для медленного клиента; состояние перегрузки снимается,
+    когда очередь опустится до нижней границы (low_watermark).
+    """
+
+    def __init__(self, high_watermark, low_watermark, policy=DISCONNECT):
+        if policy not in POLICIES:
+            raise ValueError(f'Неизвестная политика {policy}')
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.policy = policy
+
+        # Кадры в памяти и число байт в них
+        self.chunks = collections.deque()
+        self.size = 0
+        # Уже отправленная часть первого кадра
+        self.head_offset = 0
+
+        # Флаг перегрузки (между верхней и нижней границей)
+        self.overloaded = False
+
+        # Файл для сброса на диск: позиция чтения и неотправленный объём
+        self.spill_file = None
+        self.spill_read_pos = 0
+        self.spill_size = 0
+
+        # Счётчики
+        self.dropped = 0
+        self.spilled = 0
+        self.sent = 0
+
+    def __len__(self):
+        """Глубина очереди в байтах, включая сброшенное на диск."""
+        return self.size + self.spill_size
+
+    def push(self, data):
+        """
+        Метод постановки кадра в очередь.
+        :return: False, если по политике клиента нужно отключить.
+        """
+        # Пока часть очереди на диске, новые кадры идут туда же,
+        # иначе нарушится порядок.
+        if self.spill_size:
+            self._spill(data)
+            return True
+        # Одиночный кадр принимаем всегда, даже если он больше границы
+        if self.size and self.size + len(data) > self.high_watermark:
+            self.overloaded = True
+        if self.overloaded:
+            if self.policy == DISCONNECT:
+                return False
+            if self.policy == DROP:
+                self.dropped += 1
+                return True
+            self._spill(data)
+            return True
+        self.chunks.append(data)
+        self.size += len(data)
+        return True
+
+    def send_to(self, sock):
+        """
+        Метод отправки накопленных данных в неблокирующий сокет.
+        Отправляет, пока сокет принимает данные.
+        :return: количество отправленных байт.
+        """
+        total = 0
+        while self.chunks:
+            try:
+                if hasattr(sock, 'sendmsg'):
+                    buffers = [memoryview(self.chunks[0])[self.head_offset:]]
+                    buffers.extend(
+                        itertools.islice(self.chunks, 1, SEND_BATCH))
+                    sent = sock.sendmsg(buffers)
+                else:
+                    sent = sock.send(
+                        memoryview(self.chunks[0])[self.head_offset:])
+            except BlockingIOError:
+                break
+            self._consume(sent)
+            total += sent
+            if self.size <= self.low_watermark:
+                self.overloaded = False
+                if self.spill_size:
+                    self._refill()
+        self.sent += total
+        return total
+
+    def _consume(self, sent):
+        """Метод удаления отправленных байт из начала очереди."""
+        self.size -= sent
+        while sent:
+            head_left = len(self.chunks[0]) - self.head_offset
+            if sent >= head_left:
+                sent -= head_left
+                self.chunks.popleft()
+                self.head_offset = 0
+            else:
+                self.head_offset += sent
+                sent = 0
+
+    def _spill(self, data):
+        """Метод сброса кадра в файл на диске."""
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix='messenger-')
+            self.spill_read_pos = 0
+        self.spill_file.seek(0, 2)
+        self.spill_file.write(data)
+        self.spill_size += len(data)
+        self.spilled += 1
+
+    def _refill(self):
+        """Метод подкачки данных с диска в память до верхней границы."""
+        self.spill_file.seek(self.spill_read_pos)
+        data = self.spill_file.read(
+            min(self.spill_size, self.high_watermark - self.size))
+        self.spill_read_pos += len(data)
+        self.spill_size -= len(data)
+        self.chunks.append(data)
+        self.size += len(data)
+        if not self.spill_size:
+            self.close()
+
+    def close(self):
+        """Метод удаления файла сброса."""
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+            self.spill_size = 0
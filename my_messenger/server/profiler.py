@@ -0,0 +1,243 @@
+"""
+Профилировщик работающего сервера по запросу.
+
+Сервер импортирует модуль только по команде консоли, кнопке GUI или
+с параметром --profile_signal (PROFILE_ON_SIGNAL), который ставит
+обработчик сигнала и поток profile-trigger, ждущий сигнала. Пока
+профилирование не запущено, нет хуков трассировки и tracemalloc. По
+сигналу (SIGUSR2 по умолчанию), команде консоли или кнопке GUI
+запускается поток, который с частотой
+PROFILE_RATE снимает стеки выбранных потоков через sys._current_frames()
+в течение PROFILE_SECONDS секунд, а затем записывает их в свёрнутом
+формате (collapsed stacks), который читают flamegraph.pl, speedscope
+и inferno:
+
+    MainThread;run (core.py:158);select (selectors.py:451) 1234
+
+С PROFILE_TRACEMALLOC рядом записывается разница снимков памяти
+tracemalloc между началом и концом профилирования.
+"""
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+from my_messenger.common.utils import get_configs
+from my_messenger.log.server_log_config import server_logger
+
+CONFIGS = get_configs()
+
+# Каталог результатов по умолчанию - каталог логов сервера
+DEFAULT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log')
+
+# Текущее профилирование процесса (одновременно только одно)
+_active = None
+_active_lock = threading.Lock()
+
+# Канал от обработчика сигнала к потоку запуска профилирования
+_trigger_write = None
+
+
+class StackSampler(threading.Thread):
+    """
+    Класс - поток, снимающий стеки других потоков с заданной частотой.
+    Стеки считаются в Counter по строке 'поток;кадр;кадр', подписи кадров
+    кэшируются по объекту кода, поэтому снимок стоит обход кадров и
+    одну склейку строки.
+    """
+
+    def __init__(self, rate, seconds, threads=(), directory=None,
+                 trace_memory=False):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.interval = 1 / rate
+        self.seconds = seconds
+        # Имена потоков для снимков, пустой набор - все потоки
+        self.threads = frozenset(threads)
+        self.directory = directory or DEFAULT_DIR
+        self.trace_memory = trace_memory
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.overhead = 0.0
+        self.labels = dict()
+        self.path = None
+        self.started = None
+        self._stop_event = threading.Event()
+
+    def label(self, code):
+        """Метод получения подписи кадра: функция (файл:строка)."""
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = '{} ({}:{})'.format(
+                code.co_name, os.path.basename(code.co_filename),
+                code.co_firstlineno)
+        return label
+
+    def sample(self):
+        """Метод одного снимка стеков всех выбранных потоков."""
+        names = {thread.ident: thread.name
+                 for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, str(ident))
+            if ident == own or self.threads and name not in self.threads:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            stack.append(name)
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def run(self):
+        self.started = time.strftime('%Y%m%d-%H%M%S')
+        snapshot = None
+        started_tracing = False
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                started_tracing = True
+            snapshot = tracemalloc.take_snapshot()
+
+        clock = time.perf_counter
+        deadline = clock() + self.seconds
+        next_sample = clock()
+        while not self._stop_event.is_set():
+            now = clock()
+            if now >= deadline:
+                break
+            self.sample()
+            self.overhead += clock() - now
+            # Следующий снимок по расписанию: время снимка не сдвигает
+            # частоту
+            next_sample += self.interval
+            delay = next_sample - clock()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                next_sample = clock()
+
+        self.path = self.write()
+        if snapshot is not None:
+            self.write_memory_diff(snapshot)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def stop(self):
+        """Метод досрочной остановки: результаты всё равно записываются."""
+        self._stop_event.set()
+
+    def base_name(self):
+        return os.path.join(self.directory, 'profile-{}-{}'.format(
+            os.getpid(), self.started))
+
+    def write(self):
+        """Метод записи стеков в свёрнутом формате. :return: путь файла."""
+        path = self.base_name() + '.collapsed'
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in sorted(self.stacks.items()):
+                output.write(f'{stack} {count}\n')
+        cost = self.overhead / self.samples * 1e6 if self.samples else 0
+        server_logger.info(
+            f'Профиль записан в {path}: {self.samples} снимков, '
+            f'{cost:.0f} мкс на снимок')
+        return path
+
+    def write_memory_diff(self, snapshot, limit=50):
+        """Метод записи разницы снимков памяти с начала профилирования."""
+        import tracemalloc
+        path = self.base_name() + '.tracemalloc.txt'
+        # Собственные выделения профилировщика в разницу не попадают
+        own = (tracemalloc.Filter(False, __file__),
+               tracemalloc.Filter(False, tracemalloc.__file__))
+        stats = tracemalloc.take_snapshot().filter_traces(own).compare_to(
+            snapshot.filter_traces(own), 'lineno')
+        with open(path, 'w', encoding='utf-8') as output:
+            for stat in stats[:limit]:
+                output.write(f'{stat}\n')
+        server_logger.info(f'Разница снимков памяти записана в {path}')
+
+
+def start_profiling(seconds=None, rate=None, threads=None,
+                    trace_memory=None, directory=None):
+    """
+    Функция запуска профилирования с параметрами из конфигурации.
+    :return: запущенный StackSampler или None, если профилирование уже
+    идёт.
+    """
+    global _active
+    with _active_lock:
+        if _active is not None and _active.is_alive():
+            server_logger.warning('Профилирование уже запущено.')
+            return None
+        _active = StackSampler(
+            rate or CONFIGS.PROFILE_RATE,
+            seconds or CONFIGS.PROFILE_SECONDS,
+            CONFIGS.PROFILE_THREADS if threads is None else threads,
+            directory or CONFIGS.PROFILE_DIR,
+            CONFIGS.PROFILE_TRACEMALLOC if trace_memory is None
+            else trace_memory)
+        _active.start()
+    server_logger.info(
+        f'Профилирование запущено на {_active.seconds} с, '
+        f'{1 / _active.interval:.0f} снимков в секунду')
+    return _active
+
+
+def stop_profiling():
+    """
+    Функция досрочного завершения профилирования (например, при
+    остановке сервера) с записью собранных стеков.
+    """
+    with _active_lock:
+        sampler = _active
+    if sampler is not None and sampler.is_alive():
+        sampler.stop()
+        sampler.join()
+
+
+def _on_signal(number, frame):
+    # Обработчик прерывает главный поток в любом месте, в том числе под
+    # _active_lock или блокировкой логгера, поэтому только будит поток
+    # запуска: запись байта в канал блокировок не берёт.
+    try:
+        os.write(_trigger_write, b'p')
+    except BlockingIOError:
+        # Канал полон - поток запуска и так проснётся
+        pass
+
+
+def _trigger_loop(read_fd):
+    """Цикл потока, запускающего профилирование по сигналу."""
+    while True:
+        if not os.read(read_fd, 64):
+            return
+        start_profiling()
+
+
+def install_signal_handler(signal_name=None):
+    """
+    Функция установки обработчика сигнала, запускающего профилирование
+    (kill -USR2 <pid>). Обработчик выполняется в главном потоке, поэтому
+    его нужно ставить оттуда; сам он лишь пишет байт в канал, а
+    профилирование запускает поток profile-trigger. На платформах без
+    сигнала ничего не делает.
+    :return: номер сигнала или None.
+    """
+    global _trigger_write
+    signum = getattr(signal, signal_name or CONFIGS.PROFILE_SIGNAL,
+                     None)
+    if signum is None:
+        return None
+    if _trigger_write is None:
+        read_fd, _trigger_write = os.pipe()
+        os.set_blocking(_trigger_write, False)
+        threading.Thread(target=_trigger_loop, args=(read_fd,),
+                         name='profile-trigger', daemon=True).start()
+    signal.signal(signum, _on_signal)
+    return signum
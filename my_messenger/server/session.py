@@ -0,0 +1,67 @@
+import time
+
+from my_messenger.common.framing import FrameDecoder
+
+
+class AuthState:
+    """
+    Класс - состояние авторизации соединения между отправкой запроса 511
+    и получением ответа клиента.
+    """
+    __slots__ = ('username', 'public_key', 'digest')
+
+    def __init__(self, username, public_key, digest):
+        self.username = username
+        self.public_key = public_key
+        self.digest = digest
+
+
+class Session:
+    """
+    Класс - состояние одного клиентского соединения сервера.
+    MessageProcessor хранит сессии в словарях по дескриптору сокета и по
+    имени пользователя, поэтому поиск пользователя по сокету и проверка
+    авторизации не зависят от числа подключённых клиентов.
+    """
+    __slots__ = ('sock', 'fd', 'address', 'username', 'auth', 'decoder',
+                 'out_buffer', 'closing', 'offline_cursor', 'messages_in',
+                 'messages_out', 'last_seen', 'ping_pending', 'timer')
+
+    def __init__(self, sock, address, out_buffer, decoder=None):
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.address = address
+        # Имя пользователя - только после успешной авторизации
+        self.username = None
+        # AuthState, пока клиент не ответил на запрос 511
+        self.auth = None
+        self.decoder = decoder if decoder is not None else FrameDecoder()
+        self.out_buffer = out_buffer
+        # Соединение закрывается после отправки буфера
+        self.closing = False
+        # id последнего переданного в буфер сообщения из очереди для
+        # отключённых пользователей; None - доставка не идёт
+        self.offline_cursor = None
+        # Счётчики принятых и поставленных в очередь сообщений
+        self.messages_in = 0
+        self.messages_out = 0
+        # Время последнего приёма данных (time.monotonic), отправлен ли
+        # клиенту ping без ответа и таймер срока авторизации или
+        # проверки активности
+        self.last_seen = time.monotonic()
+        self.ping_pending = False
+        self.timer = None
+
+    @property
+    def authorized(self):
+        return self.username is not None
+
+    @property
+    def name(self):
+        """Имя пользователя или адрес для ещё не авторизованного клиента."""
+        if self.username is not None:
+            return self.username
+        return str(self.address)
+
+    def __repr__(self):
+        return f'<Session {self.name} fd={self.fd}>'
@@ -0,0 +1,95 @@
+import math
+import time
+
+
+class Timer:
+    """
+    Класс - отложенный вызов в цикле MessageProcessor.
+    Отменённый таймер остаётся в ячейке колеса и выбрасывается, когда
+    колесо до неё доходит.
+    """
+    __slots__ = ('deadline', 'rounds', 'func', 'args', 'cancelled')
+
+    def __init__(self, deadline, rounds, func, args):
+        self.deadline = deadline
+        # Сколько раз колесо пройдёт ячейку до срабатывания
+        self.rounds = rounds
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Класс - хэшированное колесо таймеров.
+    Время делится на такты длиной tick, таймер кладётся в ячейку
+    (номер такта срабатывания) % slots и хранит число оборотов колеса до
+    срабатывания. Постановка и отмена - O(1), за такт просматривается
+    одна ячейка, поэтому десятки тысяч таймеров соединений (сроки
+    авторизации, проверки активности) не замедляют цикл.
+    Точность срабатывания - один такт.
+    """
+
+    def __init__(self, tick, slots, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [[] for _ in range(slots)]
+        # Номер последнего обработанного такта
+        self.current = int(clock() / tick)
+        # Число таймеров в колесе, включая отменённые
+        self.count = 0
+
+    def call_later(self, delay, func, *args):
+        """
+        Метод планирующий вызов func(*args) через delay секунд.
+        :return: объект Timer, который можно отменить.
+        """
+        deadline = self.clock() + delay
+        due = max(math.ceil(deadline / self.tick), self.current + 1)
+        rounds = (due - self.current - 1) // len(self.slots)
+        timer = Timer(deadline, rounds, func, args)
+        self.slots[due % len(self.slots)].append(timer)
+        self.count += 1
+        return timer
+
+    def next_timeout(self):
+        """
+        Метод возвращающий время до следующего такта или None, если
+        таймеров нет (тогда ждать можно сколько угодно).
+        """
+        if not self.count:
+            return None
+        return max((self.current + 1) * self.tick - self.clock(), 0)
+
+    def advance(self):
+        """Метод обработки тактов, наступивших к текущему моменту."""
+        target = int(self.clock() / self.tick)
+        if not self.count:
+            self.current = max(self.current, target)
+            return
+        while self.current < target:
+            self.current += 1
+            index = self.current % len(self.slots)
+            bucket = self.slots[index]
+            if not bucket:
+                continue
+            # Таймеры, поставленные из обработчиков, попадают в новую
+            # ячейку и ждут своего оборота.
+            self.slots[index] = []
+            waiting = []
+            for timer in bucket:
+                if timer.cancelled:
+                    self.count -= 1
+                elif timer.rounds:
+                    timer.rounds -= 1
+                    waiting.append(timer)
+                else:
+                    self.count -= 1
+                    timer.func(*timer.args)
+            self.slots[index].extend(waiting)
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,467 @@
+import functools
+import hashlib
+import multiprocessing
+import os
+import selectors
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+from multiprocessing import shared_memory
+
+from my_messenger.common.framing import FrameDecoder, encode_message
+from my_messenger.common.utils import get_configs
+from my_messenger.log.server_log_config import server_logger
+from my_messenger.server.groups import GROUP_ACTIONS
+from my_messenger.server.outbound import OutboundBuffer, SPILL
+
+CONFIGS = get_configs()
+
+
+class SharedDirectory:
+    """
+    Класс - общий для всех процессов справочник "пользователь -> воркер".
+    Хранится в разделяемой памяти как хэш-таблица с открытой адресацией.
+    Слот: 8 байт хэша имени и 2 байта номера воркера.
+    Запись выполняется под межпроцессной блокировкой, чтение - без неё.
+    Удалённые слоты занимаются при следующей записи, а перед пустым
+    слотом сразу становятся пустыми, поэтому справочник не засоряется
+    при входах и выходах пользователей.
+    """
+    SLOT = struct.Struct('<QH')
+    EMPTY = 0
+    DELETED = 1
+
+    def __init__(self, shm, lock, slots):
+        self.shm = shm
+        self.lock = lock
+        self.slots = slots
+
+    @classmethod
+    def create(cls, lock, slots=1 << 16):
+        """Метод создающий новый справочник в разделяемой памяти."""
+        shm = shared_memory.SharedMemory(
+            create=True, size=slots * cls.SLOT.size)
+        shm.buf[:] = bytes(len(shm.buf))
+        return cls(shm, lock, slots)
+
+    @classmethod
+    def attach(cls, name, lock, slots):
+        """Метод подключения к справочнику, созданному другим процессом."""
+        return cls(shared_memory.SharedMemory(name=name), lock, slots)
+
+    @property
+    def name(self):
+        """Имя сегмента разделяемой памяти."""
+        return self.shm.name
+
+    @staticmethod
+    def _key(username):
+        digest = hashlib.blake2b(
+            username.encode('utf-8'), digest_size=8).digest()
+        # 0 и 1 зарезервированы под пустой и удалённый слот
+        return max(int.from_bytes(digest, 'little'), 2)
+
+    def _probe(self, key):
+        """Генератор позиций слотов для ключа (линейное пробирование)."""
+        start = key % self.slots
+        for i in range(self.slots):
+            yield (start + i) % self.slots
+
+    def get(self, username):
+        """Метод возвращающий номер воркера пользователя или None."""
+        key = self._key(username)
+        for index in self._probe(key):
+            slot_key, worker = self.SLOT.unpack_from(
+                self.shm.buf, index * self.SLOT.size)
+            if slot_key == key:
+                return worker
+            if slot_key == self.EMPTY:
+                return None
+        return None
+
+    def set(self, username, worker):
+        """Метод записывающий, на каком воркере находится пользователь."""
+        key = self._key(username)
+        with self.lock:
+            free = None
+            for index in self._probe(key):
+                slot_key, _ = self.SLOT.unpack_from(
+                    self.shm.buf, index * self.SLOT.size)
+                if slot_key == key:
+                    free = index
+                    break
+                if slot_key == self.DELETED and free is None:
+                    free = index
+                elif slot_key == self.EMPTY:
+                    if free is None:
+                        free = index
+                    break
+            if free is None:
+                raise MemoryError('Справочник пользователей переполнен.')
+            # Номер воркера пишем раньше ключа, чтобы читатель без
+            # блокировки не увидел ключ с чужим номером.
+            offset = free * self.SLOT.size
+            struct.pack_into('<H', self.shm.buf, offset + 8, worker)
+            struct.pack_into('<Q', self.shm.buf, offset, key)
+
+    def remove(self, username):
+        """Метод удаляющий пользователя из справочника."""
+        key = self._key(username)
+        with self.lock:
+            for index in self._probe(key):
+                offset = index * self.SLOT.size
+                slot_key, _ = self.SLOT.unpack_from(self.shm.buf, offset)
+                if slot_key == key:
+                    struct.pack_into('<Q', self.shm.buf, offset, self.DELETED)
+                    self._reclaim(index)
+                    return
+                if slot_key == self.EMPTY:
+                    return
+
+    def _slot_key(self, index):
+        return self.SLOT.unpack_from(
+            self.shm.buf, index * self.SLOT.size)[0]
+
+    def _reclaim(self, index):
+        """
+        Метод освобождения удалённых слотов перед пустым: цепочка проб
+        через них всё равно закончилась бы на пустом слоте, поэтому
+        читатели без блокировки не теряют записей. Вызывается под
+        блокировкой.
+        """
+        if self._slot_key((index + 1) % self.slots) != self.EMPTY:
+            return
+        for _ in range(self.slots):
+            if self._slot_key(index) != self.DELETED:
+                return
+            struct.pack_into(
+                '<Q', self.shm.buf, index * self.SLOT.size, self.EMPTY)
+            index = (index - 1) % self.slots
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class WorkerRouter:
+    """
+    Класс маршрутизации сообщений между воркерами.
+    Каждый воркер слушает Unix-сокет в общем каталоге; сообщение для
+    пользователя с другого воркера пересылается по такому каналу.
+    Сокеты каналов обслуживаются селектором MessageProcessor и, как и
+    клиентские, не блокируют цикл: кадры для занятого воркера ждут в
+    исходящем буфере канала, пока сокет не станет готов к записи.
+    """
+
+    def __init__(self, worker_id, run_dir, directory, workers=1):
+        self.worker_id = worker_id
+        self.workers = workers
+        self.run_dir = run_dir
+        self.directory = directory
+        self.processor = None
+        self.listener = None
+        # Исходящие каналы к другим воркерам: номер -> сокет
+        self.links = dict()
+        # Исходящие буферы каналов: номер -> OutboundBuffer
+        self.out_buffers = dict()
+        # Входящие каналы: сокет -> декодер кадров
+        self.in_buffers = dict()
+
+    @staticmethod
+    def socket_path(run_dir, worker_id):
+        return os.path.join(run_dir, f'worker-{worker_id}.sock')
+
+    def attach(self, processor):
+        """Метод подключения к циклу событий MessageProcessor."""
+        self.processor = processor
+        path = self.socket_path(self.run_dir, self.worker_id)
+        if os.path.exists(path):
+            os.remove(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(CONFIGS.LISTEN_BACKLOG)
+        self.listener.setblocking(False)
+        processor.selector.register(
+            self.listener, selectors.EVENT_READ, self._accept_link)
+
+    def close(self):
+        # Селектор к этому моменту уже закрыт циклом MessageProcessor
+        for link in self.links.values():
+            link.close()
+        for buffer in self.out_buffers.values():
+            buffer.close()
+        for link in self.in_buffers:
+            link.close()
+        if self.listener is not None:
+            self.listener.close()
+
+    def locate(self, username):
+        """Метод возвращающий номер воркера пользователя или None."""
+        return self.directory.get(username)
+
+    def register(self, username):
+        """
+        Метод записи пользователя в общий справочник.
+        :return: False, если справочник переполнен.
+        """
+        try:
+            self.directory.set(username, self.worker_id)
+        except MemoryError as err:
+            server_logger.error(f'{err} Вход {username} отклонён.')
+            return False
+        return True
+
+    def unregister(self, username):
+        if self.directory.get(username) == self.worker_id:
+            self.directory.remove(username)
+
+    def forward(self, message):
+        """
+        Метод пересылки сообщения воркеру, на котором находится получатель.
+        Возвращает True, если сообщение передано в канал.
+        """
+        worker = self.locate(message[CONFIGS.TO_USER])
+        if worker is None or worker == self.worker_id:
+            return False
+        return self._send(
+            worker, encode_message(message, CONFIGS.ENCODING))
+
+    def broadcast(self, message):
+        """
+        Метод пересылки сообщения группы всем остальным воркерам: каждый
+        доставляет его своим участникам группы и обновляет свой индекс.
+        """
+        data = encode_message(message, CONFIGS.ENCODING)
+        for worker in range(self.workers):
+            if worker != self.worker_id:
+                self._send(worker, data)
+
+    def _send(self, worker, data):
+        """
+        Метод постановки кадра в исходящий буфер канала к воркеру.
+        Что не ушло в сокет сразу, отправляется по готовности к записи.
+        Сверх верхней границы кадры сбрасываются на диск: сообщения между
+        воркерами не отбрасываются.
+        """
+        if worker not in self.links and not self._connect(worker):
+            return False
+        buffer = self.out_buffers[worker]
+        was_empty = not buffer
+        buffer.push(data)
+        if was_empty:
+            return self._flush(worker)
+        return True
+
+    def _connect(self, worker):
+        """Метод открытия неблокирующего канала к воркеру."""
+        link = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        link.setblocking(False)
+        try:
+            # Unix-сокет соединяется сразу, ожидания соединения нет
+            link.connect(self.socket_path(self.run_dir, worker))
+        except OSError as err:
+            server_logger.error(
+                f'Ошибка канала к воркеру {worker}: {err}')
+            link.close()
+            return False
+        self.links[worker] = link
+        self.out_buffers[worker] = OutboundBuffer(
+            CONFIGS.OUTBOUND_HIGH_WATERMARK,
+            CONFIGS.OUTBOUND_LOW_WATERMARK,
+            SPILL)
+        # Чтение - только чтобы заметить закрытие канала другой стороной
+        self.processor.selector.register(
+            link, selectors.EVENT_READ,
+            functools.partial(self._on_link_event, worker))
+        return True
+
+    def _flush(self, worker):
+        """
+        Метод отправки накопленного буфера канала.
+        :return: False, если канал закрыт из-за ошибки.
+        """
+        link = self.links[worker]
+        try:
+            self.out_buffers[worker].send_to(link)
+        except OSError as err:
+            server_logger.error(
+                f'Ошибка канала к воркеру {worker}: {err}')
+            self._close_link(worker)
+            return False
+        events = selectors.EVENT_READ
+        if self.out_buffers[worker]:
+            events |= selectors.EVENT_WRITE
+        if events != self.processor.selector.get_key(link).events:
+            self.processor.selector.modify(
+                link, events, functools.partial(self._on_link_event, worker))
+        return True
+
+    def _on_link_event(self, worker, link, mask):
+        """Обработчик событий исходящего канала к воркеру."""
+        if mask & selectors.EVENT_READ:
+            try:
+                data = link.recv(1)
+            except BlockingIOError:
+                data = None
+            except OSError:
+                data = b''
+            if data == b'':
+                server_logger.error(f'Воркер {worker} закрыл канал.')
+                self._close_link(worker)
+                return
+        if mask & selectors.EVENT_WRITE:
+            self._flush(worker)
+
+    def _close_link(self, worker):
+        """Метод закрытия исходящего канала; его буфер отбрасывается."""
+        link = self.links.pop(worker)
+        self.out_buffers.pop(worker).close()
+        self.processor.selector.unregister(link)
+        link.close()
+
+    def _accept_link(self, sock, mask):
+        try:
+            link, _ = sock.accept()
+        except BlockingIOError:
+            return
+        link.setblocking(False)
+        self.in_buffers[link] = FrameDecoder(
+            CONFIGS.MAX_PACKAGE_LENGTH, CONFIGS.MAX_FRAME_LENGTH)
+        self.processor.selector.register(
+            link, selectors.EVENT_READ, self._on_link_read)
+
+    def _on_link_read(self, link, mask):
+        decoder = self.in_buffers[link]
+        try:
+            count = decoder.recv_from(link)
+        except BlockingIOError:
+            return
+        except OSError:
+            count = 0
+        if not count:
+            self.processor.selector.unregister(link)
+            del self.in_buffers[link]
+            link.close()
+            return
+        # Доставляем все полностью принятые сообщения
+        for message in decoder.messages(CONFIGS.ENCODING):
+            if message.get(CONFIGS.ACTION) in GROUP_ACTIONS:
+                self.processor.deliver_group(message)
+            else:
+                self.processor.process_message(message)
+
+
+def worker_main(worker_id, listen_address, listen_port, database_path,
+                directory_name, directory_lock, directory_slots, run_dir,
+                workers, limits=None, metrics_port=0, profile_signal=False):
+    """
+    Функция - точка входа процесса воркера.
+    Метрики воркер отдаёт на порту metrics_port + worker_id, с
+    profile_signal профилирует себя по сигналу PROFILE_SIGNAL.
+    """
+    # Импорт здесь, чтобы не было циклического импорта с core.
+    from my_messenger.server.core import MessageProcessor
+    from my_messenger.server.database import ServerStorage
+    from my_messenger.server.metrics import start_metrics_server
+
+    directory = SharedDirectory.attach(
+        directory_name, directory_lock, directory_slots)
+    database = ServerStorage(database_path)
+    router = WorkerRouter(worker_id, run_dir, directory, workers)
+    server = MessageProcessor(
+        listen_address, listen_port, database,
+        reuse_port=True, router=router, limits=limits)
+    if metrics_port:
+        start_metrics_server(
+            CONFIGS.METRICS_ADDRESS, metrics_port + worker_id)
+
+    # По SIGTERM завершаем цикл штатно, отмечая выход пользователей
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if profile_signal:
+        from my_messenger.server.profiler import install_signal_handler
+        install_signal_handler()
+    server_logger.info(f'Воркер {worker_id} запущен, pid {os.getpid()}')
+    server.run()
+    if profile_signal:
+        from my_messenger.server.profiler import stop_profiling
+        stop_profiling()
+    router.close()
+    directory.close()
+    database.close()
+
+
+def run_workers(listen_address, listen_port, database_path, workers,
+                limits=None, metrics_port=0, profile_signal=False):
+    """
+    Функция запуска сервера из нескольких процессов-воркеров,
+    принимающих соединения на одном порту через SO_REUSEPORT.
+    Работает только в консольном режиме. Лимиты limits каждый воркер
+    применяет к своим соединениям, с profile_signal воркеры
+    профилируют себя по сигналу.
+    """
+    if not hasattr(socket, 'SO_REUSEPORT') or \
+            not hasattr(socket, 'AF_UNIX'):
+        raise OSError('Режим воркеров не поддерживается этой платформой.')
+
+    # Схему базы создаём до запуска воркеров, чтобы они не делали это
+    # одновременно.
+    from my_messenger.server.database import ServerStorage
+    ServerStorage(database_path).close()
+
+    # Воркеры запускаются через spawn: каждому нужен свой чистый
+    # интерпретатор (отображения SQLAlchemy, логгеры, сокеты родителя).
+    context = multiprocessing.get_context('spawn')
+    directory = SharedDirectory.create(context.Lock())
+    run_dir = tempfile.mkdtemp(prefix='messenger-workers-')
+    processes = []
+    for worker_id in range(workers):
+        process = context.Process(
+            target=worker_main,
+            args=(worker_id, listen_address, listen_port, database_path,
+                  directory.name, directory.lock, directory.slots, run_dir,
+                  workers, limits, metrics_port, profile_signal),
+            daemon=True)
+        process.start()
+        processes.append(process)
+
+    # SIGTERM обрабатываем как Ctrl+C, чтобы корректно остановить воркеры
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        try:
+            while True:
+                command = input(
+                    'Введите exit для завершения работы сервера, '
+                    'profile - для снятия профиля воркеров.')
+                if command == 'exit':
+                    break
+                elif command == 'profile':
+                    if not profile_signal:
+                        print('Профилирование воркеров включается '
+                              'параметром --profile_signal.')
+                        continue
+                    # Каждый воркер профилирует себя по своему сигналу
+                    signum = getattr(signal, CONFIGS.PROFILE_SIGNAL)
+                    for process in processes:
+                        os.kill(process.pid, signum)
+        except EOFError:
+            # Консоли нет (запуск в контейнере) - работаем до сигнала
+            for process in processes:
+                process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Повторные сигналы не должны прерывать остановку воркеров
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        directory.close()
+        directory.unlink()
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,62 @@
+import unittest
+
+from my_messenger.common.utils import get_configs
+from my_messenger.server.actions import ActionRegistry
+from my_messenger.server.core import MessageProcessor
+
+CONFIGS = get_configs()
+
+
+class ActionRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ActionRegistry()
+
+        @self.registry.register('ADD_CONTACT', required=(
+            'ACCOUNT_NAME', 'USER'), owner='USER')
+        def handler(message, username):
+            return username
+
+        self.handler = handler
+
+    def test_lookup_by_configured_name(self):
+        action = self.registry.get(CONFIGS.ADD_CONTACT)
+        self.assertIs(action.handler, self.handler)
+        self.assertIsNone(self.registry.get('unknown'))
+
+    def test_accepts(self):
+        action = self.registry.get(CONFIGS.ADD_CONTACT)
+        message = {CONFIGS.ACCOUNT_NAME: 'bob',
+                   CONFIGS.USER: 'alice'}
+        self.assertTrue(action.accepts(message, 'alice'))
+        # чужое имя в поле отправителя
+        self.assertFalse(action.accepts(message, 'bob'))
+        # нет обязательного поля
+        del message[CONFIGS.ACCOUNT_NAME]
+        self.assertFalse(action.accepts(message, 'alice'))
+
+    def test_accepts_nested(self):
+        @self.registry.register(
+            'PRESENCE', required=('TIME', 'USER'),
+            nested={'USER': ('ACCOUNT_NAME', 'PUBLIC_KEY')})
+        def presence(message, username):
+            pass
+
+        action = self.registry.get(CONFIGS.PRESENCE)
+        user = {CONFIGS.ACCOUNT_NAME: 'alice', CONFIGS.PUBLIC_KEY: 'KEY'}
+        message = {CONFIGS.TIME: 1, CONFIGS.USER: user}
+        self.assertTrue(action.accepts(message, None))
+        del user[CONFIGS.ACCOUNT_NAME]
+        self.assertFalse(action.accepts(message, None))
+        message[CONFIGS.USER] = 'alice'
+        self.assertFalse(action.accepts(message, None))
+
+    def test_copy_is_independent(self):
+        registry = MessageProcessor.actions.copy()
+        registry.register('ALERT')(lambda *args: None)
+        self.assertIn(CONFIGS.ALERT, registry)
+        self.assertNotIn(CONFIGS.ALERT, MessageProcessor.actions)
+
+
+if __name__ == '__main__':
+    unittest.main()
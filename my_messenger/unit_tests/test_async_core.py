@@ -0,0 +1,209 @@
+import binascii
+import hmac
+import socket
+import time
+import unittest
+from unittest import mock
+
+from my_messenger.common.framing import encode_message
+from my_messenger.common.utils import Config, get_configs, get_message
+from my_messenger.server import async_core
+from my_messenger.server.async_core import AsyncMessageProcessor
+from my_messenger.server.limits import Limits
+from my_messenger.unit_tests.test_core import FakeDatabase, free_port
+
+CONFIGS = get_configs()
+
+
+class AsyncDatabase(FakeDatabase):
+    """База-заглушка с методами, которые вызывает движок asyncio."""
+
+    def __init__(self, users=()):
+        super().__init__(users)
+        self.logouts = []
+        self.messages = []
+        self.offline = []
+
+    def user_logout(self, name):
+        self.logouts.append(name)
+
+    def process_message(self, sender, recipient):
+        self.messages.append((sender, recipient))
+
+    def flush(self, timeout=None):
+        return True
+
+    def store_offline(self, name, message):
+        self.offline.append(name)
+
+    def get_offline(self, name, after_id=0, limit=100):
+        return []
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class AsyncServerTestCase(unittest.TestCase):
+    """Сервер asyncio в своём потоке, клиенты - обычные сокеты."""
+
+    def setUp(self):
+        self.port = free_port()
+        self.database = AsyncDatabase(['alice', 'bob'])
+        self.processor = AsyncMessageProcessor(
+            '127.0.0.1', self.port, self.database,
+            limits=Limits({}, {}, 100, 1000, 1000))
+        self.processor.daemon = True
+        self.processor.start()
+        self.assertTrue(wait_for(lambda: self.processor.server is not None))
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.processor.stop()
+        self.processor.join(5)
+
+    def connect(self, receive_buffer=None):
+        client = socket.socket()
+        if receive_buffer:
+            client.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        client.settimeout(5)
+        client.connect(('127.0.0.1', self.port))
+        self.clients.append(client)
+        return client
+
+    def send(self, client, message):
+        client.sendall(encode_message(message, CONFIGS.ENCODING))
+
+    def presence(self, name, receive_buffer=None):
+        client = self.connect(receive_buffer)
+        self.send(client, {
+            CONFIGS.ACTION: CONFIGS.PRESENCE,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: {CONFIGS.ACCOUNT_NAME: name,
+                           CONFIGS.PUBLIC_KEY: 'KEY'}})
+        challenge = get_message(client, CONFIGS)
+        self.assertEqual(challenge[CONFIGS.RESPONSE], 511)
+        return client, challenge[CONFIGS.DATA]
+
+    def login(self, name, receive_buffer=None):
+        client, data = self.presence(name, receive_buffer)
+        digest = hmac.new(b'hash', data.encode('utf-8'), 'MD5').digest()
+        self.send(client, {
+            CONFIGS.RESPONSE: 511,
+            CONFIGS.DATA: binascii.b2a_base64(digest).decode('ascii')})
+        self.assertEqual(get_message(client, CONFIGS)[CONFIGS.RESPONSE], 200)
+        return client
+
+
+class AsyncProcessorTestCase(AsyncServerTestCase):
+
+    def test_login(self):
+        self.login('alice')
+        self.assertEqual(self.database.logins, ['alice'])
+        self.assertIn('alice', self.processor.names)
+
+    def test_malformed_auth_reply(self):
+        client, data = self.presence('alice')
+        self.send(client, {CONFIGS.RESPONSE: 511, CONFIGS.DATA: 'abc'})
+        self.assertEqual(get_message(client, CONFIGS)[CONFIGS.RESPONSE], 400)
+        self.assertEqual(client.recv(1), b'')
+        self.assertNotIn('alice', self.processor.names)
+        # Сервер продолжает работать
+        self.login('alice')
+
+    def test_malformed_presence(self):
+        for user in ({CONFIGS.ACCOUNT_NAME: 'alice'}, 'alice'):
+            client = self.connect()
+            self.send(client, {
+                CONFIGS.ACTION: CONFIGS.PRESENCE,
+                CONFIGS.TIME: 1,
+                CONFIGS.USER: user})
+            self.assertEqual(
+                get_message(client, CONFIGS)[CONFIGS.RESPONSE], 400)
+            self.assertEqual(client.recv(1), b'')
+        # Имя не осталось занятым
+        self.assertNotIn('alice', self.processor.names)
+        self.login('alice')
+        self.assertIn('alice', self.processor.names)
+
+    def test_message_delivery(self):
+        alice = self.login('alice')
+        bob = self.login('bob')
+        message = {
+            CONFIGS.ACTION: CONFIGS.MESSAGE,
+            CONFIGS.TIME: 1,
+            CONFIGS.FROM_USER: 'alice',
+            CONFIGS.TO_USER: 'bob',
+            CONFIGS.MESSAGE_TEXT: 'hello'}
+        self.send(alice, message)
+        self.assertEqual(get_message(alice, CONFIGS)[CONFIGS.RESPONSE], 200)
+        self.assertEqual(get_message(bob, CONFIGS), message)
+        self.assertEqual(self.database.messages, [('alice', 'bob')])
+
+    def test_disconnect(self):
+        alice = self.login('alice')
+        alice.close()
+        self.assertTrue(wait_for(lambda: 'alice' not in self.processor.names))
+        self.assertEqual(self.database.logouts, ['alice'])
+
+
+class SlowConsumerTestCase(AsyncServerTestCase):
+    """Получатель не читает сокет: буфер ограничен политикой."""
+
+    policy = 'disconnect'
+
+    def setUp(self):
+        patcher = mock.patch.object(async_core, 'CONFIGS', Config({
+            **get_configs(),
+            'OUTBOUND_HIGH_WATERMARK': 65536,
+            'OUTBOUND_LOW_WATERMARK': 16384,
+            'SLOW_CONSUMER_POLICY': self.policy}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def flood(self, sender, count=100):
+        message = {
+            CONFIGS.ACTION: CONFIGS.MESSAGE,
+            CONFIGS.TIME: 1,
+            CONFIGS.FROM_USER: 'alice',
+            CONFIGS.TO_USER: 'bob',
+            CONFIGS.MESSAGE_TEXT: 'x' * 32768}
+        for _ in range(count):
+            self.send(sender, message)
+            self.assertEqual(
+                get_message(sender, CONFIGS)[CONFIGS.RESPONSE], 200)
+
+    def queued(self):
+        writer = self.processor.names['bob']
+        return writer.transport.get_write_buffer_size()
+
+    def test_slow_consumer(self):
+        alice = self.login('alice')
+        self.login('bob', receive_buffer=4096)
+        self.flood(alice)
+        self.assertTrue(wait_for(lambda: 'bob' not in self.processor.names))
+        self.assertEqual(self.database.logouts, ['bob'])
+
+
+class SlowConsumerDropTestCase(SlowConsumerTestCase):
+
+    policy = 'drop'
+
+    def test_slow_consumer(self):
+        alice = self.login('alice')
+        self.login('bob', receive_buffer=4096)
+        self.flood(alice)
+        self.assertIn('bob', self.processor.names)
+        self.assertGreater(self.processor.dropped, 0)
+        self.assertLessEqual(self.queued(), 65536 + 32768 + 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from my_messenger.benchmarks.run import compare
+
+
+class CompareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = {
+            'protocol.encode short': {'value': 10.0, 'unit': 'us'},
+            'recv.pooled.peak_bytes': {'value': 1000, 'unit': 'peak_bytes'}
+        }
+
+    def test_regression_found(self):
+        results = {
+            'protocol.encode short': {'value': 13.0, 'unit': 'us'},
+            'recv.pooled.peak_bytes': {'value': 1100, 'unit': 'peak_bytes'},
+            'protocol.new': {'value': 99.0, 'unit': 'us'}
+        }
+        self.assertEqual(compare(results, self.baseline, 0.25),
+                         [('protocol.encode short', 10.0, 13.0, 1.3)])
+
+    def test_machine_speed(self):
+        results = {
+            'protocol.encode short': {'value': 13.0, 'unit': 'us'},
+            'recv.pooled.peak_bytes': {'value': 1300, 'unit': 'peak_bytes'}
+        }
+        # Машина вдвое медленнее: время в норме, байты - регрессия
+        regressions = compare(results, self.baseline, 0.25, speed=2.0)
+        self.assertEqual([key for key, *_ in regressions],
+                         ['recv.pooled.peak_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
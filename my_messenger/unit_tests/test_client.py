@@ -8,13 +8,13 @@ class ClientTestCase(unittest.TestCase):
     CONFIGS = get_configs()
 
     bad_message = {
-        CONFIGS.get('RESPONSE'): 400,
-        CONFIGS.get('ERROR'): 'Bad request'
+        CONFIGS.RESPONSE: 400,
+        CONFIGS.ERROR: 'Bad request'
     }
 
     good_message = {
-        CONFIGS.get('RESPONSE'): 200,
-        CONFIGS.get('ALERT'): 'Привет, клиент!'
+        CONFIGS.RESPONSE: 200,
+        CONFIGS.ALERT: 'Привет, клиент!'
     }
 
     test_error_message = f'400: Bad request'
@@ -0,0 +1,460 @@
+import binascii
+import hmac
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from my_messenger.common.framing import encode_message
+from my_messenger.common.utils import Config, get_configs, get_message
+from my_messenger.server import core
+from my_messenger.server.core import MessageProcessor
+from my_messenger.server.database import ServerStorage
+from my_messenger.server.limits import Limits
+from my_messenger.server.outbound import OutboundBuffer, DISCONNECT
+
+CONFIGS = get_configs()
+
+
+class FakeDatabase:
+    """База-заглушка: зарегистрированные пользователи и их вход."""
+
+    directory_version = 0
+
+    def __init__(self, users=()):
+        self.users = set(users)
+        self.logins = []
+
+    def check_user(self, name):
+        return name in self.users
+
+    def get_hash(self, name):
+        return b'hash'
+
+    def user_login(self, name, ip_address, port, key):
+        self.logins.append(name)
+
+    def user_logout(self, name):
+        pass
+
+    def get_contacts(self, name):
+        return ['bob']
+
+    def groups_list(self):
+        return []
+
+    def group_members(self):
+        return []
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def connect(port):
+    client = socket.create_connection(('127.0.0.1', port), timeout=5)
+    client.settimeout(5)
+    return client
+
+
+class ProcessorThreadTestCase(unittest.TestCase):
+    """Сервер в своём потоке на свободном порту."""
+
+    def setUp(self):
+        self.port = free_port()
+        self.database = FakeDatabase(['alice'])
+        self.processor = MessageProcessor(
+            '127.0.0.1', self.port, self.database,
+            limits=Limits({}, {}, 100, 1000, 1000))
+        self.processor.daemon = True
+        self.processor.start()
+        deadline = time.monotonic() + 5
+        while self.processor.selector is None and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.processor.stop()
+        self.processor.join(5)
+
+    def test_presence_without_account_name(self):
+        client = connect(self.port)
+        client.sendall(encode_message({
+            CONFIGS.ACTION: CONFIGS.PRESENCE,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: {CONFIGS.PUBLIC_KEY: 'x'}}, CONFIGS.ENCODING))
+        self.assertEqual(get_message(client, CONFIGS)[CONFIGS.RESPONSE], 400)
+        client.close()
+        # Поток сервера жив и обслуживает новые соединения
+        self.assertTrue(self.processor.is_alive())
+        client = connect(self.port)
+        client.sendall(encode_message({
+            CONFIGS.ACTION: CONFIGS.PRESENCE,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: {CONFIGS.ACCOUNT_NAME: 'bob',
+                           CONFIGS.PUBLIC_KEY: 'x'}}, CONFIGS.ENCODING))
+        answer = get_message(client, CONFIGS)
+        self.assertEqual(answer[CONFIGS.ERROR],
+                         'Пользователь не зарегистрирован.')
+        client.close()
+
+    def test_presence_with_user_not_a_dict(self):
+        client = connect(self.port)
+        client.sendall(encode_message({
+            CONFIGS.ACTION: CONFIGS.PRESENCE,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: 'alice'}, CONFIGS.ENCODING))
+        self.assertEqual(get_message(client, CONFIGS)[CONFIGS.RESPONSE], 400)
+        client.close()
+        self.assertTrue(self.processor.is_alive())
+
+
+class SelectorLoopTestCase(unittest.TestCase):
+    """Цикл селектора, которым управляет тест: клиент - пара сокетов."""
+
+    def setUp(self):
+        self.processor = MessageProcessor(
+            '127.0.0.1', free_port(), FakeDatabase(['alice']),
+            limits=Limits({}, {}, 100, 1000, 1000))
+        self.processor.init_socket()
+        self.sock, self.peer = socket.socketpair()
+        self.peer.settimeout(5)
+        self.session = self.processor.add_client(
+            self.sock, ('127.0.0.1', 7777))
+        # Авторизованный клиент
+        self.session.username = 'alice'
+        self.processor.names['alice'] = self.session
+
+    def tearDown(self):
+        self.processor.close_all()
+        self.peer.close()
+
+    def run_until(self, condition, iterations=50):
+        for _ in range(iterations):
+            if condition():
+                return True
+            self.processor.run_once(0.05)
+        return condition()
+
+    def contacts_frame(self):
+        return encode_message({
+            CONFIGS.ACTION: CONFIGS.GET_CONTACTS,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: 'alice'}, CONFIGS.ENCODING)
+
+    def assert_nothing_received(self):
+        self.peer.setblocking(False)
+        try:
+            self.assertRaises(BlockingIOError, self.peer.recv, 1)
+        finally:
+            self.peer.settimeout(5)
+
+    def test_partial_frame(self):
+        frame = self.contacts_frame()
+        for part in (frame[:3], frame[3:-1]):
+            self.peer.sendall(part)
+            self.processor.run_once(0.05)
+            self.assert_nothing_received()
+        self.peer.sendall(frame[-1:])
+        self.processor.run_once(0.05)
+        answer = get_message(self.peer, CONFIGS)
+        self.assertEqual(answer[CONFIGS.RESPONSE], 202)
+        self.assertEqual(answer[CONFIGS.LIST_INFO], ['bob'])
+
+    def test_several_frames_in_one_recv(self):
+        self.peer.sendall(self.contacts_frame() * 3)
+        self.processor.run_once(0.05)
+        for _ in range(3):
+            self.assertEqual(
+                get_message(self.peer, CONFIGS)[CONFIGS.RESPONSE], 202)
+        self.assertEqual(self.session.messages_in, 3)
+
+    def test_disconnect_mid_frame(self):
+        self.peer.sendall(self.contacts_frame()[:5])
+        self.processor.run_once(0.05)
+        self.peer.close()
+        self.assertTrue(self.run_until(lambda: self.session.sock is None))
+        self.assertNotIn('alice', self.processor.names)
+        self.assertEqual(len(self.processor.sessions), 0)
+
+    def test_disconnect_during_write(self):
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.processor._queue_message(self.session, {
+            CONFIGS.ACTION: CONFIGS.MESSAGE,
+            CONFIGS.MESSAGE_TEXT: 'x' * 200000})
+        # Ответ не поместился в сокет и ждёт готовности к записи
+        self.assertTrue(self.session.out_buffer)
+        self.peer.close()
+        self.assertTrue(self.run_until(lambda: self.session.sock is None))
+        self.assertEqual(len(self.processor.sessions), 0)
+
+    def test_bad_frame_closes_only_its_session(self):
+        other, other_peer = socket.socketpair()
+        other_peer.settimeout(5)
+        self.processor.add_client(other, ('127.0.0.1', 7778))
+        other_peer.sendall(b'\xff' * 16)
+        self.assertTrue(self.run_until(
+            lambda: len(self.processor.sessions) == 1))
+        other_peer.close()
+        self.peer.sendall(self.contacts_frame())
+        self.processor.run_once(0.05)
+        self.assertEqual(get_message(self.peer, CONFIGS)[CONFIGS.RESPONSE],
+                         202)
+
+
+class PurgeTimerTestCase(unittest.TestCase):
+
+    def test_armed_only_while_buckets_exist(self):
+        processor = MessageProcessor(
+            '127.0.0.1', free_port(), FakeDatabase(['alice']),
+            limits=Limits({}, {'default': (10, 10)}, 100, 1000, 1000))
+        processor.init_socket()
+        self.addCleanup(processor.close_all)
+        # Простаивающий цикл ждёт в select без срока
+        self.assertIsNone(processor._next_timeout())
+        sock, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        peer.settimeout(5)
+        processor.add_client(sock, ('127.0.0.1', 7777))
+        peer.sendall(encode_message({
+            CONFIGS.ACTION: CONFIGS.PRESENCE,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: {CONFIGS.ACCOUNT_NAME: 'bob',
+                           CONFIGS.PUBLIC_KEY: 'x'}}, CONFIGS.ENCODING))
+        for _ in range(100):
+            if processor._purge_timer:
+                break
+            processor.run_once(0.05)
+        self.assertEqual(get_message(peer, CONFIGS)[CONFIGS.RESPONSE], 400)
+        self.assertTrue(processor.limits)
+        timer = processor._purge_timer
+        self.assertIsNotNone(timer)
+        # Корзина наполнилась - после очистки таймер не взводится
+        time.sleep(0.2)
+        timer.cancel()
+        processor._purge_limits()
+        self.assertFalse(processor.limits)
+        self.assertIsNone(processor._purge_timer)
+
+
+class FullRouter:
+    """Маршрутизатор воркеров с переполненным справочником."""
+
+    def attach(self, processor):
+        pass
+
+    def register(self, username):
+        return False
+
+    def unregister(self, username):
+        pass
+
+    def locate(self, username):
+        return None
+
+
+class FullDirectoryTestCase(unittest.TestCase):
+
+    def test_login_refused(self):
+        processor = MessageProcessor(
+            '127.0.0.1', free_port(), FakeDatabase(['alice']),
+            router=FullRouter(), limits=Limits({}, {}, 100, 1000, 1000))
+        processor.init_socket()
+        self.addCleanup(processor.close_all)
+        sock, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        peer.settimeout(5)
+        session = processor.add_client(sock, ('127.0.0.1', 7777))
+        peer.sendall(encode_message({
+            CONFIGS.ACTION: CONFIGS.PRESENCE,
+            CONFIGS.TIME: 1,
+            CONFIGS.USER: {CONFIGS.ACCOUNT_NAME: 'alice',
+                           CONFIGS.PUBLIC_KEY: 'KEY'}}, CONFIGS.ENCODING))
+        processor.run_once(0.05)
+        challenge = get_message(peer, CONFIGS)[CONFIGS.DATA]
+        digest = hmac.new(b'hash', challenge.encode('utf-8'), 'MD5').digest()
+        peer.sendall(encode_message({
+            CONFIGS.RESPONSE: 511,
+            CONFIGS.DATA: binascii.b2a_base64(digest).decode('ascii')},
+            CONFIGS.ENCODING))
+        processor.run_once(0.05)
+        # Отказ только этому клиенту, цикл продолжает работу
+        answer = get_message(peer, CONFIGS)
+        self.assertEqual(answer[CONFIGS.RESPONSE], 400)
+        self.assertEqual(answer[CONFIGS.ERROR], 'Сервер перегружен.')
+        self.assertIsNone(session.sock)
+        self.assertEqual(processor.names, {})
+        self.assertEqual(processor.database.logins, [])
+
+
+class IdleReaperTestCase(unittest.TestCase):
+    """Проверка активности клиентов таймером сессии."""
+
+    def setUp(self):
+        patcher = mock.patch.object(core, 'CONFIGS', Config({
+            **get_configs(),
+            'AUTH_TIMEOUT': 0.1,
+            'PING_INTERVAL': 0.3,
+            'IDLE_TIMEOUT': 0.6}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.database = FakeDatabase(['alice'])
+        self.processor = MessageProcessor(
+            '127.0.0.1', free_port(), self.database,
+            limits=Limits({}, {}, 100, 1000, 1000))
+        self.processor.init_socket()
+        self.addCleanup(self.processor.close_all)
+        sock, self.peer = socket.socketpair()
+        self.addCleanup(self.peer.close)
+        self.peer.settimeout(5)
+        self.session = self.processor.add_client(sock, ('127.0.0.1', 7777))
+
+    def authorize(self):
+        self.session.username = 'alice'
+        self.processor.names['alice'] = self.session
+
+    def run_for(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and self.session.sock is not None:
+            self.processor.run_once(0.05)
+
+    def pong(self):
+        self.peer.sendall(encode_message(
+            {CONFIGS.ACTION: CONFIGS.PONG, CONFIGS.TIME: 1},
+            CONFIGS.ENCODING))
+
+    def test_auth_timeout(self):
+        self.run_for(1)
+        self.assertIsNone(self.session.sock)
+
+    def test_idle_client_closed(self):
+        self.authorize()
+        self.run_for(0.5)
+        # Клиент молчит PING_INTERVAL - сервер проверяет связь
+        self.assertEqual(get_message(self.peer, CONFIGS),
+                         {CONFIGS.ACTION: CONFIGS.PING})
+        self.assertTrue(self.session.ping_pending)
+        self.assertIsNotNone(self.session.sock)
+        # и закрывает соединение, если ответа нет IDLE_TIMEOUT
+        self.run_for(1)
+        self.assertIsNone(self.session.sock)
+        self.assertGreaterEqual(
+            time.monotonic() - self.session.last_seen, 0.6)
+        self.assertNotIn('alice', self.processor.names)
+
+    def test_pong_refreshes_last_seen(self):
+        self.authorize()
+        for _ in range(3):
+            self.run_for(0.5)
+            self.assertEqual(get_message(self.peer, CONFIGS),
+                             {CONFIGS.ACTION: CONFIGS.PING})
+            last_seen = self.session.last_seen
+            self.pong()
+            self.processor.run_once(0.05)
+            self.assertGreater(self.session.last_seen, last_seen)
+            self.assertFalse(self.session.ping_pending)
+        # Отвечающий клиент пережил несколько IDLE_TIMEOUT
+        self.assertIsNotNone(self.session.sock)
+        self.assertIn('alice', self.processor.names)
+
+
+class OfflineDeliveryTestCase(unittest.TestCase):
+    """Доставка накопленных сообщений при входе, с настоящей базой."""
+
+    def setUp(self):
+        patcher = mock.patch.object(core, 'CONFIGS', Config(
+            {**get_configs(), 'OFFLINE_BATCH': 2}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.database = ServerStorage(os.path.join(directory, 'server.db3'))
+        self.addCleanup(self.database.close)
+        self.database.add_user('alice', b'hash')
+        self.database.add_user('bob', b'hash')
+        self.processor = MessageProcessor(
+            '127.0.0.1', free_port(), self.database,
+            limits=Limits({}, {}, 100, 1000, 1000))
+        self.processor.init_socket()
+        self.addCleanup(self.processor.close_all)
+        sock, self.peer = socket.socketpair()
+        self.addCleanup(self.peer.close)
+        self.peer.settimeout(5)
+        self.session = self.processor.add_client(sock, ('127.0.0.1', 7777))
+
+    def message(self, index, text=''):
+        return {CONFIGS.ACTION: CONFIGS.MESSAGE,
+                CONFIGS.TIME: 1,
+                CONFIGS.FROM_USER: 'alice',
+                CONFIGS.TO_USER: 'bob',
+                CONFIGS.MESSAGE_TEXT: f'{index}{text}'}
+
+    def login(self):
+        self.session.username = 'bob'
+        self.processor.names['bob'] = self.session
+        self.processor._start_offline_delivery(self.session)
+        for _ in range(50):
+            if self.session.offline_cursor is None:
+                break
+            self.processor.run_once(0.05)
+        self.assertIsNone(self.session.offline_cursor)
+
+    def test_stored_while_offline(self):
+        self.processor.process_message(self.message(0))
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(
+            [json.loads(payload)
+             for _, payload in self.database.get_offline('bob')],
+            [self.message(0)])
+
+    def test_batched_delivery_on_login(self):
+        for index in range(5):
+            self.database.store_offline('bob', json.dumps(
+                self.message(index)))
+        self.assertTrue(self.database.flush(5))
+        with mock.patch.object(self.database, 'get_offline',
+                               wraps=self.database.get_offline) as batches:
+            self.login()
+        # Порции по OFFLINE_BATCH и пустой запрос в конце
+        self.assertEqual(len(batches.call_args_list), 4)
+        for call in batches.call_args_list:
+            self.assertEqual(call.args[2], 2)
+        self.assertEqual([get_message(self.peer, CONFIGS)
+                          for _ in range(5)],
+                         [self.message(index) for index in range(5)])
+        # Доставленные сообщения удалены из базы
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(self.database.get_offline('bob'), [])
+
+    def test_batch_limited_by_high_watermark(self):
+        # В буфер входят два кадра: порция из пяти не должна переполнить
+        # его - иначе кадр отбрасывается, а клиент отключается
+        messages = [self.message(index, 'x' * 100) for index in range(5)]
+        for message in messages:
+            self.database.store_offline('bob', json.dumps(message))
+        self.assertTrue(self.database.flush(5))
+        self.session.out_buffer = OutboundBuffer(400, 100, DISCONNECT)
+        with mock.patch.object(core, 'CONFIGS', Config(
+                {**get_configs(), 'OFFLINE_BATCH': 100})):
+            self.login()
+        self.assertIsNotNone(self.session.sock)
+        self.assertFalse(self.session.out_buffer.overloaded)
+        self.assertEqual([get_message(self.peer, CONFIGS)
+                          for _ in range(5)], messages)
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(self.database.get_offline('bob'), [])
+        # Следующее сообщение доставляется как обычно
+        self.processor.process_message(self.message(5))
+        self.processor.run_once(0.05)
+        self.assertEqual(get_message(self.peer, CONFIGS), self.message(5))
+        self.assertIsNotNone(self.session.sock)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from sqlalchemy import event
+
+from my_messenger.common.utils import Config, get_configs
+from my_messenger.server import database
+from my_messenger.server.database import ServerStorage
+
+
+def configs(**overrides):
+    return Config({**get_configs(), **overrides})
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """База во временном каталоге, открытая заново для каждого теста."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'server.db3')
+        self.database = self.open()
+
+    def open(self):
+        database = ServerStorage(self.path)
+        self.addCleanup(database.close)
+        return database
+
+
+class ServerStorageTestCase(DatabaseTestCase):
+
+    def test_negative_cache(self):
+        self.assertFalse(self.database.check_user('nobody'))
+        misses = self.database.users.misses
+        # База не менялась - неизвестное имя не читается повторно
+        for _ in range(3):
+            self.assertFalse(self.database.check_user('nobody'))
+        self.assertEqual(self.database.users.misses, misses)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return condition()
+
+    def test_user_registered_by_other_process(self):
+        patcher = mock.patch.object(database, 'CONFIGS',
+                                    configs(USER_CACHE_SYNC_INTERVAL=0.2))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertFalse(self.database.check_user('carol'))
+        # Генератор нагрузки или другой воркер открывают ту же базу
+        other = self.open()
+        other.add_user('carol', b'hash')
+        # До следующей сверки действует кэш, база не опрашивается
+        self.assertFalse(self.database.check_user('carol'))
+        self.assertTrue(self.wait_for(
+            lambda: self.database.check_user('carol')))
+        self.assertEqual(self.database.get_hash('carol'), b'hash')
+        self.database.user_login('carol', '127.0.0.1', 7777, 'KEY')
+        self.assertTrue(self.database.flush(5))
+        self.assertTrue(self.wait_for(
+            lambda: other.get_pubkey('carol') == 'KEY'))
+        # Повторный вход через другой воркер меняет и записанный в
+        # справочнике ключ, а не только отрицательный кэш
+        self.database.user_logout('carol')
+        self.assertTrue(self.database.flush(5))
+        other.user_login('carol', '127.0.0.1', 7778, 'NEW')
+        self.assertTrue(other.flush(5))
+        self.assertTrue(self.wait_for(
+            lambda: self.database.get_pubkey('carol') == 'NEW'))
+
+
+class OfflineMessagesTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.database.add_user('bob', b'hash')
+
+    def store(self, count):
+        for index in range(count):
+            self.database.store_offline('bob', f'"{index}"')
+        self.assertTrue(self.database.flush(5))
+
+    def payloads(self):
+        return [payload
+                for _, payload in self.database.get_offline('bob', 0, 100)]
+
+    def test_store_and_delete(self):
+        self.store(3)
+        rows = self.database.get_offline('bob', 0, 2)
+        self.assertEqual([payload for _, payload in rows], ['"0"', '"1"'])
+        self.assertEqual(
+            [payload for _, payload in
+             self.database.get_offline('bob', rows[-1][0], 2)], ['"2"'])
+        self.database.delete_offline('bob', rows[-1][0])
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(self.payloads(), ['"2"'])
+        # Сообщения неизвестному пользователю не сохраняются
+        self.database.store_offline('nobody', '"x"')
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(self.database.get_offline('nobody'), [])
+
+    def test_queue_limit(self):
+        with mock.patch.object(database, 'CONFIGS',
+                               configs(OFFLINE_QUEUE_LIMIT=3)):
+            self.store(5)
+        # Самые старые сверх лимита удалены
+        self.assertEqual(self.payloads(), ['"2"', '"3"', '"4"'])
+
+    def test_ttl_expiry(self):
+        self.store(2)
+        with mock.patch.object(database, 'CONFIGS',
+                               configs(OFFLINE_MESSAGE_TTL=-1)):
+            # Устаревшие сообщения не выдаются и удаляются при
+            # следующей записи в очередь пользователя
+            self.assertEqual(self.payloads(), [])
+            self.store(1)
+        self.assertEqual(self.payloads(), [])
+        self.assertEqual(
+            self.database.session.query(
+                self.database.OfflineMessages).count(), 0)
+        # и при открытии базы
+        self.store(1)
+        self.database.close()
+        with mock.patch.object(database, 'CONFIGS',
+                               configs(OFFLINE_MESSAGE_TTL=-1)):
+            reopened = self.open()
+        self.assertEqual(
+            reopened.session.query(reopened.OfflineMessages).count(), 0)
+
+
+class MessageStatsTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(database, 'CONFIGS',
+                                    configs(STATS_FLUSH_INTERVAL=0.1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+        self.database.add_user('alice', b'hash')
+        self.database.add_user('bob', b'hash')
+
+    def send(self, sender, recipient, count=1):
+        for _ in range(count):
+            self.database.process_message(sender, recipient)
+
+    def history(self):
+        return {name: (sent, accepted) for name, _, sent, accepted
+                in self.database.message_history()}
+
+    def stored(self):
+        storage = self.database
+        return {name: (sent, accepted) for name, sent, accepted
+                in storage.session.query(
+                    storage.AllUsers.name,
+                    storage.UsersHistory.sent,
+                    storage.UsersHistory.accepted).join(
+                    storage.UsersHistory,
+                    storage.UsersHistory.user == storage.AllUsers.id)}
+
+    def test_flush_by_timer(self):
+        self.send('alice', 'bob', 3)
+        self.send('bob', 'alice')
+        expected = {'alice': (3, 1), 'bob': (1, 3)}
+        self.assertEqual(self.history(), expected)
+        # Без новых сообщений и выходов счётчики записывает таймер
+        deadline = time.monotonic() + 5
+        while self.stored() != expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.stored(), expected)
+        self.assertEqual(self.history(), expected)
+        self.assertFalse(self.database.stats)
+        self.assertFalse(self.database.stats_flushing)
+
+    def test_history_during_flush(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def flush_and_wait(session):
+            self.database._flush_stats(session)
+            started.set()
+            release.wait(5)
+        self.send('alice', 'bob', 2)
+        self.database.writer.submit(flush_and_wait)
+        self.assertTrue(started.wait(5))
+        # UPDATE выполнен, но не закоммичен
+        self.assertTrue(self.database.stats_flushing)
+        self.send('bob', 'alice')
+        expected = {'alice': (2, 1), 'bob': (1, 2)}
+        self.assertEqual(self.history(), expected)
+        release.set()
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(self.history(), expected)
+
+    def test_history_while_committing(self):
+        # Чтение попадает между коммитом счётчиков и очисткой
+        # stats_flushing: записанное не должно учитываться дважды
+        results = []
+
+        def read_during_commit(session):
+            if self.database.stats_written and not results:
+                reader = threading.Thread(
+                    target=lambda: results.append(self.history()))
+                reader.start()
+                reader.join(0.2)
+        event.listen(self.database.writer.session, 'after_commit',
+                     read_during_commit, insert=True)
+        self.send('alice', 'bob', 2)
+        expected = {'alice': (2, 0), 'bob': (0, 2)}
+        deadline = time.monotonic() + 5
+        while self.stored() != expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(self.database.flush(5))
+        for _ in range(100):
+            if results:
+                break
+            time.sleep(0.01)
+        self.assertEqual(results, [expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import logging
+import unittest
+from unittest import mock
+
+from my_messenger.common import decorators
+from my_messenger.common.decorators import log, Log, LOGGER
+from my_messenger.common.utils import Config, get_configs
+
+
+class Argument:
+    """Аргумент, считающий вызовы repr."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __repr__(self):
+        self.calls += 1
+        return 'argument'
+
+
+def caller(func, *args):
+    return func(*args)
+
+
+class LogDecoratorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.level = LOGGER.level
+
+    def tearDown(self):
+        LOGGER.setLevel(self.level)
+
+    def test_no_formatting_when_disabled(self):
+        argument = Argument()
+        decorated = log(lambda value: value)
+        LOGGER.setLevel(logging.WARNING)
+        self.assertIs(decorated(argument), argument)
+        self.assertEqual(argument.calls, 0)
+
+    def test_sampling(self):
+        @log(level=logging.WARNING, sample=3)
+        def double(value):
+            return value * 2
+
+        with self.assertLogs(LOGGER, logging.WARNING) as logs:
+            results = [double(index) for index in range(7)]
+        self.assertEqual(results, [0, 2, 4, 6, 8, 10, 12])
+        self.assertEqual(len(logs.records), 3)
+        self.assertIn('double c параметрами (6,)', logs.output[-1])
+
+    def test_caller_name(self):
+        decorated = Log(logging.WARNING)(lambda: None)
+        with self.assertLogs(LOGGER, logging.WARNING) as logs:
+            caller(decorated)
+        self.assertIn('вызвана из функции caller.', logs.output[0])
+
+    def test_production_mode(self):
+        configs = Config({**get_configs(), 'LOG_DECORATORS': False})
+
+        def func():
+            pass
+
+        with mock.patch.object(decorators, 'CONFIGS', configs):
+            self.assertIs(log(func), func)
+            self.assertIs(log(sample=10)(func), func)
+            self.assertIs(Log()(func), func)
+
+
+if __name__ == '__main__':
+    unittest.main()
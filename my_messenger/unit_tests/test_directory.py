@@ -0,0 +1,99 @@
+import unittest
+
+from my_messenger.server.directory import UserDirectory, UserEntry
+from my_messenger.unit_tests.test_timers import FakeClock
+
+
+class DirectoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = {f'user{i}': UserEntry(i, 'hash', 'KEY', i + 100)
+                     for i in range(5)}
+        self.loads = []
+        self.directory = UserDirectory(self.load, 3, 2)
+
+    def load(self, name, *args):
+        self.loads.append(name)
+        return self.rows.get(name)
+
+    def test_read_through(self):
+        self.assertEqual(self.directory.get('user1').history_id, 101)
+        self.assertEqual(self.directory.get('user1').id, 1)
+        self.assertEqual(self.loads, ['user1'])
+        self.assertEqual(
+            (self.directory.hits, self.directory.misses), (1, 1))
+
+    def test_negative_cache(self):
+        for _ in range(3):
+            self.assertIsNone(self.directory.get('nobody'))
+        self.assertEqual(self.loads, ['nobody'])
+
+    def test_lru_eviction(self):
+        for name in ('user0', 'user1', 'user2', 'user0', 'user3'):
+            self.directory.get(name)
+        # user1 использовался раньше всех и вытеснен
+        self.assertEqual(list(self.directory.entries),
+                         ['user2', 'user0', 'user3'])
+        self.directory.get('nobody')
+        self.directory.get('ghost')
+        self.directory.get('phantom')
+        self.assertEqual(list(self.directory.missing), ['ghost', 'phantom'])
+
+    def test_invalidate_after_registration(self):
+        self.assertIsNone(self.directory.get('new'))
+        self.rows['new'] = UserEntry(7, 'hash', None, 107)
+        self.directory.invalidate('new')
+        self.assertEqual(self.directory.get('new').id, 7)
+
+    def test_set_pubkey(self):
+        self.directory.get('user2')
+        self.directory.set_pubkey('user2', 'NEWKEY')
+        self.assertEqual(self.directory.get('user2').pubkey, 'NEWKEY')
+
+    def test_stale_load_not_cached(self):
+        # Пока запись читалась из базы, пользователя удалили
+        def load(name, *args):
+            self.directory.invalidate(name)
+            return self.rows.get(name)
+        self.directory.loader = load
+        self.assertEqual(self.directory.get('user4').id, 4)
+        self.assertNotIn('user4', self.directory.entries)
+
+
+class DirectoryTtlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = {'alice': UserEntry(1, 'hash', 'KEY', 101)}
+        self.loads = []
+        self.clock = FakeClock()
+        self.directory = UserDirectory(
+            self.load, ttl=60, negative_ttl=5, clock=self.clock)
+
+    def load(self, name, *args):
+        self.loads.append(name)
+        return self.rows.get(name)
+
+    def test_negative_entry_expires(self):
+        self.assertIsNone(self.directory.get('carol'))
+        # Пользователя зарегистрировал другой процесс
+        self.rows['carol'] = UserEntry(2, 'hash', None, 102)
+        self.clock.now += 4
+        self.assertIsNone(self.directory.get('carol'))
+        self.clock.now += 1
+        self.assertEqual(self.directory.get('carol').id, 2)
+        self.assertEqual(self.loads, ['carol', 'carol'])
+
+    def test_entry_expires(self):
+        self.directory.get('alice')
+        self.directory.set_pubkey('alice', 'MINE')
+        # Ключ сменился при входе через другой процесс
+        self.rows['alice'] = self.rows['alice']._replace(pubkey='OTHER')
+        self.clock.now += 59
+        self.assertEqual(self.directory.get('alice').pubkey, 'MINE')
+        self.clock.now += 1
+        self.assertEqual(self.directory.get('alice').pubkey, 'OTHER')
+        self.assertEqual(self.loads, ['alice', 'alice'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import socket
+import unittest
+
+from my_messenger.common.errors import IncorrectDataReceivedError
+from my_messenger.common.framing import BufferPool, FrameDecoder, \
+    encode_message, FRAME_HEADER
+from my_messenger.common.utils import get_configs, send_message, get_message
+
+
+class FramingTestCase(unittest.TestCase):
+    CONFIGS = get_configs()
+
+    message = {
+        'action': 'message',
+        'from': 'Samoryad',
+        'to': 'Gogi',
+        'mess_text': 'Привет!'
+    }
+
+    def test_encode_message(self):
+        frame = encode_message(self.message, 'utf-8')
+        payload = json.dumps(self.message).encode('utf-8')
+        self.assertEqual(FRAME_HEADER.unpack_from(frame), (1, len(payload)))
+        self.assertEqual(frame[FRAME_HEADER.size:], payload)
+
+    def test_split_frame(self):
+        frame = encode_message(self.message, 'utf-8')
+        decoder = FrameDecoder(16)
+        for byte in frame[:-1]:
+            decoder.feed(bytes([byte]))
+            self.assertEqual(list(decoder.messages('utf-8')), [])
+        decoder.feed(frame[-1:])
+        self.assertEqual(list(decoder.messages('utf-8')), [self.message])
+        self.assertEqual(len(decoder), 0)
+
+    def test_coalesced_frames(self):
+        decoder = FrameDecoder()
+        decoder.feed(encode_message(self.message, 'utf-8') * 3)
+        self.assertEqual(
+            list(decoder.messages('utf-8')), [self.message] * 3)
+
+    def test_large_message(self):
+        message = {'mess_text': 'x' * 100000}
+        decoder = FrameDecoder(1024)
+        decoder.feed(encode_message(message, 'utf-8'))
+        self.assertEqual(list(decoder.messages('utf-8')), [message])
+
+    def test_bad_version(self):
+        decoder = FrameDecoder()
+        decoder.feed(b'{"action": "presence"}')
+        with self.assertRaises(IncorrectDataReceivedError):
+            list(decoder.messages('utf-8'))
+
+    def test_frame_too_long(self):
+        decoder = FrameDecoder(max_frame_length=10)
+        decoder.feed(encode_message(self.message, 'utf-8'))
+        with self.assertRaises(IncorrectDataReceivedError):
+            list(decoder.messages('utf-8'))
+
+    def test_pooled_buffer(self):
+        pool = BufferPool(64, max_free=1)
+        first = FrameDecoder(64, pool=pool)
+        second = FrameDecoder(64, pool=pool)
+        frame = encode_message(self.message, 'utf-8')
+        first.feed(frame[:5])
+        self.assertEqual(list(first.messages('utf-8')), [])
+        self.assertIsNotNone(first.buffer)
+        first.feed(frame[5:])
+        self.assertEqual(list(first.messages('utf-8')), [self.message])
+        # Разобранный до конца буфер возвращается в пул и берётся вторым
+        self.assertIsNone(first.buffer)
+        second.feed(frame)
+        self.assertEqual(list(second.messages('utf-8')), [self.message])
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+        # Выросший под большой кадр буфер в пул не возвращается
+        second.feed(encode_message({'mess_text': 'x' * 200}, 'utf-8'))
+        second.close()
+        self.assertEqual([len(buffer) for buffer in pool.free], [64])
+
+    def test_socket_roundtrip(self):
+        left, right = socket.socketpair()
+        try:
+            # Два сообщения уходят одним пакетом, третье - по частям
+            send_message(left, self.message, self.CONFIGS)
+            send_message(left, {'response': 200}, self.CONFIGS)
+            self.assertEqual(get_message(right, self.CONFIGS), self.message)
+            self.assertEqual(
+                get_message(right, self.CONFIGS), {'response': 200})
+            frame = encode_message({'response': 205}, 'utf-8')
+            left.sendall(frame[:3])
+            left.sendall(frame[3:])
+            self.assertEqual(
+                get_message(right, self.CONFIGS), {'response': 205})
+            left.close()
+            with self.assertRaises(ConnectionResetError):
+                get_message(right, self.CONFIGS)
+        finally:
+            left.close()
+            right.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
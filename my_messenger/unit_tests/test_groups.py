@@ -0,0 +1,66 @@
+import unittest
+
+from Cryptodome.PublicKey import RSA
+
+from my_messenger.client.group_crypto import new_group_key, wrap_key, \
+    unwrap_key, encrypt_message, decrypt_message
+from my_messenger.common.utils import get_configs
+from my_messenger.server.groups import GroupIndex
+
+CONFIGS = get_configs()
+
+
+class FakeStorage:
+    """База-заглушка с одной группой из двух участников."""
+
+    def groups_list(self):
+        return ['team', 'empty']
+
+    def group_members(self):
+        return [('team', 'alice'), ('team', 'bob')]
+
+
+class GroupIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = GroupIndex.load(FakeStorage())
+
+    def event(self, action, group, username):
+        return {
+            CONFIGS.ACTION: CONFIGS.get(action),
+            CONFIGS.GROUP: group,
+            CONFIGS.ACCOUNT_NAME: username
+        }
+
+    def test_load(self):
+        self.assertEqual(self.index.get('team'), {'alice', 'bob'})
+        self.assertIn('empty', self.index)
+        self.assertEqual(self.index.get('unknown'), frozenset())
+
+    def test_apply_membership_events(self):
+        self.index.apply(self.event('JOIN_GROUP', 'team', 'carol'))
+        self.index.apply(self.event('LEAVE_GROUP', 'team', 'alice'))
+        self.index.apply(self.event('CREATE_GROUP', 'new', 'dave'))
+        self.assertEqual(self.index.get('team'), {'bob', 'carol'})
+        self.assertTrue(self.index.is_member('new', 'dave'))
+
+    def test_remove_user(self):
+        self.index.remove_user('bob')
+        self.assertFalse(self.index.is_member('team', 'bob'))
+
+
+class GroupCryptoTestCase(unittest.TestCase):
+
+    def test_wrapped_key_and_message(self):
+        keys = RSA.generate(1024)
+        group_key = new_group_key()
+        wrapped = wrap_key(group_key, keys.publickey().export_key())
+        self.assertEqual(unwrap_key(wrapped, keys), group_key)
+        data = encrypt_message(group_key, 'Привет, группа')
+        self.assertEqual(decrypt_message(group_key, data), 'Привет, группа')
+        with self.assertRaises(ValueError):
+            decrypt_message(new_group_key(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
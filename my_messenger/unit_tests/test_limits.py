@@ -0,0 +1,62 @@
+import configparser
+import unittest
+
+from my_messenger.server.limits import Limits, RateLimiter, TokenBucket
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(2, 3, 0)
+        self.assertEqual([bucket.consume(0) for _ in range(4)],
+                         [True, True, True, False])
+        self.assertTrue(bucket.consume(0.5))
+        self.assertFalse(bucket.consume(0.5))
+        self.assertTrue(bucket.full(10))
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def test_rules_per_action_and_key(self):
+        limiter = RateLimiter({'default': None, 'get_users': (1, 1)})
+        self.assertTrue(limiter.allow('alice', 'get_users', 0))
+        self.assertFalse(limiter.allow('alice', 'get_users', 0))
+        self.assertTrue(limiter.allow('bob', 'get_users', 0))
+        self.assertTrue(all(limiter.allow('alice', 'message', 0)
+                            for _ in range(100)))
+
+    def test_purge_full_buckets(self):
+        limiter = RateLimiter({'default': (1, 1)})
+        limiter.allow('alice', 'message', 0)
+        limiter.purge(0.5)
+        self.assertEqual(len(limiter.buckets), 1)
+        limiter.purge(5)
+        self.assertEqual(limiter.buckets, {})
+
+
+class LimitsTestCase(unittest.TestCase):
+
+    def test_from_config_overrides(self):
+        config = configparser.ConfigParser()
+        config.read_string(
+            '[USER_LIMITS]\nget_users = 2, 4\nmessage = off\n'
+            '[ADMISSION]\nmax_connections = 1\n')
+        limits = Limits.from_config(config)
+        self.assertEqual(limits.users.rules['get_users'], (2.0, 4.0))
+        self.assertIsNone(limits.users.rules['message'])
+        self.assertTrue(limits.admit(0))
+        self.assertFalse(limits.admit(1))
+        self.assertEqual(limits.rejected_connections, 1)
+
+    def test_user_and_address_limits(self):
+        limits = Limits({'get_users': (1, 1)}, {'presence': (1, 1)},
+                        10, 10, 10)
+        self.assertTrue(limits.allow('presence', None, '10.0.0.1', 0))
+        self.assertFalse(limits.allow('presence', None, '10.0.0.1', 0))
+        self.assertTrue(limits.allow('get_users', 'alice', '10.0.0.1', 0))
+        self.assertFalse(limits.allow('get_users', 'alice', '10.0.0.2', 0))
+        self.assertEqual(limits.rejected_requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
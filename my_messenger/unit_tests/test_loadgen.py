@@ -0,0 +1,29 @@
+import unittest
+
+from my_messenger.loadgen import LoadStats, percentile
+
+
+class LoadgenTestCase(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [x / 1000 for x in range(1, 1001)]
+        self.assertEqual(percentile(values, 0.5), 0.5)
+        self.assertEqual(percentile(values, 0.99), 0.99)
+        self.assertEqual(percentile(values, 0.999), 0.999)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_report(self):
+        stats = LoadStats()
+        stats.finished = stats.started + 2
+        stats.sent = stats.delivered = 4
+        stats.latencies = [0.004, 0.001, 0.002, 0.003]
+        stats.errors['response 429'] += 1
+        report = stats.report()
+        self.assertEqual(report['throughput'], 2.0)
+        self.assertEqual(report['latency_ms']['p50'], 2.0)
+        self.assertEqual(report['latency_ms']['max'], 4.0)
+        self.assertEqual(report['errors'], {'response 429': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
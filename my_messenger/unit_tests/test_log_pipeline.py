@@ -0,0 +1,121 @@
+import gzip
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from logging.handlers import QueueListener
+
+from my_messenger.log.pipeline import CompressingFileHandler, \
+    DroppingQueueHandler, stop_pipeline
+
+
+def wait_for_compression():
+    for thread in threading.enumerate():
+        if thread.name == 'log-compress':
+            thread.join(5)
+
+
+class DroppingQueueHandlerTestCase(unittest.TestCase):
+
+    def test_drop_when_full(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        logger = logging.getLogger('test_log_pipeline')
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            message = {'to': 'bob'}
+            for index in range(3):
+                logger.warning('Сообщение %s', message)
+            message['to'] = 'alice'
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(handler.dropped, 1)
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.getMessage(), "Сообщение {'to': 'bob'}")
+
+    def test_drop_count_from_many_threads(self):
+        handler = DroppingQueueHandler(queue.Queue(1))
+        record = logging.makeLogRecord({'msg': 'x'})
+        handler.enqueue(record)
+
+        def produce():
+            for index in range(2000):
+                handler.enqueue(record)
+        threads = [threading.Thread(target=produce) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(handler.dropped, 8000)
+
+
+class CompressingFileHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'server.log')
+        self.handler = CompressingFileHandler(
+            self.path, max_bytes=100, backup_count=2)
+
+    def tearDown(self):
+        self.handler.close()
+        shutil.rmtree(self.directory)
+
+    def emit(self, text):
+        self.handler.handle(logging.makeLogRecord({'msg': text}))
+
+    def test_size_rotation(self):
+        for index in range(4):
+            self.emit(f'{index}' * 150)
+            wait_for_compression()
+        archives = self.handler.archives()
+        self.assertEqual(len(archives), 2)
+        with gzip.open(archives[-1], 'rt') as archive:
+            self.assertEqual(archive.read(), '2' * 150 + '\n')
+        with open(self.path) as current:
+            self.assertEqual(current.read(), '3' * 150 + '\n')
+
+    def test_recover_interrupted_compression(self):
+        # Процесс завершился посреди сжатия: остались несжатый файл и
+        # недописанный архив
+        self.handler.close()
+        leftover = self.path + '.2026-01-01.3'
+        with open(leftover, 'w') as rotated:
+            rotated.write('old\n')
+        with open(leftover + '.gz.tmp', 'wb') as partial:
+            partial.write(b'\x1f')
+        self.handler = CompressingFileHandler(
+            self.path, max_bytes=100, backup_count=2)
+        self.handler.wait()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['server.log', 'server.log.2026-01-01.3.gz'])
+        with gzip.open(leftover + '.gz', 'rt') as archive:
+            self.assertEqual(archive.read(), 'old\n')
+
+    def test_stop_pipeline_waits_for_compression(self):
+        compress = self.handler.compress
+
+        def slow_compress(*paths):
+            time.sleep(0.2)
+            compress(*paths)
+        self.handler.compress = slow_compress
+        queue_handler = DroppingQueueHandler(queue.Queue(10))
+        queue_handler.listener = QueueListener(
+            queue_handler.queue, self.handler)
+        queue_handler.listener.start()
+        for index in range(2):
+            queue_handler.handle(
+                logging.makeLogRecord({'msg': f'{index}' * 150}))
+        stop_pipeline(queue_handler, [self.handler])
+        self.assertEqual(len(self.handler.archives()), 1)
+        self.assertEqual(
+            [name for name in os.listdir(self.directory)
+             if not name.endswith('.gz')], ['server.log'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import urllib.request
+
+from my_messenger.server.metrics import Histogram, Registry, \
+    start_metrics_server, timed
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 5.65)
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_same_metric_returned(self):
+        counter = self.registry.counter('requests_total', 'Запросы.')
+        counter.inc()
+        self.assertIs(self.registry.counter('requests_total', 'Запросы.'),
+                      counter)
+        family = self.registry.gauge('depth', 'Очередь.', ('user',))
+        self.assertIs(family.labels('alice'), family.labels('alice'))
+
+    def test_render(self):
+        self.registry.counter('sent_total', 'Отправлено.').inc(3)
+        self.registry.gauge('sessions', 'Сессии.', func=lambda: 2)
+        latency = self.registry.histogram(
+            'latency_seconds', 'Задержка.', ('action',), buckets=(0.5,))
+        latency.labels('message').observe(0.25)
+        text = self.registry.render()
+        self.assertIn('# TYPE sent_total counter\nsent_total 3\n', text)
+        self.assertIn('sessions 2\n', text)
+        self.assertIn(
+            'latency_seconds_bucket{action="message",le="0.5"} 1\n'
+            'latency_seconds_bucket{action="message",le="+Inf"} 1\n'
+            'latency_seconds_sum{action="message"} 0.25\n'
+            'latency_seconds_count{action="message"} 1\n', text)
+
+    def test_timed(self):
+        family = self.registry.histogram('db_seconds', 'База.', ('query',))
+
+        @timed(family)
+        def get_hash(name):
+            return name.upper()
+
+        self.assertEqual(get_hash('alice'), 'ALICE')
+        self.assertEqual(get_hash.__name__, 'get_hash')
+        self.assertEqual(family.labels('get_hash').count, 1)
+
+    def test_http_export(self):
+        self.registry.counter('sent_total', 'Отправлено.').inc()
+        server = start_metrics_server('127.0.0.1', 0, self.registry)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertIn('text/plain',
+                              response.headers['Content-Type'])
+                self.assertIn('sent_total 1', response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
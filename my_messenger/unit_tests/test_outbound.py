@@ -0,0 +1,81 @@
+import unittest
+
+from my_messenger.server.outbound import OutboundBuffer, DROP, SPILL, \
+    DISCONNECT
+
+
+class SlowSocket:
+    """Сокет-заглушка, принимающий не больше capacity байт за раз."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.received = bytearray()
+
+    def send(self, data):
+        if not self.capacity:
+            raise BlockingIOError
+        chunk = bytes(data[:self.capacity])
+        self.capacity -= len(chunk)
+        self.received += chunk
+        return len(chunk)
+
+
+class OutboundBufferTestCase(unittest.TestCase):
+
+    def test_partial_send_keeps_order(self):
+        buffer = OutboundBuffer(100, 10)
+        sock = SlowSocket(5)
+        buffer.push(b'abcdef')
+        buffer.push(b'ghij')
+        self.assertEqual(buffer.send_to(sock), 5)
+        self.assertEqual(len(buffer), 5)
+        sock.capacity = 100
+        buffer.send_to(sock)
+        self.assertEqual(bytes(sock.received), b'abcdefghij')
+        self.assertEqual(len(buffer), 0)
+
+    def test_single_large_frame_accepted(self):
+        buffer = OutboundBuffer(10, 5, DISCONNECT)
+        self.assertTrue(buffer.push(b'x' * 50))
+        self.assertFalse(buffer.overloaded)
+
+    def test_disconnect_policy(self):
+        buffer = OutboundBuffer(10, 5, DISCONNECT)
+        self.assertTrue(buffer.push(b'x' * 8))
+        self.assertFalse(buffer.push(b'y' * 8))
+
+    def test_drop_policy_with_hysteresis(self):
+        buffer = OutboundBuffer(10, 4, DROP)
+        buffer.push(b'a' * 8)
+        buffer.push(b'b' * 8)
+        self.assertTrue(buffer.overloaded)
+        self.assertEqual(buffer.dropped, 1)
+        sock = SlowSocket(2)
+        buffer.send_to(sock)
+        # 6 байт в очереди - выше нижней границы, всё ещё отбрасываем
+        buffer.push(b'c')
+        self.assertEqual(buffer.dropped, 2)
+        sock.capacity = 4
+        buffer.send_to(sock)
+        self.assertFalse(buffer.overloaded)
+        buffer.push(b'd')
+        sock.capacity = 100
+        buffer.send_to(sock)
+        self.assertEqual(bytes(sock.received), b'a' * 8 + b'd')
+
+    def test_spill_policy(self):
+        buffer = OutboundBuffer(10, 4, SPILL)
+        for frame in (b'1' * 8, b'2' * 8, b'3' * 8, b'4' * 3):
+            self.assertTrue(buffer.push(frame))
+        self.assertEqual(buffer.spilled, 3)
+        self.assertEqual(len(buffer), 27)
+        sock = SlowSocket(1000)
+        while buffer:
+            buffer.send_to(sock)
+        self.assertEqual(
+            bytes(sock.received), b'1' * 8 + b'2' * 8 + b'3' * 8 + b'4' * 3)
+        self.assertIsNone(buffer.spill_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from my_messenger.server import profiler
+from my_messenger.server.profiler import StackSampler
+
+
+def wait_for_event(event):
+    event.wait(5)
+
+
+class StackSamplerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.event = threading.Event()
+        self.thread = threading.Thread(
+            target=wait_for_event, args=(self.event,), name='waiter')
+        self.thread.start()
+
+    def tearDown(self):
+        self.event.set()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_collapsed_output(self):
+        sampler = StackSampler(100, 5, ('waiter',), self.directory)
+        for _ in range(3):
+            sampler.sample()
+        self.assertEqual(len(sampler.stacks), 1)
+        stack, count = sampler.stacks.most_common(1)[0]
+        self.assertEqual(count, 3)
+        self.assertTrue(stack.startswith('waiter;_bootstrap '))
+        self.assertIn(';wait_for_event (test_profiler.py:', stack)
+
+        sampler.started = 'test'
+        path = sampler.write()
+        with open(path, encoding='utf-8') as collapsed:
+            self.assertEqual(collapsed.read(), f'{stack} 3\n')
+        self.assertEqual(os.path.dirname(path), self.directory)
+
+    def test_stop(self):
+        sampler = StackSampler(100, 60, ('waiter',), self.directory)
+        sampler.start()
+        sampler.stop()
+        sampler.join(5)
+        self.assertFalse(sampler.is_alive())
+        self.assertTrue(os.path.exists(sampler.path))
+
+
+@unittest.skipUnless(hasattr(signal, 'SIGUSR2'), 'нет SIGUSR2')
+class SignalHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = signal.getsignal(signal.SIGUSR2)
+
+    def tearDown(self):
+        signal.signal(signal.SIGUSR2, self.previous)
+
+    def test_signal_under_lock_does_not_deadlock(self):
+        started = threading.Event()
+
+        def start_profiling():
+            with profiler._active_lock:
+                started.set()
+        with mock.patch.object(profiler, 'start_profiling', start_profiling):
+            profiler.install_signal_handler('SIGUSR2')
+            # Сигнал приходит, пока главный поток держит блокировку
+            # профилировщика: обработчик не должен её ждать
+            with profiler._active_lock:
+                os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(started.wait(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
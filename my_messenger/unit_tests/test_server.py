@@ -8,13 +8,13 @@ class ServerTestCase(unittest.TestCase):
     CONFIGS = get_configs()
 
     test_error_message = {
-        CONFIGS.get('RESPONSE'): 400,
-        CONFIGS.get('ERROR'): 'Bad request'
+        CONFIGS.RESPONSE: 400,
+        CONFIGS.ERROR: 'Bad request'
     }
 
     test_correct_message = {
-        CONFIGS.get('RESPONSE'): 200,
-        CONFIGS.get('ALERT'): 'Привет, клиент!'
+        CONFIGS.RESPONSE: 200,
+        CONFIGS.ALERT: 'Привет, клиент!'
     }
 
     def test_check_not_full_message(self):
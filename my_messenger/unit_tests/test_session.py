@@ -0,0 +1,51 @@
+import socket
+import unittest
+
+from my_messenger.common.decorators import login_required
+from my_messenger.common.utils import get_configs
+from my_messenger.server.session import Session
+
+CONFIGS = get_configs()
+
+
+class Handler:
+    @login_required
+    def process_client_message(self, message, session, CONFIGS):
+        return True
+
+
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+        self.session = Session(self.sock, ('127.0.0.1', 7777), None)
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+
+    def test_name_before_and_after_auth(self):
+        self.assertEqual(self.session.name, "('127.0.0.1', 7777)")
+        self.session.username = 'test'
+        self.assertTrue(self.session.authorized)
+        self.assertEqual(self.session.name, 'test')
+
+    def test_login_required_allows_presence(self):
+        message = {CONFIGS['ACTION']: CONFIGS['PRESENCE']}
+        self.assertTrue(Handler().process_client_message(
+            message, self.session, CONFIGS))
+
+    def test_login_required_rejects_unauthorized(self):
+        message = {CONFIGS['ACTION']: CONFIGS['GET_CONTACTS']}
+        self.assertRaises(TypeError, Handler().process_client_message,
+                          message, self.session, CONFIGS)
+
+    def test_login_required_allows_authorized(self):
+        self.session.username = 'test'
+        message = {CONFIGS['ACTION']: CONFIGS['GET_CONTACTS']}
+        self.assertTrue(Handler().process_client_message(
+            message, self.session, CONFIGS))
+
+
+if __name__ == '__main__':
+    unittest.main()
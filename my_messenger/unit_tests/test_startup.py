@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# Каталог, из которого импортируется пакет my_messenger
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# Модули, которые не должен загружать запуск без GUI
+FORBIDDEN = ('PyQt5', 'asyncio', 'http', 'multiprocessing', 'tracemalloc')
+
+# Бюджет времени импорта точки входа, секунды
+IMPORT_BUDGET = 1.5
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+
+class HeadlessStartupTestCase(unittest.TestCase):
+
+    def test_import_time(self):
+        result = run_python('-X', 'importtime', '-c',
+                            'import my_messenger.server.cli')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        modules = []
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            modules.append(name.strip())
+            # Модули верхнего уровня отступа не имеют
+            if not name[1:].startswith(' '):
+                total += int(cumulative)
+        for module in modules:
+            self.assertNotIn(module.split('.')[0], FORBIDDEN)
+        # Профилировщик загружается только по запросу
+        self.assertNotIn('my_messenger.server.profiler', modules)
+        self.assertLess(total / 1e6, IMPORT_BUDGET)
+
+    def test_module_entry_point(self):
+        result = run_python('-m', 'my_messenger.server', '--help')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('--no-gui', result.stdout)
+
+    def test_common_does_not_import_server(self):
+        # Клиент импортирует common: серверные модули ему не нужны
+        result = run_python('-c', (
+            'import sys, my_messenger.common.decorators; '
+            'print(*[name for name in sys.modules '
+            'if name.startswith("my_messenger.server")])'))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
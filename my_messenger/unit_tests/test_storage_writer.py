@@ -0,0 +1,110 @@
+import time
+import unittest
+
+from my_messenger.server.database import StorageWriter
+
+
+class FakeSession:
+    """Сессия-заглушка: записывает применённые операции и коммиты."""
+
+    def __init__(self):
+        self.pending = []
+        self.committed = []
+        self.commits = 0
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = []
+
+
+def record(session, value):
+    session.pending.append(value)
+
+
+def fail(session, value):
+    raise ValueError(value)
+
+
+class StorageWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.writer = StorageWriter(self.session, 100, 0.05)
+
+    def tearDown(self):
+        self.writer.stop()
+
+    def test_batch_committed_once(self):
+        for i in range(10):
+            self.writer.submit(record, i)
+        self.writer.start()
+        self.assertTrue(self.writer.flush(5))
+        self.assertEqual(self.session.committed, list(range(10)))
+        self.assertEqual(self.session.commits, 1)
+
+    def test_batch_size_limit(self):
+        self.writer.batch_size = 4
+        for i in range(10):
+            self.writer.submit(record, i)
+        self.writer.start()
+        self.writer.flush(5)
+        self.assertEqual(self.session.committed, list(range(10)))
+        self.assertEqual(self.session.commits, 3)
+
+    def test_failed_operation_does_not_lose_batch(self):
+        self.writer.submit(record, 1)
+        self.writer.submit(fail, 2)
+        self.writer.submit(record, 3)
+        self.writer.start()
+        self.writer.flush(5)
+        self.assertEqual(self.session.committed, [1, 3])
+
+    def test_deferred_runs_once_at_batch_end(self):
+        self.writer.submit(record, 1)
+        self.writer.defer('key', record, 'deferred')
+        self.writer.submit(record, 2)
+        self.writer.defer('key', record, 'deferred')
+        self.writer.start()
+        self.writer.flush(5)
+        self.assertEqual(self.session.committed, [1, 2, 'deferred'])
+
+    def test_after_write_called_after_commit(self):
+        commits = []
+        self.writer.start()
+        self.writer.submit(record, 1)
+        self.writer.after_write(
+            lambda: commits.append(list(self.session.committed)))
+        self.writer.flush(5)
+        self.assertEqual(commits, [[1]])
+
+    def test_periodic_on_idle_queue(self):
+        self.writer.every(0.05, record, 'tick')
+        self.writer.start()
+        deadline = time.monotonic() + 5
+        while self.session.committed.count('tick') < 2 and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(self.session.committed.count('tick'), 2)
+
+    def test_periodic_joins_batch(self):
+        self.writer.every(0.01, record, 'tick')
+        time.sleep(0.02)
+        self.writer.submit(record, 1)
+        self.writer.start()
+        self.writer.flush(5)
+        self.assertEqual(self.session.committed[:2], [1, 'tick'])
+
+    def test_stop_writes_queue(self):
+        self.writer.start()
+        self.writer.submit(record, 1)
+        self.writer.stop()
+        self.assertFalse(self.writer.is_alive())
+        self.assertEqual(self.session.committed, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from my_messenger.server.timers import TimerWheel
+
+
+class FakeClock:
+    """Часы-заглушка, время переводится вручную."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TimerWheelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(0.1, 8, self.clock)
+        self.fired = []
+
+    def run_until(self, moment):
+        self.clock.now = moment
+        self.wheel.advance()
+
+    def test_fires_after_delay(self):
+        self.wheel.call_later(0.3, self.fired.append, 'a')
+        self.run_until(1000.2)
+        self.assertEqual(self.fired, [])
+        self.run_until(1000.31)
+        self.assertEqual(self.fired, ['a'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_delay_longer_than_wheel(self):
+        # 8 ячеек по 0.1 с - таймер на 2 с проходит колесо дважды
+        self.wheel.call_later(2, self.fired.append, 'late')
+        self.wheel.call_later(0.4, self.fired.append, 'early')
+        self.run_until(1001.0)
+        self.assertEqual(self.fired, ['early'])
+        self.run_until(1002.05)
+        self.assertEqual(self.fired, ['early', 'late'])
+
+    def test_cancelled_timer_is_dropped(self):
+        timer = self.wheel.call_later(0.1, self.fired.append, 'x')
+        timer.cancel()
+        self.run_until(1001)
+        self.assertEqual(self.fired, [])
+        self.assertEqual(len(self.wheel), 0)
+        self.assertIsNone(self.wheel.next_timeout())
+
+    def test_rescheduled_from_callback(self):
+        def again(count):
+            self.fired.append(count)
+            if count < 3:
+                self.wheel.call_later(0.8, again, count + 1)
+
+        self.wheel.call_later(0.8, again, 1)
+        for step in range(1, 40):
+            self.run_until(1000 + step * 0.1)
+        self.assertEqual(self.fired, [1, 2, 3])
+
+    def test_next_timeout_is_next_tick(self):
+        self.wheel.call_later(5, self.fired.append, 'x')
+        self.assertAlmostEqual(self.wheel.next_timeout(), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
-import json
+import os
+import pickle
+import tempfile
 import unittest
 from socket import socket, AF_INET, SOCK_STREAM
-from my_messenger.common.utils import get_configs, send_message, get_message
+from my_messenger.common.framing import encode_message
+from my_messenger.common.utils import get_configs, send_message, \
+    get_message, load_configs, Config, CONFIGS_PATH
 
 
 class TestSocket:
@@ -12,15 +16,16 @@ class TestSocket:
         self.encoded_message = None
         self.received_message = None
 
-    def send(self, message_to_send):
-        json_test_message = json.dumps(self.test_message)
-        self.encoded_message = json_test_message.encode(
-            self.CONFIGS.get('ENCODING'))
+    def sendall(self, message_to_send):
+        self.encoded_message = encode_message(
+            self.test_message, self.CONFIGS.ENCODING)
         self.received_message = message_to_send
 
-    def recv(self, max_len):
-        json_test_message = json.dumps(self.test_message)
-        return json_test_message.encode(self.CONFIGS.get('ENCODING'))
+    def recv_into(self, buffer):
+        encoded_message = encode_message(
+            self.test_message, self.CONFIGS.ENCODING)
+        buffer[:len(encoded_message)] = encoded_message
+        return len(encoded_message)
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -72,5 +77,64 @@ class UtilsTestCase(unittest.TestCase):
                          {'response': '200', 'alert': 'test'})
 
 
+class ConfigTestCase(unittest.TestCase):
+
+    def test_cached_and_frozen(self):
+        configs = get_configs()
+        self.assertIs(get_configs(), configs)
+        self.assertEqual(configs.ACTION, configs['ACTION'])
+        self.assertEqual(configs.get('ACTION'), 'action')
+        self.assertIsNone(configs.get('NO_SUCH_KEY'))
+        with self.assertRaises(TypeError):
+            configs.ACTION = 'other'
+        with self.assertRaises(TypeError):
+            configs['ACTION'] = 'other'
+        with self.assertRaises(TypeError):
+            configs.USER_RATE_LIMITS['default'] = None
+
+    def test_overrides(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ini_path = os.path.join(directory, 'server.ini')
+            with open(ini_path, 'w', encoding='utf-8') as ini:
+                ini.write('[CONFIGS]\nDEFAULT_PORT = 8000\n'
+                          'PING_INTERVAL = 10\nUNKNOWN = 1\n')
+            configs = load_configs(CONFIGS_PATH, ini_path, {
+                'MESSENGER_DEFAULT_PORT': '9000',
+                'MESSENGER_SLOW_CONSUMER_POLICY': 'drop',
+                'MESSENGER_UNKNOWN': '1'})
+        self.assertEqual(configs.DEFAULT_PORT, 9000)
+        self.assertEqual(configs.PING_INTERVAL, 10)
+        self.assertEqual(configs.SLOW_CONSUMER_POLICY, 'drop')
+        self.assertNotIn('UNKNOWN', configs)
+
+    def test_override_keeps_type(self):
+        configs = load_configs(CONFIGS_PATH, os.devnull, {
+            'MESSENGER_ACTION': '123',
+            'MESSENGER_TIMER_TICK': '1',
+            'MESSENGER_LOG_DECORATORS': 'no',
+            'MESSENGER_PROFILE_DIR': '/tmp'})
+        self.assertEqual(configs.ACTION, '123')
+        self.assertEqual(configs.TIMER_TICK, 1.0)
+        self.assertIsInstance(configs.TIMER_TICK, float)
+        self.assertIs(configs.LOG_DECORATORS, False)
+        self.assertEqual(configs.PROFILE_DIR, '/tmp')
+        with self.assertRaises(ValueError):
+            load_configs(CONFIGS_PATH, os.devnull,
+                         {'MESSENGER_DEFAULT_PORT': 'port'})
+        with self.assertRaises(ValueError):
+            load_configs(CONFIGS_PATH, os.devnull,
+                         {'MESSENGER_PROFILE_THREADS': '"MainThread"'})
+
+    def test_pickle(self):
+        configs = get_configs()
+        restored = pickle.loads(pickle.dumps(configs))
+        self.assertIsInstance(restored, Config)
+        self.assertEqual(restored, configs)
+        self.assertEqual(dict(restored.USER_RATE_LIMITS),
+                         dict(configs.USER_RATE_LIMITS))
+        with self.assertRaises(TypeError):
+            restored.USER_RATE_LIMITS['default'] = None
+
+
 if __name__ == '__main__':
     unittest.main()
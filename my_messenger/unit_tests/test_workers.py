@@ -0,0 +1,248 @@
+import selectors
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from my_messenger.common.utils import Config, get_configs
+from my_messenger.server import workers
+from my_messenger.server.workers import SharedDirectory, WorkerRouter
+
+CONFIGS = get_configs()
+
+
+def colliding_names(slots, count):
+    """Имена, первая проба которых попадает в один и тот же слот."""
+    names = []
+    index = 0
+    while len(names) < count:
+        name = f'user{index}'
+        if SharedDirectory._key(name) % slots == 0:
+            names.append(name)
+        index += 1
+    return names
+
+
+class SharedDirectoryTestCase(unittest.TestCase):
+
+    def make(self, slots):
+        directory = SharedDirectory.create(threading.Lock(), slots)
+        self.addCleanup(directory.unlink)
+        self.addCleanup(directory.close)
+        return directory
+
+    def test_set_get_remove(self):
+        directory = self.make(16)
+        self.assertIsNone(directory.get('alice'))
+        directory.set('alice', 3)
+        directory.set('bob', 1)
+        directory.set('alice', 2)
+        self.assertEqual(directory.get('alice'), 2)
+        self.assertEqual(directory.get('bob'), 1)
+        directory.remove('alice')
+        self.assertIsNone(directory.get('alice'))
+        self.assertEqual(directory.get('bob'), 1)
+
+    def test_attach(self):
+        directory = self.make(16)
+        directory.set('alice', 1)
+        other = SharedDirectory.attach(
+            directory.name, directory.lock, directory.slots)
+        self.addCleanup(other.close)
+        self.assertEqual(other.get('alice'), 1)
+        other.set('bob', 2)
+        self.assertEqual(directory.get('bob'), 2)
+
+    def test_collisions(self):
+        directory = self.make(8)
+        first, second, third = colliding_names(8, 3)
+        for worker, name in enumerate((first, second, third)):
+            directory.set(name, worker)
+        self.assertEqual(
+            [directory.get(name) for name in (first, second, third)],
+            [0, 1, 2])
+        # Удалённый слот не обрывает цепочку проб для следующих ключей
+        directory.remove(second)
+        self.assertIsNone(directory.get(second))
+        self.assertEqual(directory.get(third), 2)
+        # Повторная запись занимает удалённый слот, а не дублирует ключ
+        directory.set(third, 5)
+        directory.set(second, 4)
+        directory.remove(third)
+        self.assertIsNone(directory.get(third))
+        self.assertEqual(directory.get(second), 4)
+        self.assertEqual(directory.get(first), 0)
+
+    def test_full(self):
+        directory = self.make(2)
+        directory.set('alice', 0)
+        directory.set('bob', 1)
+        with self.assertRaises(MemoryError):
+            directory.set('carol', 0)
+        directory.remove('alice')
+        directory.set('carol', 0)
+        self.assertEqual(directory.get('carol'), 0)
+
+    def occupied(self, directory):
+        return sum(directory._slot_key(index) != SharedDirectory.EMPTY
+                   for index in range(directory.slots))
+
+    def test_tombstones_reclaimed(self):
+        directory = self.make(8)
+        # Входы и выходы не засоряют таблицу удалёнными слотами
+        for index in range(1000):
+            directory.set(f'user{index}', 1)
+            directory.remove(f'user{index}')
+        self.assertEqual(self.occupied(directory), 0)
+        first, second, third = colliding_names(8, 3)
+        for name in (first, second, third):
+            directory.set(name, 1)
+        directory.remove(second)
+        # Удалённый слот в середине цепочки остаётся до её конца
+        self.assertEqual(self.occupied(directory), 3)
+        self.assertEqual(directory.get(third), 1)
+        directory.remove(third)
+        self.assertEqual(self.occupied(directory), 1)
+        self.assertEqual(directory.get(first), 1)
+        # Полная таблица со сменой пользователей не переполняется
+        directory.remove(first)
+        self.assertEqual(self.occupied(directory), 0)
+        names = [f'user{index}' for index in range(8)]
+        for name in names:
+            directory.set(name, 1)
+        for index in range(8, 1000):
+            directory.remove(names[index % 8])
+            names[index % 8] = f'user{index}'
+            directory.set(names[index % 8], 2)
+        self.assertEqual([directory.get(name) for name in names], [2] * 8)
+
+
+class FakeProcessor:
+    """Цикл событий воркера: только селектор и принятые сообщения."""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.messages = []
+        self.group_messages = []
+
+    def process_message(self, message):
+        self.messages.append(message)
+
+    def deliver_group(self, message):
+        self.group_messages.append(message)
+
+    def run_once(self):
+        for key, mask in self.selector.select(0):
+            key.data(key.fileobj, mask)
+
+
+class WorkerRouterTestCase(unittest.TestCase):
+    """Два воркера в одном процессе, циклами управляет тест."""
+
+    def setUp(self):
+        patcher = mock.patch.object(workers, 'CONFIGS', Config({
+            **get_configs(),
+            'OUTBOUND_HIGH_WATERMARK': 65536,
+            'OUTBOUND_LOW_WATERMARK': 16384}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        run_dir = tempfile.mkdtemp(prefix='messenger-test-')
+        self.addCleanup(shutil.rmtree, run_dir)
+        self.directory = SharedDirectory.create(threading.Lock(), 64)
+        self.addCleanup(self.directory.unlink)
+        self.addCleanup(self.directory.close)
+        self.routers = []
+        self.processors = []
+        for worker in range(2):
+            router = WorkerRouter(worker, run_dir, self.directory, 2)
+            processor = FakeProcessor()
+            router.attach(processor)
+            self.routers.append(router)
+            self.processors.append(processor)
+        self.routers[1].register('bob')
+
+    def tearDown(self):
+        for router, processor in zip(self.routers, self.processors):
+            processor.selector.close()
+            router.close()
+
+    def run_until(self, condition, iterations=1000):
+        for _ in range(iterations):
+            if condition():
+                return True
+            for processor in self.processors:
+                processor.run_once()
+        return condition()
+
+    def message(self, text='Привет'):
+        return {CONFIGS.ACTION: CONFIGS.MESSAGE,
+                CONFIGS.FROM_USER: 'alice',
+                CONFIGS.TO_USER: 'bob',
+                CONFIGS.MESSAGE_TEXT: text}
+
+    def test_forward(self):
+        self.assertTrue(self.routers[0].forward(self.message()))
+        self.assertTrue(self.run_until(lambda: self.processors[1].messages))
+        self.assertEqual(self.processors[1].messages, [self.message()])
+        # Свои пользователи и неизвестные не пересылаются
+        self.assertFalse(self.routers[1].forward(self.message()))
+        self.assertFalse(self.routers[0].forward(
+            {**self.message(), CONFIGS.TO_USER: 'nobody'}))
+
+    def test_broadcast(self):
+        message = {CONFIGS.ACTION: CONFIGS.GROUP_MESSAGE,
+                   CONFIGS.FROM_USER: 'alice'}
+        self.routers[0].broadcast(message)
+        self.assertTrue(self.run_until(
+            lambda: self.processors[1].group_messages))
+        self.assertEqual(self.processors[1].group_messages, [message])
+        self.assertEqual(self.processors[0].group_messages, [])
+
+    def test_busy_worker_does_not_block(self):
+        # Воркер 1 занят и не читает канал: отправка не блокируется,
+        # кадры копятся в буфере канала и сбрасываются на диск.
+        texts = [f'{index:04}' + 'x' * 8192 for index in range(100)]
+        for text in texts:
+            self.assertTrue(self.routers[0].forward(self.message(text)))
+        buffer = self.routers[0].out_buffers[1]
+        self.assertTrue(buffer)
+        self.assertTrue(buffer.spilled)
+        link = self.routers[0].links[1]
+        self.assertTrue(self.processors[0].selector.get_key(link).events
+                        & selectors.EVENT_WRITE)
+        # Когда воркер освобождается, всё доставляется по порядку
+        self.assertTrue(self.run_until(
+            lambda: len(self.processors[1].messages) == len(texts)))
+        self.assertEqual(
+            [message[CONFIGS.MESSAGE_TEXT]
+             for message in self.processors[1].messages], texts)
+        self.assertFalse(buffer)
+        self.assertEqual(self.processors[0].selector.get_key(link).events,
+                         selectors.EVENT_READ)
+
+    def test_register_into_full_directory(self):
+        directory = SharedDirectory.create(threading.Lock(), 2)
+        self.addCleanup(directory.unlink)
+        self.addCleanup(directory.close)
+        router = WorkerRouter(0, '', directory)
+        self.assertTrue(router.register('alice'))
+        self.assertTrue(router.register('bob'))
+        self.assertFalse(router.register('carol'))
+        self.assertIsNone(router.locate('carol'))
+
+    def test_closed_link(self):
+        self.assertTrue(self.routers[0].forward(self.message()))
+        self.assertTrue(self.run_until(lambda: self.processors[1].messages))
+        # Воркер 1 завершился: канал к нему закрывается, повторное
+        # соединение не удаётся
+        self.processors[1].selector.close()
+        self.routers[1].close()
+        self.processors[1] = FakeProcessor()
+        self.assertTrue(self.run_until(lambda: not self.routers[0].links))
+        self.assertEqual(self.routers[0].out_buffers, {})
+        self.assertFalse(self.routers[0].forward(self.message()))
+
+
+if __name__ == '__main__':
+    unittest.main()